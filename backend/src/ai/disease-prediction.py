@@ -5,18 +5,121 @@ AI model for predicting fish diseases based on water quality and fish behavior
 
 import numpy as np
 import pandas as pd
-from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
-from sklearn.model_selection import train_test_split, cross_val_score
+from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier, HistGradientBoostingClassifier
+from sklearn.model_selection import train_test_split, cross_val_score, ParameterGrid, StratifiedKFold
 from sklearn.preprocessing import StandardScaler, LabelEncoder
 from sklearn.metrics import classification_report, confusion_matrix, accuracy_score
 import joblib
 import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import sys
+import tempfile
+import time
+import threading
+import tracemalloc
 from datetime import datetime, timedelta
-from typing import Dict, List, Tuple, Optional
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Tuple, Optional, Union, Iterable
 import logging
 
+from model_artifacts import ModelArtifact, benchmark_model_loading
+from prediction_cache import CacheKeyBuilder, MemoryCacheBackend, PredictionCache
+from training_data import (
+    ChunkedTrainingSource, SharedTrainingMatrix, StratifiedSample, fit_and_score_on_shared_matrix
+)
+from tree_ensemble import TreeEnsemble, benchmark_against_sklearn
+
 logger = logging.getLogger(__name__)
 
+# Hyperparameter grids searched by DiseasePredictionModel.tune_model
+DEFAULT_PARAM_GRIDS = {
+    'gradient_boosting': {'learning_rate': [0.05, 0.1], 'max_depth': [3, 6]},
+    'hist_gradient_boosting': {'learning_rate': [0.05, 0.1], 'max_leaf_nodes': [15, 31]}
+}
+
+# Risk score above which DiseaseScreeningPipeline forwards a reading to the
+# model (same 0.5 level that triggers risk recommendations)
+SCREENING_THRESHOLDS = {
+    'bacterial_risk': 0.5, 'fungal_risk': 0.5, 'parasitic_risk': 0.5,
+    'viral_risk': 0.5, 'overall_stress': 0.5
+}
+
+# Sensor precision used to quantize cache keys
+CACHE_KEY_PRECISION = {
+    'temperature': 0.1, 'ph': 0.01, 'dissolved_oxygen': 0.01, 'turbidity': 0.01,
+    'ammonia': 0.001, 'nitrite': 0.001, 'nitrate': 0.1, 'salinity': 0.01,
+    'conductivity': 1.0, 'fish_weight': 0.1, 'stocking_density': 0.01,
+    'feeding_rate': 0.01, 'stress_level': 0.01, 'swimming_behavior': 0.01,
+    'feeding_behavior': 0.01, 'mortality_rate': 0.001, 'growth_rate': 0.01
+}
+
+def compute_derived_features(X: np.ndarray, index: Dict[str, int]) -> np.ndarray:
+    """
+    Fill the derived stress and risk columns of a feature matrix in place
+    
+    Pandas-free twin of DiseasePredictionModel.prepare_features: the raw
+    columns of X must already be populated, `index` maps column names to
+    positions. Operations run in the same order as the DataFrame path so
+    float64 results are bit-identical.
+    """
+    temperature = X[:, index['temperature']]
+    ph = X[:, index['ph']]
+    dissolved_oxygen = X[:, index['dissolved_oxygen']]
+    turbidity = X[:, index['turbidity']]
+    ammonia = X[:, index['ammonia']]
+    nitrite = X[:, index['nitrite']]
+    stocking_density = X[:, index['stocking_density']]
+    
+    # Stress features
+    temperature_stress = X[:, index['temperature_stress']]
+    temperature_stress[:] = np.abs(temperature - 25) / 5
+    ph_stress = X[:, index['ph_stress']]
+    ph_stress[:] = np.abs(ph - 7.0) / 0.5
+    oxygen_stress = X[:, index['oxygen_stress']]
+    oxygen_stress[:] = np.maximum(0, 8.0 - dissolved_oxygen) / 3.0
+    ammonia_stress = X[:, index['ammonia_stress']]
+    ammonia_stress[:] = np.maximum(0, ammonia - 0.3) / 0.7
+    nitrite_stress = X[:, index['nitrite_stress']]
+    nitrite_stress[:] = np.maximum(0, nitrite - 0.1) / 0.2
+    
+    overall_stress = X[:, index['overall_stress']]
+    overall_stress[:] = (
+        temperature_stress + ph_stress + oxygen_stress + ammonia_stress + nitrite_stress
+    ) / 5
+    
+    # Bacterial risk
+    risk = X[:, index['bacterial_risk']]
+    risk[:] = 0
+    risk += np.where(ammonia > 0.5, 0.3, 0)
+    risk += np.where(dissolved_oxygen < 6.0, 0.3, 0)
+    risk += np.where(turbidity > 5.0, 0.2, 0)
+    risk += overall_stress * 0.2
+    
+    # Fungal risk
+    risk = X[:, index['fungal_risk']]
+    risk[:] = 0
+    risk += np.where(temperature < 20, 0.4, 0)
+    risk += np.where(turbidity > 3.0, 0.3, 0)
+    risk += overall_stress * 0.3
+    
+    # Parasitic risk
+    risk = X[:, index['parasitic_risk']]
+    risk[:] = 0
+    risk += np.where(stocking_density > 10, 0.3, 0)
+    risk += np.where(turbidity > 4.0, 0.2, 0)
+    risk += overall_stress * 0.5
+    
+    # Viral risk
+    risk = X[:, index['viral_risk']]
+    risk[:] = 0
+    risk += temperature_stress * 0.4
+    risk += np.where(ammonia > 0.3, 0.3, 0)
+    risk += np.where(nitrite > 0.05, 0.3, 0)
+    risk += overall_stress * 0.3
+    
+    return X
+
 class DiseasePredictionModel:
     """
     AI model for predicting fish diseases
@@ -33,6 +136,11 @@ class DiseasePredictionModel:
             'water_change_frequency', 'stress_level', 'swimming_behavior',
             'feeding_behavior', 'mortality_rate', 'growth_rate'
         ]
+        self.derived_feature_columns = [
+            'temperature_stress', 'ph_stress', 'oxygen_stress',
+            'ammonia_stress', 'nitrite_stress', 'overall_stress',
+            'bacterial_risk', 'fungal_risk', 'parasitic_risk', 'viral_risk'
+        ]
         
         # Disease categories and their symptoms
         self.disease_categories = {
@@ -67,12 +175,137 @@ class DiseasePredictionModel:
             'nitrite': {'max': 0.1, 'critical': 0.3},
             'nitrate': {'max': 50, 'critical': 100}
         }
+        
+        # Optional result cache (see enable_prediction_cache)
+        self.prediction_cache = None
+        
+        # Compiled inference engine (see compile_inference); batches up to
+        # compiled_max_rows use it, larger ones are faster in sklearn
+        self._compiled = None
+        self.compiled_max_rows = 32
+        
+        # NumPy fast path state (see _compile_feature_layout)
+        self._buffers = threading.local()
+        self._compile_feature_layout()
+    
+    def _compile_feature_layout(self):
+        """
+        Precompute the column-index map used by the pandas-free fast path
+        """
+        self._feature_index = {
+            name: i for i, name in enumerate(self.model_feature_columns)
+        }
+        self._raw_feature_slots = [
+            (name, self._feature_index[name]) for name in self.feature_columns
+        ]
+        self._risk_slots = [
+            (category, self._feature_index[f'{category}_risk'])
+            for category in ('bacterial', 'fungal', 'parasitic', 'viral')
+        ]
+    
+    def enable_prediction_cache(self, backend=None) -> PredictionCache:
+        """
+        Memoize predict_disease results with keys quantized to sensor precision
+        """
+        self.prediction_cache = PredictionCache(
+            'disease_prediction',
+            CacheKeyBuilder(CACHE_KEY_PRECISION),
+            backend or MemoryCacheBackend(max_entries=10000, ttl=300)
+        )
+        return self.prediction_cache
+    
+    def compile_inference(self) -> TreeEnsemble:
+        """
+        Export the model to a flattened tree engine with the scaler folded in
+        
+        Predictions then skip the scaling pass and sklearn's per-call
+        overhead; outputs are unchanged.
+        """
+        self._compiled = TreeEnsemble.from_sklearn(self.model).fold_scaler(self.scaler)
+        return self._compiled
+    
+    def build_feature_matrix(self, data: pd.DataFrame, dtype=np.float32,
+                             out: Optional[np.ndarray] = None,
+                             block_rows: int = 65_536) -> np.ndarray:
+        """
+        Model features for a frame of readings as one preallocated block
+        
+        Columns follow model_feature_columns. Raw columns are copied
+        straight from data and the derived columns are computed in place
+        (compute_derived_features), block_rows rows at a time so temporaries
+        stay small. Nothing else is copied, unlike prepare_features followed
+        by a column selection. With dtype=np.float64 the values are
+        identical to prepare_features.
+        """
+        n_rows = len(data)
+        shape = (n_rows, len(self.model_feature_columns))
+        if out is None:
+            out = np.empty(shape, dtype=dtype)
+        elif out.shape != shape:
+            raise ValueError(f"Output buffer has shape {out.shape}, expected {shape}")
+        
+        for name, slot in self._raw_feature_slots:
+            out[:, slot] = data[name].to_numpy()
+        
+        for start in range(0, n_rows, block_rows):
+            compute_derived_features(out[start:start + block_rows], self._feature_index)
+        
+        return out
+    
+    def _scale_in_place(self, X: np.ndarray) -> np.ndarray:
+        """
+        Same in-place operations as StandardScaler.transform
+        """
+        if self.scaler.with_mean:
+            X -= self.scaler.mean_
+        if self.scaler.with_std:
+            X /= self.scaler.scale_
+        return X
+    
+    def _feature_buffer(self) -> np.ndarray:
+        """
+        Per-thread preallocated (1, n_features) float64 feature vector
+        """
+        n_features = len(self._feature_index)
+        buffer = getattr(self._buffers, 'features', None)
+        if buffer is None or buffer.shape[1] != n_features:
+            buffer = np.empty((1, n_features), dtype=np.float64)
+            self._buffers.features = buffer
+        return buffer
+    
+    @property
+    def model_feature_columns(self) -> List[str]:
+        """
+        Columns fed to the scaler and the model, in training order
+        """
+        return self.feature_columns + self.derived_feature_columns
+    
+    @property
+    def feature_index(self) -> Mapping[str, int]:
+        """
+        Read-only column name -> position in build_feature_matrix output
+        """
+        return MappingProxyType(self._feature_index)
+    
+    def predict_proba_matrix(self, X: np.ndarray) -> np.ndarray:
+        """
+        Class probabilities for a float64 build_feature_matrix matrix
+        
+        Batches up to compiled_max_rows use the compiled engine; larger
+        ones are scaled in place (X is overwritten) for the sklearn model.
+        """
+        if self._compiled is not None and len(X) <= self.compiled_max_rows:
+            return self._compiled.predict_proba(X)
+        return self.model.predict_proba(self._scale_in_place(X))
     
-    def prepare_features(self, data: pd.DataFrame) -> pd.DataFrame:
+    def prepare_features(self, data: pd.DataFrame, copy: bool = True) -> pd.DataFrame:
         """
         Prepare features for disease prediction
+        
+        With copy=False the derived columns are added to data in place,
+        avoiding a second copy of large training frames.
         """
-        df = data.copy()
+        df = data.copy() if copy else data
         
         # Calculate derived features
         df['temperature_stress'] = np.abs(df['temperature'] - 25) / 5
@@ -167,123 +400,454 @@ class DiseasePredictionModel:
         
         return pd.Series(risk)
     
-    def train_model(self, training_data: pd.DataFrame) -> Dict:
+    def train_model(self, training_data: pd.DataFrame, compact: bool = False) -> Dict:
         """
         Train the disease prediction model
+        
+        compact=True builds the features with build_feature_matrix (one
+        float32 block, no DataFrame copies) instead of prepare_features.
         """
         try:
             # Prepare features
+            if compact:
+                X = self.build_feature_matrix(training_data)
+                return self._fit_prepared(X, training_data['disease_category'])
+            
             df = self.prepare_features(training_data)
+            return self._fit_prepared(df[self.model_feature_columns], df['disease_category'])
             
-            # Separate features and target
-            X = df[self.feature_columns + [
-                'temperature_stress', 'ph_stress', 'oxygen_stress',
-                'ammonia_stress', 'nitrite_stress', 'overall_stress',
-                'bacterial_risk', 'fungal_risk', 'parasitic_risk', 'viral_risk'
-            ]]
-            y = df['disease_category']
+        except Exception as e:
+            logger.error(f"Error training model: {e}")
+            return {'error': str(e)}
+    
+    def train_model_from_source(self, source: ChunkedTrainingSource,
+                                samples_per_class: int = 50_000) -> Dict:
+        """
+        Train from a chunked history that need not fit in memory
+        
+        Features are computed per chunk, the scaler is fitted on every row
+        with partial_fit, and the model trains on a per-class reservoir
+        sample, so peak memory is bounded by the chunk and sample sizes.
+        """
+        try:
+            source = source.with_columns(self.feature_columns + ['disease_category'])
+            sample = StratifiedSample('disease_category', samples_per_class)
+            scaler = StandardScaler()
             
-            # Encode target labels
-            y_encoded = self.label_encoder.fit_transform(y)
+            for chunk in source:
+                X = self.build_feature_matrix(chunk)
+                scaler.partial_fit(X)
+                sample.add(pd.DataFrame(X, columns=self.model_feature_columns).assign(
+                    disease_category=chunk['disease_category'].to_numpy()
+                ))
             
-            # Split data
-            X_train, X_test, y_train, y_test = train_test_split(
-                X, y_encoded, test_size=0.2, random_state=42, stratify=y_encoded
+            training_sample = sample.frame()
+            logger.info(f"Sampled {len(training_sample)} of {sample.rows_seen} rows for training")
+            self.scaler = scaler
+            return self._fit_prepared(
+                training_sample[self.model_feature_columns].to_numpy(),
+                training_sample['disease_category'],
+                fit_scaler=False
             )
             
-            # Scale features
-            X_train_scaled = self.scaler.fit_transform(X_train)
-            X_test_scaled = self.scaler.transform(X_test)
+        except Exception as e:
+            logger.error(f"Error training model: {e}")
+            return {'error': str(e)}
+    
+    def _fit_prepared(self, X: Union[pd.DataFrame, np.ndarray], y: pd.Series,
+                      fit_scaler: bool = True) -> Dict:
+        """
+        Split, scale, fit and evaluate on the model features (columns in
+        model_feature_columns order) and disease labels
+        
+        With fit_scaler=False the already fitted scaler is reused.
+        """
+        # Encode target labels
+        y_encoded = self.label_encoder.fit_transform(y)
+        
+        # Split data
+        X_train, X_test, y_train, y_test = train_test_split(
+            X, y_encoded, test_size=0.2, random_state=42, stratify=y_encoded
+        )
+        
+        # Scale features
+        if fit_scaler:
+            self.scaler.fit(X_train)
+        X_train_scaled = self.scaler.transform(X_train)
+        X_test_scaled = self.scaler.transform(X_test)
+        
+        # Train ensemble model
+        self.model = GradientBoostingClassifier(
+            n_estimators=100,
+            learning_rate=0.1,
+            max_depth=6,
+            random_state=42
+        )
+        
+        self.model.fit(X_train_scaled, y_train)
+        self._compiled = None
+        
+        if self.prediction_cache is not None:
+            self.prediction_cache.invalidate()
+        
+        # Evaluate model
+        y_pred = self.model.predict(X_test_scaled)
+        accuracy = accuracy_score(y_test, y_pred)
+        
+        # Cross-validation
+        cv_scores = cross_val_score(
+            self.model, X_train_scaled, y_train, cv=5, scoring='accuracy'
+        )
+        
+        # Feature importance
+        feature_importance = dict(zip(
+            self.model_feature_columns, self.model.feature_importances_
+        ))
+        
+        results = {
+            'accuracy': accuracy,
+            'cv_mean': cv_scores.mean(),
+            'cv_std': cv_scores.std(),
+            'feature_importance': feature_importance,
+            'classification_report': classification_report(y_test, y_pred, output_dict=True)
+        }
+        
+        logger.info(f"Model trained - Accuracy: {accuracy:.4f}")
+        return results
+    
+    def tune_model(self, training_data: pd.DataFrame, param_grid: Optional[Dict[str, List]] = None,
+                   estimator: str = 'gradient_boosting', cv: int = 5, max_iter: int = 200,
+                   early_stopping_rounds: Optional[int] = 10,
+                   n_workers: Optional[int] = None) -> Dict:
+        """
+        Cross-validated grid search with every (configuration, fold) fit in a process pool
+        
+        The scaled training matrix is written once and memory-mapped by the
+        workers. max_iter caps the boosting iterations; with
+        early_stopping_rounds set, each fit stops once its internal
+        validation score has not improved for that many iterations.
+        estimator='hist_gradient_boosting' uses the histogram-based
+        estimator (much faster on large data; compile_inference and
+        memory-mapped artifacts support only 'gradient_boosting').
+        
+        The best configuration is refitted on the full training split and
+        becomes the model, together with the scaler and label encoder fitted
+        for the search; until then the current model keeps serving. Each
+        configuration reports the summed fit time of its folds, as measured
+        in the workers; a configuration whose fits raise is reported with
+        its error and left out of the selection. If every configuration
+        fails, the result is an error and the model is unchanged.
+        """
+        start = time.perf_counter()
+        param_grid = param_grid or DEFAULT_PARAM_GRIDS[estimator]
+        configurations = list(ParameterGrid(param_grid))
+        
+        X = self.build_feature_matrix(training_data)
+        label_encoder = LabelEncoder()
+        y_encoded = label_encoder.fit_transform(training_data['disease_category'])
+        
+        X_train, X_test, y_train, y_test = train_test_split(
+            X, y_encoded, test_size=0.2, random_state=42, stratify=y_encoded
+        )
+        scaler = StandardScaler()
+        X_train_scaled = scaler.fit_transform(X_train)
+        X_test_scaled = scaler.transform(X_test)
+        
+        folds = list(StratifiedKFold(cv, shuffle=True, random_state=42).split(X_train_scaled, y_train))
+        n_workers = n_workers or os.cpu_count() or 1
+        
+        shared = SharedTrainingMatrix({'X': X_train_scaled.astype(np.float32), 'y': y_train})
+        pool = ProcessPoolExecutor(n_workers)
+        results = []
+        try:
+            futures = [
+                [
+                    pool.submit(
+                        fit_and_score_on_shared_matrix,
+                        self._new_estimator(estimator, params, max_iter, early_stopping_rounds),
+                        shared['X'], shared['y'], train_rows, test_rows
+                    )
+                    for train_rows, test_rows in folds
+                ]
+                for params in configurations
+            ]
             
-            # Train ensemble model
-            self.model = GradientBoostingClassifier(
-                n_estimators=100,
-                learning_rate=0.1,
-                max_depth=6,
-                random_state=42
+            for params, config_futures in zip(configurations, futures):
+                try:
+                    folds_run = [future.result() for future in config_futures]
+                except Exception as e:
+                    logger.error(f"{params} - fit failed: {e}")
+                    results.append({'params': params, 'error': str(e)})
+                    continue
+                
+                scores = np.array([fold['score'] for fold in folds_run])
+                results.append({
+                    'params': params,
+                    'cv_mean': float(scores.mean()),
+                    'cv_std': float(scores.std()),
+                    'mean_iterations': float(np.mean([fold['n_iter'] for fold in folds_run])),
+                    'fit_seconds': float(sum(fold['fit_seconds'] for fold in folds_run))
+                })
+                logger.info(f"{params} - CV accuracy {scores.mean():.4f}, "
+                            f"{results[-1]['fit_seconds']:.1f}s fitting")
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            shared.close()
+        
+        scored = [result for result in results if 'error' not in result]
+        if not scored:
+            logger.error(f"Every {estimator} configuration failed: {results[0]['error']}")
+            return {'error': f"Every {estimator} configuration failed: {results[0]['error']}",
+                    'configurations': results}
+        best = max(scored, key=lambda result: result['cv_mean'])
+        
+        model = self._new_estimator(estimator, best['params'], max_iter, early_stopping_rounds)
+        model.fit(X_train_scaled, y_train)
+        self.scaler, self.label_encoder, self.model = scaler, label_encoder, model
+        self._compiled = None
+        
+        if self.prediction_cache is not None:
+            self.prediction_cache.invalidate()
+        
+        accuracy = accuracy_score(y_test, model.predict(X_test_scaled))
+        logger.info(f"Best {estimator} configuration {best['params']} - Accuracy: {accuracy:.4f}")
+        
+        return {
+            'estimator': estimator,
+            'best_params': best['params'],
+            'accuracy': accuracy,
+            'configurations': results,
+            'total_seconds': time.perf_counter() - start
+        }
+    
+    def _new_estimator(self, estimator: str, params: Dict, max_iter: int,
+                       early_stopping_rounds: Optional[int]):
+        """
+        Boosting classifier for tune_model with an iteration cap and early stopping
+        """
+        if estimator == 'gradient_boosting':
+            return GradientBoostingClassifier(
+                n_estimators=max_iter,
+                n_iter_no_change=early_stopping_rounds,
+                validation_fraction=0.1,
+                random_state=42,
+                **params
             )
+        
+        if estimator == 'hist_gradient_boosting':
+            return HistGradientBoostingClassifier(
+                max_iter=max_iter,
+                early_stopping=early_stopping_rounds is not None,
+                n_iter_no_change=early_stopping_rounds or 10,
+                validation_fraction=0.1,
+                random_state=42,
+                **params
+            )
+        
+        raise ValueError(f"Unknown estimator: {estimator}")
+    
+    def predict_disease(self, input_data: Dict) -> Dict:
+        """
+        Predict disease risk for given conditions
+        
+        Single readings take the pandas-free fast path; results are
+        bit-identical to predict_disease_batch.
+        """
+        if self.prediction_cache is None:
+            return self._predict_single(input_data)
+        
+        result = self.prediction_cache.get_or_compute(
+            input_data, lambda: self._predict_single(input_data),
+            cacheable=lambda result: 'error' not in result
+        )
+        if 'error' not in result:
+            result['timestamp'] = datetime.now().isoformat()
+        
+        return result
+    
+    def _predict_single(self, input_data: Dict) -> Dict:
+        """
+        Score one reading through the NumPy fast path
+        """
+        try:
+            X = self._feature_buffer()
             
-            self.model.fit(X_train_scaled, y_train)
-            
-            # Evaluate model
-            y_pred = self.model.predict(X_test_scaled)
-            accuracy = accuracy_score(y_test, y_pred)
+            for name, i in self._raw_feature_slots:
+                X[0, i] = input_data[name]
             
-            # Cross-validation
-            cv_scores = cross_val_score(
-                self.model, X_train_scaled, y_train, cv=5, scoring='accuracy'
-            )
+            compute_derived_features(X, self._feature_index)
             
-            # Feature importance
-            feature_importance = dict(zip(
-                X.columns, self.model.feature_importances_
-            ))
+            # Read risk levels before the buffer is scaled in place
+            risk_levels = {category: float(X[0, i]) for category, i in self._risk_slots}
+            overall_risk = float(X[0, self._feature_index['overall_stress']])
             
-            results = {
-                'accuracy': accuracy,
-                'cv_mean': cv_scores.mean(),
-                'cv_std': cv_scores.std(),
-                'feature_importance': feature_importance,
-                'classification_report': classification_report(y_test, y_pred, output_dict=True)
-            }
+            if self._compiled is not None:
+                probabilities = self._compiled.predict_proba(X)[0]
+            else:
+                probabilities = self.model.predict_proba(self._scale_in_place(X))[0]
+            prediction = self.model.classes_[np.argmax(probabilities)]
+            disease_category = self.label_encoder.inverse_transform([prediction])[0]
             
-            logger.info(f"Model trained - Accuracy: {accuracy:.4f}")
-            return results
+            return self._build_response(
+                disease_category, float(probabilities.max()),
+                risk_levels, overall_risk, input_data
+            )
             
         except Exception as e:
-            logger.error(f"Error training model: {e}")
+            logger.error(f"Prediction error: {e}")
             return {'error': str(e)}
     
-    def predict_disease(self, input_data: Dict) -> Dict:
+    def predict_disease_batch(self, records: Union[List[Dict], pd.DataFrame, np.ndarray]) -> Dict:
         """
-        Predict disease risk for given conditions
+        Predict disease risk for many readings in one vectorized pass
+        
+        Accepts a list of dicts, a DataFrame or a NumPy structured array and
+        returns per-row results in columnar form (one array per field).
         """
         try:
-            # Prepare input data
-            df = pd.DataFrame([input_data])
-            df = self.prepare_features(df)
-            
-            # Select features
-            X = df[self.feature_columns + [
-                'temperature_stress', 'ph_stress', 'oxygen_stress',
-                'ammonia_stress', 'nitrite_stress', 'overall_stress',
-                'bacterial_risk', 'fungal_risk', 'parasitic_risk', 'viral_risk'
-            ]]
+            df = self._records_to_frame(records)
+            n_rows = len(df)
             
-            # Scale features
-            X_scaled = self.scaler.transform(X)
+            if n_rows == 0:
+                return self._empty_batch_result()
             
-            # Make prediction
-            prediction = self.model.predict(X_scaled)[0]
-            probabilities = self.model.predict_proba(X_scaled)[0]
-            
-            # Get disease category
-            disease_category = self.label_encoder.inverse_transform([prediction])[0]
-            
-            # Get risk levels
-            risk_levels = {
-                'bacterial': float(df['bacterial_risk'].iloc[0]),
-                'fungal': float(df['fungal_risk'].iloc[0]),
-                'parasitic': float(df['parasitic_risk'].iloc[0]),
-                'viral': float(df['viral_risk'].iloc[0])
+            # Derived stress and risk features for all rows at once
+            X = self.build_feature_matrix(df, dtype=np.float64)
+            index = self._feature_index
+            risks = {
+                name: X[:, index[column]].copy()
+                for name, column in (
+                    ('bacterial_risk', 'bacterial_risk'), ('fungal_risk', 'fungal_risk'),
+                    ('parasitic_risk', 'parasitic_risk'), ('viral_risk', 'viral_risk'),
+                    ('overall_risk', 'overall_stress')
+                )
             }
             
-            # Generate recommendations
-            recommendations = self._generate_recommendations(input_data, risk_levels)
+            # Single scaling pass and single model call for the whole batch
+            probabilities = self.predict_proba_matrix(X)
+            predictions = self.model.classes_.take(np.argmax(probabilities, axis=1))
             
             return {
-                'disease_category': disease_category,
-                'confidence': float(max(probabilities)),
-                'risk_levels': risk_levels,
-                'overall_risk': float(df['overall_stress'].iloc[0]),
-                'recommendations': recommendations,
-                'timestamp': datetime.now().isoformat()
+                'disease_category': self.label_encoder.inverse_transform(predictions),
+                'confidence': probabilities.max(axis=1),
+                'probabilities': probabilities,
+                'classes': list(self.label_encoder.classes_),
+                **risks,
+                'n_rows': n_rows
             }
             
         except Exception as e:
-            logger.error(f"Prediction error: {e}")
+            logger.error(f"Batch prediction error: {e}")
             return {'error': str(e)}
     
+    def predict_disease_many(self, records: List[Dict]) -> List[Dict]:
+        """
+        predict_disease responses for many readings from one batch pass
+        
+        Readings with a missing or non-numeric feature get their own
+        {'error': ...} and are left out of the batch, so one bad reading
+        does not fail the rest. If the batch still fails, the valid
+        readings are scored one at a time.
+        """
+        if not records:
+            return []
+        
+        try:
+            df = pd.DataFrame.from_records(list(records))
+            values = df.reindex(columns=self.feature_columns).apply(pd.to_numeric, errors='coerce')
+            finite = np.isfinite(values.to_numpy(dtype=np.float64))
+        except Exception as e:
+            logger.error(f"Batch validation error, scoring readings one at a time: {e}")
+            return [self.predict_disease(record) for record in records]
+        
+        valid = finite.all(axis=1)
+        results = [None] * len(records)
+        
+        for i in np.flatnonzero(~valid):
+            invalid = [name for name, ok in zip(self.feature_columns, finite[i]) if not ok]
+            results[i] = {'error': f"Missing or non-numeric features: {invalid}"}
+        
+        rows = np.flatnonzero(valid)
+        if len(rows):
+            batch = self.predict_disease_batch(values.iloc[rows].reset_index(drop=True))
+            if 'error' in batch:
+                logger.error(f"Batch of {len(rows)} failed, scoring readings one at a time")
+                for i in rows:
+                    results[i] = self.predict_disease(records[i])
+            else:
+                for row, i in enumerate(rows):
+                    results[i] = self._row_result(batch, row, records[i])
+        
+        return results
+    
+    def _records_to_frame(self, records: Union[List[Dict], pd.DataFrame, np.ndarray]) -> pd.DataFrame:
+        """
+        Normalize batch input to a DataFrame
+        """
+        if isinstance(records, pd.DataFrame):
+            return records
+        
+        if isinstance(records, np.ndarray):
+            if records.dtype.names is None:
+                raise ValueError("NumPy input must be a structured array with named fields")
+            return pd.DataFrame.from_records(records)
+        
+        return pd.DataFrame.from_records(list(records))
+    
+    def _empty_batch_result(self) -> Dict:
+        """
+        Columnar result for an empty batch
+        """
+        n_classes = len(self.label_encoder.classes_) if hasattr(self.label_encoder, 'classes_') else 0
+        empty = np.empty(0, dtype=np.float64)
+        
+        return {
+            'disease_category': np.empty(0, dtype=object),
+            'confidence': empty,
+            'probabilities': np.empty((0, n_classes), dtype=np.float64),
+            'classes': list(getattr(self.label_encoder, 'classes_', [])),
+            'bacterial_risk': empty,
+            'fungal_risk': empty,
+            'parasitic_risk': empty,
+            'viral_risk': empty,
+            'overall_risk': empty,
+            'n_rows': 0
+        }
+    
+    def _row_result(self, batch: Dict, index: int, input_data: Dict) -> Dict:
+        """
+        Build the single-reading response for one row of a batch result
+        """
+        risk_levels = {
+            'bacterial': float(batch['bacterial_risk'][index]),
+            'fungal': float(batch['fungal_risk'][index]),
+            'parasitic': float(batch['parasitic_risk'][index]),
+            'viral': float(batch['viral_risk'][index])
+        }
+        
+        return self._build_response(
+            batch['disease_category'][index], float(batch['confidence'][index]),
+            risk_levels, float(batch['overall_risk'][index]), input_data
+        )
+    
+    def _build_response(self, disease_category: str, confidence: float,
+                        risk_levels: Dict[str, float], overall_risk: float,
+                        input_data: Dict) -> Dict:
+        """
+        Assemble the predict_disease response dict
+        """
+        # Generate recommendations
+        recommendations = self._generate_recommendations(input_data, risk_levels)
+        
+        return {
+            'disease_category': disease_category,
+            'confidence': confidence,
+            'risk_levels': risk_levels,
+            'overall_risk': overall_risk,
+            'recommendations': recommendations,
+            'timestamp': datetime.now().isoformat()
+        }
+    
     def _generate_recommendations(self, input_data: Dict, risk_levels: Dict) -> List[str]:
         """
         Generate recommendations based on risk levels
@@ -338,10 +902,23 @@ class DiseasePredictionModel:
         else:
             return {}
     
-    def save_model(self, filepath: str):
+    def save_model(self, filepath: str, memory_mapped: bool = False):
         """
         Save the trained model
+        
+        With memory_mapped=True, filepath is an artifact directory whose tree
+        arrays workers load with mmap_mode='r' (see model_artifacts).
         """
+        if memory_mapped:
+            ModelArtifact.write(filepath, {'model': self.model}, {'main': self.scaler}, {
+                'label_classes': self.label_encoder.classes_.tolist(),
+                'feature_columns': self.feature_columns,
+                'disease_categories': self.disease_categories,
+                'risk_thresholds': self.risk_thresholds
+            })
+            logger.info(f"Model saved to {filepath}")
+            return
+        
         model_data = {
             'model': self.model,
             'scaler': self.scaler,
@@ -356,9 +933,12 @@ class DiseasePredictionModel:
     
     def load_model(self, filepath: str):
         """
-        Load the trained model
+        Load the trained model from a joblib file or an artifact directory
         """
-        model_data = joblib.load(filepath)
+        if ModelArtifact.is_artifact(filepath):
+            model_data = self._read_artifact(filepath)
+        else:
+            model_data = joblib.load(filepath)
         
         self.model = model_data['model']
         self.scaler = model_data['scaler']
@@ -366,16 +946,157 @@ class DiseasePredictionModel:
         self.feature_columns = model_data['feature_columns']
         self.disease_categories = model_data['disease_categories']
         self.risk_thresholds = model_data['risk_thresholds']
+        self._compile_feature_layout()
+        self._compiled = None
+        
+        if self.prediction_cache is not None:
+            self.prediction_cache.invalidate()
         
         logger.info(f"Model loaded from {filepath}")
 
+    def _read_artifact(self, directory: str) -> Dict:
+        """
+        Read an artifact into the same shape as the joblib model_data dict
+        """
+        artifact = ModelArtifact(directory)
+        metadata = artifact.metadata
+        
+        label_encoder = LabelEncoder()
+        label_encoder.classes_ = np.array(metadata['label_classes'])
+        
+        return {
+            'model': artifact.ensemble('model'),
+            'scaler': artifact.scaler('main'),
+            'label_encoder': label_encoder,
+            'feature_columns': metadata['feature_columns'],
+            'disease_categories': metadata['disease_categories'],
+            'risk_thresholds': metadata['risk_thresholds']
+        }
+
+class DiseaseScreeningPipeline:
+    """
+    Two-stage disease scoring for large streams of readings
+    
+    Stage one computes the rule-based risk scores for every reading in a
+    vectorized pass. Only readings with a score above its threshold go
+    to stage two, the full model; the rest are reported as
+    screened_category with no model confidence. The stream is processed
+    chunk by chunk, so memory is bounded by chunk_size regardless of
+    stream length.
+    """
+    
+    def __init__(self, model: DiseasePredictionModel, thresholds: Optional[Dict[str, float]] = None,
+                 chunk_size: int = 100_000, screened_category: str = 'healthy'):
+        self.model = model
+        self.thresholds = SCREENING_THRESHOLDS if thresholds is None else thresholds
+        self.chunk_size = chunk_size
+        self.screened_category = screened_category
+        self.reset_stats()
+    
+    def reset_stats(self):
+        """
+        Zero the row and timing counters behind stats()
+        """
+        self.rows = 0
+        self.model_rows = 0
+        self.seconds = 0.0
+        self.model_seconds = 0.0
+    
+    def _chunks(self, readings: Union[pd.DataFrame, Iterable[pd.DataFrame]]) -> Iterable[pd.DataFrame]:
+        """
+        Split a DataFrame into chunk_size slices; other iterables pass through
+        """
+        if isinstance(readings, pd.DataFrame):
+            for start in range(0, len(readings), self.chunk_size):
+                yield readings.iloc[start:start + self.chunk_size]
+        else:
+            yield from readings
+    
+    def screen(self, readings: Union[pd.DataFrame, Iterable[pd.DataFrame]]) -> Iterable[Dict]:
+        """
+        Yield one columnar result per chunk of a DataFrame or a stream of
+        DataFrames (e.g. a ChunkedTrainingSource)
+        
+        Each result has disease_category, confidence (NaN for screened
+        rows), forwarded (True where the model ran), the risk scores and
+        n_rows.
+        """
+        model = self.model
+        index = model.feature_index
+        
+        for chunk in self._chunks(readings):
+            start = time.perf_counter()
+            X = model.build_feature_matrix(chunk, dtype=np.float64)
+            n_rows = len(X)
+            
+            # Stage one: rule-based risk scores for every reading
+            forwarded = np.zeros(n_rows, dtype=bool)
+            for column, threshold in self.thresholds.items():
+                forwarded |= X[:, index[column]] > threshold
+            
+            result = {
+                name: X[:, index[name]].copy()
+                for name in ('bacterial_risk', 'fungal_risk', 'parasitic_risk', 'viral_risk')
+            }
+            result['overall_risk'] = X[:, index['overall_stress']].copy()
+            
+            disease_category = np.full(n_rows, self.screened_category, dtype=object)
+            confidence = np.full(n_rows, np.nan)
+            
+            # Stage two: the full model for flagged readings only
+            model_start = time.perf_counter()
+            n_forwarded = int(forwarded.sum())
+            if n_forwarded:
+                probabilities = model.predict_proba_matrix(X[forwarded])
+                predictions = model.model.classes_.take(np.argmax(probabilities, axis=1))
+                
+                disease_category[forwarded] = model.label_encoder.inverse_transform(predictions)
+                confidence[forwarded] = probabilities.max(axis=1)
+            
+            end = time.perf_counter()
+            self.rows += n_rows
+            self.model_rows += n_forwarded
+            self.seconds += end - start
+            self.model_seconds += end - model_start
+            
+            result.update({
+                'disease_category': disease_category,
+                'confidence': confidence,
+                'forwarded': forwarded,
+                'n_rows': n_rows
+            })
+            yield result
+    
+    def run(self, readings: Union[pd.DataFrame, Iterable[pd.DataFrame]],
+            on_chunk=None) -> Dict[str, float]:
+        """
+        Screen a whole stream, passing each chunk result to on_chunk, and
+        return the pipeline statistics
+        """
+        for result in self.screen(readings):
+            if on_chunk is not None:
+                on_chunk(result)
+        
+        return self.stats()
+    
+    def stats(self) -> Dict[str, float]:
+        """
+        Rows screened, rows sent to the model, skip ratio and throughput
+        """
+        return {
+            'rows': self.rows,
+            'model_rows': self.model_rows,
+            'skip_ratio': 1 - self.model_rows / self.rows if self.rows else 0.0,
+            'rows_per_s': self.rows / self.seconds if self.seconds else 0.0,
+            'model_seconds_fraction': self.model_seconds / self.seconds if self.seconds else 0.0
+        }
+
 # Example usage and training
-def create_sample_training_data() -> pd.DataFrame:
+def create_sample_training_data(n_samples: int = 2000) -> pd.DataFrame:
     """
     Create sample training data for disease prediction
     """
     np.random.seed(42)
-    n_samples = 2000
     
     # Generate sample data
     data = {
@@ -452,5 +1173,255 @@ def main():
     
     return model
 
+def benchmark_batch_inference(model: DiseasePredictionModel,
+                              batch_sizes: Iterable[int] = (1, 100, 10_000, 1_000_000),
+                              repeats: int = 3) -> Dict[int, float]:
+    """
+    Measure predict_disease_batch throughput (rows per second) per batch size
+    """
+    batch_sizes = list(batch_sizes)
+    readings = create_sample_training_data(max(batch_sizes)).drop(columns=['disease_category'])
+    
+    results = {}
+    for size in batch_sizes:
+        batch = readings.iloc[:size]
+        best = float('inf')
+        
+        for _ in range(repeats):
+            start = time.perf_counter()
+            model.predict_disease_batch(batch)
+            best = min(best, time.perf_counter() - start)
+        
+        results[size] = size / best
+        logger.info(f"Batch size {size}: {results[size]:,.0f} rows/s")
+    
+    return results
+
+def reference_predict(model: DiseasePredictionModel, readings: pd.DataFrame) -> Dict:
+    """
+    Independent DataFrame reference for the fast paths
+    
+    prepare_features -> column selection -> scaler.transform -> sklearn
+    predict_proba, without build_feature_matrix, compute_derived_features
+    or the compiled engine.
+    """
+    features = model.prepare_features(readings)
+    X = model.scaler.transform(features[model.model_feature_columns])
+    probabilities = model.model.predict_proba(X)
+    predictions = model.model.classes_.take(np.argmax(probabilities, axis=1))
+    
+    return {
+        'disease_category': model.label_encoder.inverse_transform(predictions),
+        'probabilities': probabilities,
+        'confidence': probabilities.max(axis=1),
+        'bacterial_risk': features['bacterial_risk'].to_numpy(),
+        'fungal_risk': features['fungal_risk'].to_numpy(),
+        'parasitic_risk': features['parasitic_risk'].to_numpy(),
+        'viral_risk': features['viral_risk'].to_numpy(),
+        'overall_risk': features['overall_stress'].to_numpy()
+    }
+
+def check_fast_path_parity(model: DiseasePredictionModel, readings: pd.DataFrame,
+                           tolerance: float = 1e-9) -> Dict:
+    """
+    Compare the NumPy single-reading path and the batch path against
+    reference_predict row by row
+    
+    Categories must match exactly and floats within tolerance.
+    """
+    reference = reference_predict(model, readings)
+    batch = model.predict_disease_batch(readings)
+    records = readings.to_dict('records')
+    mismatches = []
+    
+    for i, record in enumerate(records):
+        expected = model._row_result(reference, i, record)
+        for path, result in (('single', model.predict_disease(record)),
+                             ('batch', model._row_result(batch, i, record))):
+            if result['disease_category'] != expected['disease_category']:
+                mismatches.append((i, path, 'disease_category'))
+            if abs(result['confidence'] - expected['confidence']) > tolerance:
+                mismatches.append((i, path, 'confidence'))
+            if abs(result['overall_risk'] - expected['overall_risk']) > tolerance:
+                mismatches.append((i, path, 'overall_risk'))
+            for category, value in result['risk_levels'].items():
+                if abs(value - expected['risk_levels'][category]) > tolerance:
+                    mismatches.append((i, path, f'{category}_risk'))
+    
+    return {'rows': len(records), 'mismatches': mismatches}
+
+def benchmark_single_reading_latency(model: DiseasePredictionModel,
+                                     n_calls: int = 2000) -> Dict[str, Dict[str, float]]:
+    """
+    Single-reading latency (ms) of the fast path versus the DataFrame
+    reference path (reference_predict on a one-row frame)
+    """
+    records = create_sample_training_data(n_calls).drop(columns=['disease_category']).to_dict('records')
+    paths = {
+        'numpy': model.predict_disease,
+        'dataframe': lambda record: model._row_result(
+            reference_predict(model, pd.DataFrame([record])), 0, record
+        )
+    }
+    
+    results = {}
+    for path, predict in paths.items():
+        latencies = np.empty(len(records))
+        for i, record in enumerate(records):
+            start = time.perf_counter()
+            predict(record)
+            latencies[i] = (time.perf_counter() - start) * 1000
+        
+        results[path] = {
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p99_ms': float(np.percentile(latencies, 99))
+        }
+        logger.info(f"{path} path - p50: {results[path]['p50_ms']:.3f} ms, "
+                    f"p99: {results[path]['p99_ms']:.3f} ms")
+    
+    return results
+
+def benchmark_artifact_loading(model: DiseasePredictionModel, directory: str) -> Dict[str, Dict]:
+    """
+    Worker load time and RSS for the joblib pickle versus the mmap artifact
+    """
+    pickle_path = os.path.join(directory, 'disease_prediction_model.pkl')
+    artifact_path = os.path.join(directory, 'disease_prediction_model')
+    model.save_model(pickle_path)
+    model.save_model(artifact_path, memory_mapped=True)
+    
+    reading = create_sample_training_data(1).drop(columns=['disease_category']).iloc[0].to_dict()
+    
+    def load(path):
+        loaded = DiseasePredictionModel()
+        loaded.load_model(path)
+        return loaded
+    
+    return benchmark_model_loading(
+        {'joblib': lambda: load(pickle_path), 'artifact': lambda: load(artifact_path)},
+        warmup=lambda loaded: loaded.predict_disease(reading)
+    )
+
+def benchmark_feature_preparation(model: DiseasePredictionModel,
+                                  n_rows: int = 1_000_000) -> Dict[str, Dict[str, float]]:
+    """
+    Peak traced memory and time of prepare_features plus column selection
+    versus build_feature_matrix (float32 and float64)
+    """
+    readings = create_sample_training_data(n_rows).drop(columns=['disease_category'])
+    paths = {
+        'prepare_features': lambda: model.prepare_features(readings)[model.model_feature_columns].to_numpy(),
+        'matrix_float32': lambda: model.build_feature_matrix(readings),
+        'matrix_float64': lambda: model.build_feature_matrix(readings, dtype=np.float64)
+    }
+    
+    results = {}
+    for path, build in paths.items():
+        tracemalloc.start()
+        start = time.perf_counter()
+        features = build()
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        
+        results[path] = {
+            'seconds': seconds,
+            'peak_mb': peak / 2 ** 20,
+            'result_mb': features.nbytes / 2 ** 20
+        }
+        del features
+        logger.info(f"{path} - {seconds:.2f}s, peak {peak / 2 ** 20:.1f} MB")
+    
+    return results
+
+def benchmark_model_tuning(n_samples: int = 5000) -> Dict[str, Dict]:
+    """
+    Serial cross_val_score training versus tune_model with both estimators
+    """
+    data = create_sample_training_data(n_samples)
+    results = {}
+    
+    start = time.perf_counter()
+    serial = DiseasePredictionModel().train_model(data, compact=True)
+    results['train_model_serial_cv'] = {
+        'seconds': time.perf_counter() - start, 'accuracy': serial.get('accuracy')
+    }
+    
+    for estimator in DEFAULT_PARAM_GRIDS:
+        tuned = DiseasePredictionModel().tune_model(data, estimator=estimator)
+        if 'error' in tuned:
+            results[estimator] = {'error': tuned['error']}
+            continue
+        results[estimator] = {
+            'seconds': tuned['total_seconds'],
+            'accuracy': tuned['accuracy'],
+            'best_params': tuned['best_params'],
+            'configurations': [
+                {key: config[key] for key in ('params', 'cv_mean', 'mean_iterations', 'fit_seconds', 'error')
+                 if key in config}
+                for config in tuned['configurations']
+            ]
+        }
+    
+    return results
+
+def benchmark_screening(model: DiseasePredictionModel, n_rows: int = 500_000,
+                        chunk_size: int = 50_000) -> Dict[str, Dict[str, float]]:
+    """
+    Throughput of the screening pipeline versus scoring every reading with the model
+    """
+    readings = create_sample_training_data(n_rows).drop(columns=['disease_category'])
+    
+    start = time.perf_counter()
+    for chunk_start in range(0, n_rows, chunk_size):
+        model.predict_disease_batch(readings.iloc[chunk_start:chunk_start + chunk_size])
+    full_seconds = time.perf_counter() - start
+    
+    pipeline = DiseaseScreeningPipeline(model, chunk_size=chunk_size)
+    screening = pipeline.run(readings)
+    
+    results = {
+        'model_every_row': {'rows_per_s': n_rows / full_seconds},
+        'screening': screening
+    }
+    logger.info(f"Screening skipped {screening['skip_ratio']:.1%} of rows - "
+                f"{screening['rows_per_s']:.0f} rows/s vs {n_rows / full_seconds:.0f} rows/s")
+    
+    return results
+
+def run_benchmarks():
+    """
+    Train a sample model and report inference benchmarks
+    """
+    model = DiseasePredictionModel()
+    model.train_model(create_sample_training_data())
+    
+    throughput = benchmark_batch_inference(model)
+    print("Batch inference throughput (rows/s):", throughput)
+    
+    parity = check_fast_path_parity(
+        model, create_sample_training_data(500).drop(columns=['disease_category'])
+    )
+    print("Fast path parity mismatches:", len(parity['mismatches']))
+    
+    latency = benchmark_single_reading_latency(model)
+    print("Single-reading latency:", latency)
+    
+    with tempfile.TemporaryDirectory() as directory:
+        print("Artifact loading:", benchmark_artifact_loading(model, directory))
+    
+    readings = create_sample_training_data(10_000).drop(columns=['disease_category'])
+    features = model.prepare_features(readings)[model.model_feature_columns]
+    print("Compiled engine vs sklearn:", benchmark_against_sklearn(model.model, model.scaler, features))
+    
+    print("Feature preparation:", benchmark_feature_preparation(model))
+    print("Screening pipeline:", benchmark_screening(model))
+    print("Model tuning:", benchmark_model_tuning())
+    
+    return model
+
 if __name__ == "__main__":
-    model = main()
+    if len(sys.argv) > 1 and sys.argv[1] == 'benchmark':
+        model = run_benchmarks()
+    else:
+        model = main()
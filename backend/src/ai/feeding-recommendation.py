@@ -11,20 +11,235 @@ from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_squared_error, r2_score
 import joblib
 import json
+import sys
+import threading
+import time
+from collections import deque
 from datetime import datetime, timedelta
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional, Union
 import logging
 
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow table input is optional
+    pa = None
+
+from feeding_scheduler import FeedingScheduler
+from model_artifacts import ModelArtifact
+from prediction_cache import CacheKeyBuilder, MemoryCacheBackend, PredictionCache
+from species_table import SpeciesCoefficientTable
+from training_data import ChunkedTrainingSource, ReservoirSample
+from tree_ensemble import TreeEnsemble
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Sensor precision used to quantize cache keys (nested fields match by leaf name)
+CACHE_KEY_PRECISION = {
+    'fish_weight_avg': 0.1, 'temperature': 0.1, 'ph': 0.01,
+    'dissolved_oxygen': 0.01, 'turbidity': 0.01, 'ammonia': 0.001,
+    'nitrite': 0.001, 'nitrate': 0.1, 'last_feeding_hours': 0.1
+}
+
+# Columnar input of recommend_feeding_batch and the value used when a column
+# is missing (same defaults as the scalar rule path)
+BATCH_INPUT_DEFAULTS = {
+    'fish_weight_avg': 100, 'fish_count': 1000, 'fish_species': 'tilapia',
+    'temperature': 25, 'dissolved_oxygen': 8.0, 'ph': 7.0, 'ammonia': 0.3,
+    'age_days': 90, 'feeding_frequency': 2, 'last_feeding_hours': 12
+}
+
+# Nested pond_data location of each batch column
+BATCH_INPUT_SOURCES = {
+    'fish_weight_avg': (), 'fish_count': (), 'fish_species': (),
+    'temperature': ('water_quality',), 'dissolved_oxygen': ('water_quality',),
+    'ph': ('water_quality',), 'ammonia': ('water_quality',),
+    'age_days': ('fish_data',), 'feeding_frequency': ('fish_data',),
+    'last_feeding_hours': ('fish_data',)
+}
+
+# Nested pond_data location (group, name) of each model feature; top-level
+# fields have no group. Columnar input uses the name as the column.
+MODEL_FEATURE_SOURCES = {
+    'water_temperature': ('water_quality', 'temperature'),
+    'ph': ('water_quality', 'ph'),
+    'dissolved_oxygen': ('water_quality', 'dissolved_oxygen'),
+    'turbidity': ('water_quality', 'turbidity'),
+    'ammonia': ('water_quality', 'ammonia'),
+    'nitrite': ('water_quality', 'nitrite'),
+    'nitrate': ('water_quality', 'nitrate'),
+    'fish_age_days': ('fish_data', 'age_days'),
+    'feeding_frequency': ('fish_data', 'feeding_frequency'),
+    'last_feeding_hours': ('fish_data', 'last_feeding_hours')
+}
+
+# Model predictions are clamped to this factor range of the rule engine's
+# amount per feeding
+HYBRID_CLAMP = (0.5, 1.5)
+
+# The model target, optimal_feeding_rate, is the amount per feeding as a
+# percentage of the pond's base ration (biomass times the species base
+# rate, the rule engine's base_rate); 100 means no adjustment
+RATE_PERCENT = 100.0
+
+# Value used for a model feature missing from the input
+FEATURE_DEFAULTS = {
+    'fish_weight_avg': 100,  # grams
+    'fish_count': 1000,
+    'water_temperature': 25,
+    'ph': 7.0,
+    'dissolved_oxygen': 8.0,
+    'turbidity': 2.0,
+    'ammonia': 0.3,
+    'nitrite': 0.1,
+    'nitrate': 5.0,
+    'pond_volume': 10000,  # liters
+    'fish_age_days': 90,
+    'feeding_frequency': 2,  # times per day
+    'last_feeding_hours': 12,
+    'season': 2,  # summer
+    'time_of_day': 8,  # morning
+    'weather_condition': 1  # sunny
+}
+
+class FeedingFeatureAssembler:
+    """
+    Build model feature matrices with the column order and defaults fixed up front
+    
+    assemble() writes N inputs into one preallocated (N, n_features)
+    matrix, starting from the defaults row and overwriting each column
+    the input provides.
+    """
+    
+    def __init__(self, feature_columns: List[str], defaults: Optional[Dict[str, float]] = None):
+        defaults = FEATURE_DEFAULTS if defaults is None else defaults
+        self.feature_columns = list(feature_columns)
+        self.defaults = np.array([defaults.get(col, 0) for col in self.feature_columns], dtype=np.float64)
+    
+    def assemble(self, data: Union[Dict, List[Dict], pd.DataFrame, 'pa.Table'],
+                 out: Optional[np.ndarray] = None, dtype=np.float64) -> np.ndarray:
+        """
+        Feature matrix for a single dict, a list of dicts, a dict of
+        columns, a DataFrame or a pyarrow Table
+        
+        A dict is read as columns when its feature columns hold arrays;
+        those must all be arrays of the same length. Other keys are ignored.
+        Pass out (shape (N, n_features)) to reuse a buffer across calls.
+        """
+        columns, n_rows = self._columns(data)
+        
+        if out is None:
+            out = np.empty((n_rows, len(self.feature_columns)), dtype=dtype)
+        elif out.shape != (n_rows, len(self.feature_columns)):
+            raise ValueError(f"Output buffer has shape {out.shape}, "
+                             f"expected {(n_rows, len(self.feature_columns))}")
+        
+        out[:] = self.defaults
+        for j, col in enumerate(self.feature_columns):
+            values = columns(col)
+            if values is not None:
+                out[:, j] = values
+        
+        return out
+    
+    def _columns(self, data) -> Tuple:
+        """
+        Column accessor (name -> values or None) and row count for the input
+        """
+        if isinstance(data, pd.DataFrame):
+            return (lambda col: data[col].to_numpy() if col in data.columns else None), len(data)
+        
+        if pa is not None and isinstance(data, pa.Table):
+            names = set(data.column_names)
+            return (lambda col: data.column(col).to_numpy() if col in names else None), data.num_rows
+        
+        if isinstance(data, dict):
+            present = [col for col in self.feature_columns if col in data]
+            arrays = [col for col in present
+                      if isinstance(data[col], (list, tuple, np.ndarray, pd.Series))]
+            if not arrays:
+                return (lambda col: data.get(col)), 1
+            
+            if len(arrays) != len(present):
+                scalars = [col for col in present if col not in arrays]
+                raise ValueError(f"Columnar input has scalar feature columns: {scalars}")
+            lengths = {col: len(data[col]) for col in present}
+            if len(set(lengths.values())) > 1:
+                raise ValueError(f"Feature columns have different lengths: {lengths}")
+            return (lambda col: np.asarray(data[col]) if col in data else None), lengths[present[0]]
+        
+        records = data if isinstance(data, list) else list(data)
+        
+        def column(col):
+            if not any(col in record for record in records):
+                return None
+            default = self.defaults[self.feature_columns.index(col)]
+            return np.fromiter((record.get(col, default) for record in records),
+                               dtype=np.float64, count=len(records))
+        
+        return column, len(records)
+
+class FeedingPathMetrics:
+    """
+    Rows served and per-batch latency of each hybrid recommendation path
+    
+    'model' rows use the (possibly clamped) model prediction, 'rules'
+    rows fall back to the rule engine. Seconds are the time spent in that
+    path's stage of a batch; the rule stage runs for every batch because
+    it also provides the clamp.
+    """
+    
+    PATHS = ('model', 'rules')
+    
+    def __init__(self, max_samples: int = 10000):
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self.reset()
+    
+    def reset(self):
+        with self._lock:
+            self._paths = {
+                path: {'batches': 0, 'rows': 0, 'seconds': 0.0,
+                       'latencies': deque(maxlen=self.max_samples)}
+                for path in self.PATHS
+            }
+            self.clamped_rows = 0
+    
+    def record(self, path: str, rows: int, seconds: float, clamped_rows: int = 0):
+        with self._lock:
+            self.clamped_rows += clamped_rows
+            stats = self._paths[path]
+            stats['batches'] += 1
+            stats['rows'] += rows
+            stats['seconds'] += seconds
+            stats['latencies'].append(seconds)
+    
+    def snapshot(self) -> Dict:
+        with self._lock:
+            total_rows = sum(stats['rows'] for stats in self._paths.values())
+            snapshot = {}
+            
+            for path, stats in self._paths.items():
+                latencies = np.array(stats['latencies']) * 1000
+                snapshot[path] = {
+                    'rows': stats['rows'],
+                    'batches': stats['batches'],
+                    'traffic_fraction': stats['rows'] / total_rows if total_rows else 0.0,
+                    'rows_per_s': stats['rows'] / stats['seconds'] if stats['seconds'] else None,
+                    'p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else None,
+                    'p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else None
+                }
+            snapshot['model']['clamped_rows'] = self.clamped_rows
+        
+        return snapshot
+
 class FeedingRecommendationSystem:
     """
     AI system for smart feeding recommendations
     """
     
-    def __init__(self):
+    def __init__(self, species_file: Optional[str] = None):
         self.model = None
         self.scaler = StandardScaler()
         self.feature_columns = [
@@ -65,51 +280,100 @@ class FeedingRecommendationSystem:
                 'ph_range': (6.5, 8.0)
             }
         }
+        
+        # Optional result cache (see enable_prediction_cache)
+        self.prediction_cache = None
+        
+        # Compiled inference engine (see compile_inference); batches up to
+        # compiled_max_rows use it, larger ones are faster in sklearn
+        self._compiled = None
+        self.compiled_max_rows = 2000
+        
+        self.feature_assembler = FeedingFeatureAssembler(self.feature_columns)
+        self.path_metrics = FeedingPathMetrics()
+        
+        # Custom species (added to, or overriding, the built-in ones)
+        if species_file is not None:
+            self.load_species_file(species_file)
+    
+    @property
+    def species_coefficients(self) -> Dict[str, Dict]:
+        """
+        Species coefficients as a nested dict (a copy of species_table)
+        
+        Assign a new dict to change them; mutating the returned dict has
+        no effect.
+        """
+        return self.species_table.to_dict()
+    
+    @species_coefficients.setter
+    def species_coefficients(self, coefficients: Dict[str, Dict]):
+        self.species_table = SpeciesCoefficientTable.from_dict(coefficients)
+        if getattr(self, 'prediction_cache', None) is not None:
+            self.prediction_cache.invalidate()
+    
+    def load_species_file(self, filepath: str) -> SpeciesCoefficientTable:
+        """
+        Add species from a JSON or CSV file (see SpeciesCoefficientTable.from_file)
+        """
+        self.species_table = self.species_table.with_species(
+            SpeciesCoefficientTable.from_file(filepath, default=None)
+        )
+        if self.prediction_cache is not None:
+            self.prediction_cache.invalidate()
+        
+        return self.species_table
+    
+    def enable_prediction_cache(self, backend=None) -> PredictionCache:
+        """
+        Memoize recommend_feeding results with keys quantized to sensor precision
+        """
+        self.prediction_cache = PredictionCache(
+            'feeding_recommendation',
+            CacheKeyBuilder(CACHE_KEY_PRECISION),
+            backend or MemoryCacheBackend(max_entries=10000, ttl=300)
+        )
+        return self.prediction_cache
+    
+    def compile_inference(self) -> TreeEnsemble:
+        """
+        Export the feeding model to a flattened tree engine with the scaler folded in
+        """
+        self._compiled = TreeEnsemble.from_sklearn(self.model).fold_scaler(self.scaler)
+        return self._compiled
     
     def prepare_features(self, data: Dict) -> np.ndarray:
         """
         Prepare features for feeding recommendation
         """
-        features = []
+        return self.feature_assembler.assemble(data)
+    
+    def predict_feeding_rate_batch(self, data: Union[List[Dict], pd.DataFrame, 'pa.Table']) -> np.ndarray:
+        """
+        Model-predicted optimal feeding rate (percent of the base ration,
+        see RATE_PERCENT) for each input row
         
-        for col in self.feature_columns:
-            if col in data:
-                features.append(data[col])
-            else:
-                # Default values for missing features
-                defaults = {
-                    'fish_weight_avg': 100,  # grams
-                    'fish_count': 1000,
-                    'water_temperature': 25,
-                    'ph': 7.0,
-                    'dissolved_oxygen': 8.0,
-                    'turbidity': 2.0,
-                    'ammonia': 0.3,
-                    'nitrite': 0.1,
-                    'nitrate': 5.0,
-                    'pond_volume': 10000,  # liters
-                    'fish_age_days': 90,
-                    'feeding_frequency': 2,  # times per day
-                    'last_feeding_hours': 12,
-                    'season': 2,  # summer
-                    'time_of_day': 8,  # morning
-                    'weather_condition': 1  # sunny
-                }
-                features.append(defaults.get(col, 0))
+        Accepts anything FeedingFeatureAssembler does; missing features
+        take their defaults.
+        """
+        if self.model is None:
+            raise ValueError("Feeding model is not trained")
         
-        return np.array(features).reshape(1, -1)
+        X = self.feature_assembler.assemble(data)
+        
+        if self._compiled is not None and len(X) <= self.compiled_max_rows:
+            return self._compiled.predict(X)
+        
+        return self.model.predict(self.scaler.transform(X))
     
     def calculate_base_feeding_rate(self, fish_weight: float, fish_count: int, 
                                   species: str = 'tilapia') -> float:
         """
         Calculate base feeding rate based on fish weight and species
         """
-        if species not in self.species_coefficients:
-            species = 'tilapia'  # Default to tilapia
-        
-        coeffs = self.species_coefficients[species]
+        coeffs = self.species_table.lookup(species)  # Unknown species use tilapia
         total_weight = fish_weight * fish_count
-        base_rate = total_weight * coeffs['base_rate']
+        base_rate = total_weight * coeffs.base_rate
         
         return base_rate
     
@@ -118,17 +382,14 @@ class FeedingRecommendationSystem:
         """
         Adjust feeding rate based on water quality parameters
         """
-        if species not in self.species_coefficients:
-            species = 'tilapia'
-        
-        coeffs = self.species_coefficients[species]
+        coeffs = self.species_table.lookup(species)
         adjusted_rate = base_rate
         
         # Temperature adjustment
         temp = water_quality.get('temperature', 25)
-        temp_optimal = coeffs['temp_optimal']
-        temp_min = coeffs['temp_min']
-        temp_max = coeffs['temp_max']
+        temp_optimal = coeffs.temp_optimal
+        temp_min = coeffs.temp_min
+        temp_max = coeffs.temp_max
         
         if temp < temp_min or temp > temp_max:
             # Reduce feeding in extreme temperatures
@@ -139,13 +400,13 @@ class FeedingRecommendationSystem:
         
         # Dissolved oxygen adjustment
         do = water_quality.get('dissolved_oxygen', 8.0)
-        if do < coeffs['oxygen_min']:
+        if do < coeffs.oxygen_min:
             # Reduce feeding when oxygen is low
             adjusted_rate *= 0.6
         
         # pH adjustment
         ph = water_quality.get('ph', 7.0)
-        ph_min, ph_max = coeffs['ph_range']
+        ph_min, ph_max = coeffs.ph_min, coeffs.ph_max
         if ph < ph_min or ph > ph_max:
             # Reduce feeding when pH is outside optimal range
             adjusted_rate *= 0.7
@@ -195,6 +456,21 @@ class FeedingRecommendationSystem:
         """
         Generate comprehensive feeding recommendation
         """
+        if self.prediction_cache is None:
+            return self._recommend_feeding(pond_data)
+        
+        recommendation = self.prediction_cache.get_or_compute(
+            pond_data, lambda: self._recommend_feeding(pond_data),
+            cacheable=lambda result: 'error' not in result
+        )
+        recommendation['timestamp'] = datetime.now().isoformat()
+        
+        return recommendation
+    
+    def _recommend_feeding(self, pond_data: Dict) -> Dict:
+        """
+        Run the rule engine for one pond
+        """
         try:
             # Extract data
             fish_weight = pond_data.get('fish_weight_avg', 100)
@@ -256,6 +532,230 @@ class FeedingRecommendationSystem:
                 'timestamp': datetime.now().isoformat()
             }
     
+    def recommend_feeding_batch(self, ponds: Union[List[Dict], Dict[str, np.ndarray], pd.DataFrame]) -> Dict:
+        """
+        Feeding recommendations for many ponds at once
+        
+        Accepts a list of pond_data dicts (as for recommend_feeding) or
+        columnar data (DataFrame or dict of arrays) with the flat column
+        names in BATCH_INPUT_DEFAULTS. The rule chain is applied as NumPy
+        masks and multipliers, in the same order as the scalar path.
+        
+        Returns unrounded arrays; recommend_feeding rounds the same values
+        for display. Ponds with fish_count 0 give inf/nan here where the
+        scalar path returns an error.
+        """
+        return self._recommend_columns(self._ponds_to_columns(ponds))
+    
+    def _recommend_columns(self, columns: Dict[str, np.ndarray]) -> Dict:
+        """
+        Rule engine over normalized columns (see _ponds_to_columns)
+        """
+        n_ponds = len(columns['fish_count'])
+        coeffs = self.species_table.gather(self.species_table.encode(columns['fish_species']))
+        
+        fish_weight = columns['fish_weight_avg']
+        fish_count = columns['fish_count']
+        temp = columns['temperature']
+        fish_age = columns['age_days']
+        
+        # Base feeding rate
+        base_rate = fish_weight * fish_count * coeffs['base_rate']
+        
+        # Water quality adjustments
+        water_rate = base_rate.copy()
+        extreme_temp = (temp < coeffs['temp_min']) | (temp > coeffs['temp_max'])
+        water_rate[extreme_temp] *= 0.5
+        water_rate[~extreme_temp & (np.abs(temp - coeffs['temp_optimal']) > 5)] *= 0.8
+        water_rate[columns['dissolved_oxygen'] < coeffs['oxygen_min']] *= 0.6
+        water_rate[(columns['ph'] < coeffs['ph_min']) | (columns['ph'] > coeffs['ph_max'])] *= 0.7
+        water_rate[columns['ammonia'] > 0.5] *= 0.5
+        water_rate = np.maximum(water_rate, 0.1)
+        
+        # Fish condition adjustments
+        final_rate = water_rate.copy()
+        final_rate[fish_age < 30] *= 1.2
+        final_rate[fish_age > 365] *= 0.9
+        feeding_freq = columns['feeding_frequency']
+        final_rate[feeding_freq > 3] *= 0.8
+        final_rate[feeding_freq < 2] *= 1.1
+        last_feeding = columns['last_feeding_hours']
+        final_rate[last_feeding > 24] *= 1.3
+        final_rate[last_feeding < 6] *= 0.7
+        
+        # Feeding frequency
+        frequency = np.select([fish_age < 30, fish_age < 90], [4, 3], default=2)
+        frequency = np.where(temp < 20, np.maximum(1, frequency - 1), frequency)
+        frequency = np.where(temp > 30, np.minimum(4, frequency + 1), frequency)
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return {
+                'total_daily_amount': final_rate * frequency,
+                'amount_per_fish': final_rate / fish_count,
+                'feeding_frequency': frequency,
+                'amount_per_feeding': final_rate,
+                'base_rate': base_rate,
+                'adjustment_factors': {
+                    'water_quality_impact': water_rate / base_rate,
+                    'fish_condition_impact': final_rate / water_rate,
+                    'overall_adjustment': final_rate / base_rate
+                },
+                'n_ponds': n_ponds
+            }
+    
+    def recommend_feeding_many(self, ponds: List[Dict]) -> List[Dict]:
+        """
+        recommend_feeding responses for many ponds from one batch pass
+        
+        Ponds the batch cannot handle (e.g. fish_count 0) go through the
+        scalar path, which reports the error.
+        """
+        batch = self.recommend_feeding_batch(ponds)
+        factors = batch['adjustment_factors']
+        timestamp = datetime.now().isoformat()
+        recommendations = []
+        
+        for i, pond in enumerate(ponds):
+            if not np.isfinite(batch['amount_per_fish'][i]) or not np.isfinite(factors['overall_adjustment'][i]):
+                recommendations.append(self._recommend_feeding(pond))
+                continue
+            
+            final_rate = float(batch['amount_per_feeding'][i])
+            recommendations.append({
+                'total_daily_amount': round(float(batch['total_daily_amount'][i]), 2),
+                'amount_per_fish': round(float(batch['amount_per_fish'][i]), 4),
+                'feeding_frequency': int(batch['feeding_frequency'][i]),
+                'amount_per_feeding': round(final_rate, 2),
+                'base_rate': round(float(batch['base_rate'][i]), 2),
+                'adjustment_factors': {
+                    name: round(float(values[i]), 2) for name, values in factors.items()
+                },
+                'recommendations': self.generate_feeding_advice(
+                    pond.get('water_quality', {}), pond.get('fish_data', {}), final_rate
+                ),
+                'timestamp': timestamp
+            })
+        
+        return recommendations
+    
+    def recommend_feeding_hybrid(self, ponds: Union[List[Dict], Dict[str, np.ndarray], pd.DataFrame],
+                                 clamp: Tuple[float, float] = HYBRID_CLAMP) -> Dict:
+        """
+        Batch recommendations from the trained model, checked by the rule engine
+        
+        The rule engine runs first (recommend_feeding_batch). When a model
+        is loaded, all ponds then go through it in one call; the predicted
+        rate (percent of the base ration) is converted to an amount per
+        feeding with the pond's base_rate and clamped to clamp times the
+        rule amount. Ponds fall back to the rule amount when there is no
+        model, the model fails or its output is not finite. 'source'
+        records which path served each pond; per-path metrics accumulate
+        in path_metrics.
+        """
+        start = time.perf_counter()
+        columns = self._ponds_to_columns(ponds)
+        batch = self._recommend_columns(columns)
+        rule_rate = batch['amount_per_feeding']
+        rule_seconds = time.perf_counter() - start
+        
+        n_ponds = batch['n_ponds']
+        final_rate = rule_rate
+        model_rate = np.full(n_ponds, np.nan)
+        source = np.full(n_ponds, 'rules', dtype=object)
+        
+        if self.model is not None and n_ponds:
+            start = time.perf_counter()
+            try:
+                model_rate = (self.predict_feeding_rate_batch(self._pond_model_features(ponds))
+                              / RATE_PERCENT * batch['base_rate'])
+            except Exception as e:
+                logger.error(f"Feeding model failed, using rule engine: {e}")
+            else:
+                use_model = np.isfinite(model_rate)
+                final_rate = np.where(
+                    use_model, np.clip(model_rate, rule_rate * clamp[0], rule_rate * clamp[1]), rule_rate
+                )
+                clamped = use_model & (final_rate != model_rate)
+                source[use_model] = 'model'
+                source[clamped] = 'model_clamped'
+                
+                self.path_metrics.record('model', int(use_model.sum()), time.perf_counter() - start,
+                                         clamped_rows=int(clamped.sum()))
+        
+        self.path_metrics.record('rules', int((source == 'rules').sum()), rule_seconds)
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            batch.update({
+                'total_daily_amount': final_rate * batch['feeding_frequency'],
+                'amount_per_fish': final_rate / columns['fish_count'],
+                'amount_per_feeding': final_rate,
+                'rule_amount_per_feeding': rule_rate,
+                'model_amount_per_feeding': model_rate,
+                'source': source
+            })
+            batch['adjustment_factors']['overall_adjustment'] = final_rate / batch['base_rate']
+        
+        return batch
+    
+    def _pond_model_features(self, ponds: Union[List[Dict], Dict[str, np.ndarray], pd.DataFrame]) -> Dict[str, np.ndarray]:
+        """
+        Model feature columns from pond_data dicts or flat columnar input
+        """
+        columns = {}
+        
+        if isinstance(ponds, (pd.DataFrame, dict)):
+            for feature in self.feature_columns:
+                name = MODEL_FEATURE_SOURCES.get(feature, (None, feature))[1]
+                if name in ponds:
+                    columns[feature] = np.asarray(ponds[name], dtype=np.float64)
+                elif feature in ponds:
+                    columns[feature] = np.asarray(ponds[feature], dtype=np.float64)
+            return columns
+        
+        for j, feature in enumerate(self.feature_columns):
+            group, name = MODEL_FEATURE_SOURCES.get(feature, (None, feature))
+            default = self.feature_assembler.defaults[j]
+            if group is None:
+                values = [pond.get(name, default) for pond in ponds]
+            else:
+                values = [pond.get(group, {}).get(name, default) for pond in ponds]
+            columns[feature] = np.asarray(values, dtype=np.float64)
+        
+        return columns
+    
+    def _ponds_to_columns(self, ponds: Union[List[Dict], Dict[str, np.ndarray], pd.DataFrame]) -> Dict[str, np.ndarray]:
+        """
+        Normalize batch input to one array per column in BATCH_INPUT_DEFAULTS
+        """
+        if isinstance(ponds, (pd.DataFrame, dict)):
+            n_ponds = len(ponds) if isinstance(ponds, pd.DataFrame) else len(next(iter(ponds.values()), []))
+            raw = {
+                name: ponds[name] if name in ponds else np.full(n_ponds, default, dtype=object)
+                for name, default in BATCH_INPUT_DEFAULTS.items()
+            }
+        else:
+            raw = {}
+            for name, path in BATCH_INPUT_SOURCES.items():
+                default = BATCH_INPUT_DEFAULTS[name]
+                if path:
+                    raw[name] = [pond.get(path[0], {}).get(name, default) for pond in ponds]
+                else:
+                    raw[name] = [pond.get(name, default) for pond in ponds]
+        
+        columns = {}
+        for name, values in raw.items():
+            if name == 'fish_species':
+                # Names, or species ids from species_table.encode
+                values = np.asarray(values)
+                if values.dtype.kind not in 'iu':
+                    values = pd.Series(values, dtype=object).fillna(BATCH_INPUT_DEFAULTS[name]).to_numpy()
+                columns[name] = values
+            else:
+                values = np.asarray(values, dtype=np.float64)
+                columns[name] = np.where(np.isnan(values), BATCH_INPUT_DEFAULTS[name], values)
+        
+        return columns
+    
     def determine_feeding_frequency(self, water_quality: Dict, fish_data: Dict) -> int:
         """
         Determine optimal feeding frequency
@@ -323,45 +823,108 @@ class FeedingRecommendationSystem:
         """
         try:
             # Prepare features and target
-            X = training_data[self.feature_columns]
-            y = training_data['optimal_feeding_rate']
-            
-            # Split data
-            X_train, X_test, y_train, y_test = train_test_split(
-                X, y, test_size=0.2, random_state=42
-            )
+            X = self.feature_assembler.assemble(training_data)
+            y = training_data['optimal_feeding_rate'].to_numpy()
             
-            # Scale features
-            X_train_scaled = self.scaler.fit_transform(X_train)
-            X_test_scaled = self.scaler.transform(X_test)
+            return self._fit_matrix(X, y)
             
-            # Train model
-            self.model = RandomForestRegressor(
-                n_estimators=100,
-                max_depth=10,
-                random_state=42,
-                n_jobs=-1
-            )
-            
-            self.model.fit(X_train_scaled, y_train)
+        except Exception as e:
+            logger.error(f"Error training model: {e}")
+            return None
+    
+    def train_model_from_source(self, source: ChunkedTrainingSource, sample_size: int = 500_000):
+        """
+        Train from a chunked history that need not fit in memory
+        
+        The scaler is fitted on every row with partial_fit and the model
+        trains on a uniform reservoir sample of sample_size rows.
+        """
+        try:
+            source = source.with_columns(self.feature_columns + ['optimal_feeding_rate'])
+            sample = ReservoirSample(sample_size)
+            scaler = StandardScaler()
             
-            # Evaluate
-            y_pred = self.model.predict(X_test_scaled)
-            mse = mean_squared_error(y_test, y_pred)
-            r2 = r2_score(y_test, y_pred)
+            for chunk in source:
+                X = self.feature_assembler.assemble(chunk, dtype=np.float32)
+                scaler.partial_fit(X)
+                sample.add(pd.DataFrame(X, columns=self.feature_columns).assign(
+                    optimal_feeding_rate=chunk['optimal_feeding_rate'].to_numpy()
+                ))
             
-            logger.info(f"Model trained - MSE: {mse:.4f}, R2: {r2:.4f}")
+            logger.info(f"Sampled {len(sample.frame())} of {sample.rows_seen} rows for training")
+            training_sample = sample.frame()
+            self.scaler = scaler
             
-            return {'mse': mse, 'r2': r2}
+            return self._fit_matrix(
+                training_sample[self.feature_columns].to_numpy(dtype=np.float64),
+                training_sample['optimal_feeding_rate'].to_numpy(),
+                fit_scaler=False
+            )
             
         except Exception as e:
             logger.error(f"Error training model: {e}")
             return None
     
-    def save_model(self, filepath: str):
+    def _fit_matrix(self, X: np.ndarray, y: np.ndarray, fit_scaler: bool = True) -> Dict:
+        """
+        Split, scale, fit and evaluate on an assembled feature matrix
+        
+        With fit_scaler=False the already fitted scaler is reused.
+        """
+        # Split data
+        X_train, X_test, y_train, y_test = train_test_split(
+            X, y, test_size=0.2, random_state=42
+        )
+        
+        # Scale features
+        if fit_scaler:
+            self.scaler.fit(X_train)
+        X_train_scaled = self.scaler.transform(X_train)
+        X_test_scaled = self.scaler.transform(X_test)
+        
+        # Train model
+        self.model = RandomForestRegressor(
+            n_estimators=100,
+            max_depth=10,
+            random_state=42,
+            n_jobs=-1
+        )
+        
+        self.model.fit(X_train_scaled, y_train)
+        self._compiled = None
+        
+        if self.prediction_cache is not None:
+            self.prediction_cache.invalidate()
+        
+        # Evaluate
+        y_pred = self.model.predict(X_test_scaled)
+        mse = mean_squared_error(y_test, y_pred)
+        r2 = r2_score(y_test, y_pred)
+        
+        logger.info(f"Model trained - MSE: {mse:.4f}, R2: {r2:.4f}")
+        
+        return {'mse': mse, 'r2': r2}
+    
+    def save_model(self, filepath: str, memory_mapped: bool = False):
         """
         Save the trained model
+        
+        With memory_mapped=True, filepath is an artifact directory whose tree
+        arrays workers load with mmap_mode='r' (see model_artifacts).
         """
+        if memory_mapped:
+            ModelArtifact.write(
+                filepath,
+                {'model': self.model} if self.model is not None else {},
+                {'main': self.scaler} if hasattr(self.scaler, 'mean_') else {},
+                {
+                    'feature_columns': self.feature_columns,
+                    'species_coefficients': self.species_coefficients
+                }
+            )
+            logger.info(f"Model saved to {filepath}")
+            return
+        
         model_data = {
             'model': self.model,
             'scaler': self.scaler,
@@ -374,17 +937,45 @@ class FeedingRecommendationSystem:
     
     def load_model(self, filepath: str):
         """
-        Load the trained model
+        Load the trained model from a joblib file or an artifact directory
         """
-        model_data = joblib.load(filepath)
+        if ModelArtifact.is_artifact(filepath):
+            model_data = self._read_artifact(filepath)
+        else:
+            model_data = joblib.load(filepath)
         
         self.model = model_data['model']
         self.scaler = model_data['scaler']
         self.feature_columns = model_data['feature_columns']
         self.species_coefficients = model_data['species_coefficients']
+        self.feature_assembler = FeedingFeatureAssembler(self.feature_columns)
+        self._compiled = None
+        
+        if self.prediction_cache is not None:
+            self.prediction_cache.invalidate()
         
         logger.info(f"Model loaded from {filepath}")
 
+    def _read_artifact(self, directory: str) -> Dict:
+        """
+        Read an artifact into the same shape as the joblib model_data dict
+        """
+        artifact = ModelArtifact(directory)
+        metadata = artifact.metadata
+        
+        # JSON has no tuples; restore the ph_range pairs
+        species_coefficients = {
+            species: {**coeffs, 'ph_range': tuple(coeffs['ph_range'])}
+            for species, coeffs in metadata['species_coefficients'].items()
+        }
+        
+        return {
+            'model': artifact.ensemble('model') if 'model' in artifact.ensemble_names() else None,
+            'scaler': artifact.scaler('main') if 'main' in artifact.manifest['scalers'] else StandardScaler(),
+            'feature_columns': metadata['feature_columns'],
+            'species_coefficients': species_coefficients
+        }
+
 # Example usage
 def create_sample_training_data() -> pd.DataFrame:
     """
@@ -396,25 +987,65 @@ def create_sample_training_data() -> pd.DataFrame:
     data = {
         'fish_weight_avg': np.random.normal(100, 20, n_samples),
         'fish_count': np.random.randint(500, 2000, n_samples),
-        'water_temperature': np.random.normal(25, 5, n_samples),
-        'ph': np.random.normal(7.0, 0.5, n_samples),
-        'dissolved_oxygen': np.random.normal(8.0, 1.5, n_samples),
+        'water_temperature': np.random.uniform(2, 38, n_samples),
+        'ph': np.random.uniform(6.0, 9.0, n_samples),
+        'dissolved_oxygen': np.random.uniform(3.0, 11.0, n_samples),
         'turbidity': np.random.normal(2.0, 0.8, n_samples),
-        'ammonia': np.random.normal(0.3, 0.2, n_samples),
+        'ammonia': np.random.uniform(0.0, 1.0, n_samples),
         'nitrite': np.random.normal(0.1, 0.05, n_samples),
         'nitrate': np.random.normal(5.0, 2.0, n_samples),
         'pond_volume': np.random.normal(10000, 2000, n_samples),
-        'fish_age_days': np.random.randint(30, 365, n_samples),
-        'feeding_frequency': np.random.randint(1, 4, n_samples),
-        'last_feeding_hours': np.random.uniform(6, 24, n_samples),
+        'fish_age_days': np.random.randint(1, 600, n_samples),
+        'feeding_frequency': np.random.randint(1, 6, n_samples),
+        'last_feeding_hours': np.random.uniform(1, 36, n_samples),
         'season': np.random.randint(0, 4, n_samples),
         'time_of_day': np.random.randint(6, 18, n_samples),
-        'weather_condition': np.random.randint(0, 3, n_samples),
-        'optimal_feeding_rate': np.random.normal(150, 50, n_samples)
+        'weather_condition': np.random.randint(0, 3, n_samples)
     }
     
+    # Target in percent of the base ration (see RATE_PERCENT): the rule
+    # engine's tilapia adjustments, plus noise
+    temperature = data['water_temperature']
+    rate = np.full(n_samples, RATE_PERCENT)
+    rate *= np.where((temperature < 20) | (temperature > 35), 0.5,
+                     np.where(np.abs(temperature - 28) > 5, 0.8, 1.0))
+    rate *= np.where(data['dissolved_oxygen'] < 5.0, 0.6, 1.0)
+    rate *= np.where((data['ph'] < 6.5) | (data['ph'] > 8.5), 0.7, 1.0)
+    rate *= np.where(data['ammonia'] > 0.5, 0.5, 1.0)
+    rate *= np.where(data['fish_age_days'] < 30, 1.2, np.where(data['fish_age_days'] > 365, 0.9, 1.0))
+    rate *= np.where(data['feeding_frequency'] > 3, 0.8, np.where(data['feeding_frequency'] < 2, 1.1, 1.0))
+    rate *= np.where(data['last_feeding_hours'] > 24, 1.3, np.where(data['last_feeding_hours'] < 6, 0.7, 1.0))
+    data['optimal_feeding_rate'] = rate * np.random.normal(1.0, 0.1, n_samples)
+    
     return pd.DataFrame(data)
 
+def create_sample_ponds(n_ponds: int = 30_000, seed: int = 7) -> List[Dict]:
+    """
+    Random pond_data dicts covering every branch of the feeding rules
+    """
+    rng = np.random.default_rng(seed)
+    species = rng.choice(['tilapia', 'salmon', 'trout', 'carp'], n_ponds)
+    
+    return [
+        {
+            'fish_weight_avg': float(rng.uniform(5, 800)),
+            'fish_count': int(rng.integers(100, 20000)),
+            'fish_species': str(species[i]),
+            'water_quality': {
+                'temperature': float(rng.uniform(2, 38)),
+                'ph': float(rng.uniform(6.0, 9.0)),
+                'dissolved_oxygen': float(rng.uniform(3.0, 11.0)),
+                'ammonia': float(rng.uniform(0.0, 1.0))
+            },
+            'fish_data': {
+                'age_days': int(rng.integers(1, 600)),
+                'feeding_frequency': int(rng.integers(1, 6)),
+                'last_feeding_hours': float(rng.uniform(1, 36))
+            }
+        }
+        for i in range(n_ponds)
+    ]
+
 def main():
     """
     Main function to test the feeding recommendation system
@@ -449,5 +1080,200 @@ def main():
     
     return system
 
+def check_batch_parity(system: FeedingRecommendationSystem, ponds: List[Dict]) -> Dict:
+    """
+    Compare recommend_feeding_batch against the scalar rule path pond by pond
+    
+    Batch values are rounded the way recommend_feeding rounds them and
+    must then match exactly.
+    """
+    batch = system.recommend_feeding_batch(ponds)
+    mismatches = []
+    
+    for i, pond in enumerate(ponds):
+        scalar = system._recommend_feeding(pond)
+        expected = {
+            'total_daily_amount': round(float(batch['total_daily_amount'][i]), 2),
+            'amount_per_fish': round(float(batch['amount_per_fish'][i]), 4),
+            'feeding_frequency': int(batch['feeding_frequency'][i]),
+            'amount_per_feeding': round(float(batch['amount_per_feeding'][i]), 2),
+            'base_rate': round(float(batch['base_rate'][i]), 2),
+            'adjustment_factors': {
+                name: round(float(values[i]), 2)
+                for name, values in batch['adjustment_factors'].items()
+            }
+        }
+        
+        for field, value in expected.items():
+            if scalar.get(field) != value:
+                mismatches.append((i, field))
+    
+    return {'rows': len(ponds), 'mismatches': mismatches}
+
+def benchmark_fleet_recommendation(system: FeedingRecommendationSystem,
+                                   n_ponds: int = 30_000) -> Dict[str, float]:
+    """
+    Ponds per second of the scalar loop versus recommend_feeding_batch
+    """
+    ponds = create_sample_ponds(n_ponds)
+    
+    start = time.perf_counter()
+    for pond in ponds:
+        system._recommend_feeding(pond)
+    scalar_seconds = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    system.recommend_feeding_batch(ponds)
+    batch_seconds = time.perf_counter() - start
+    
+    columns = system._ponds_to_columns(ponds)
+    start = time.perf_counter()
+    system.recommend_feeding_batch(columns)
+    columnar_seconds = time.perf_counter() - start
+    
+    results = {
+        'scalar_ponds_per_s': n_ponds / scalar_seconds,
+        'batch_ponds_per_s': n_ponds / batch_seconds,
+        'columnar_ponds_per_s': n_ponds / columnar_seconds
+    }
+    logger.info(f"{n_ponds} ponds - scalar: {scalar_seconds:.3f}s, "
+                f"batch (dicts): {batch_seconds:.3f}s, batch (columnar): {columnar_seconds:.3f}s")
+    
+    return results
+
+def benchmark_feeder_polls(system: FeedingRecommendationSystem, n_ponds: int = 2000,
+                           polls_per_pond: int = 24, update_every: int = 3) -> Dict[str, float]:
+    """
+    Feeder polls every 5 minutes, answered by recommend_feeding versus
+    FeedingScheduler; sensor readings (with noise) arrive every
+    update_every polls
+    """
+    rng = np.random.default_rng(11)
+    ponds = create_sample_ponds(n_ponds)
+    start_time = datetime(2024, 5, 1, 6, 0)
+    
+    def noisy(pond):
+        water_quality = {
+            name: value + rng.normal(0, 0.02) for name, value in pond['water_quality'].items()
+        }
+        return {**pond, 'water_quality': water_quality}
+    
+    polls = [
+        (start_time + timedelta(minutes=5 * step), i, noisy(pond) if step % update_every == 0 else None)
+        for step in range(polls_per_pond)
+        for i, pond in enumerate(ponds)
+    ]
+    latest = {}
+    
+    start = time.perf_counter()
+    for _, pond_id, pond in polls:
+        latest[pond_id] = pond or latest[pond_id]
+        system.recommend_feeding(latest[pond_id])
+    full_seconds = time.perf_counter() - start
+    
+    scheduler = FeedingScheduler(system)
+    start = time.perf_counter()
+    for now, pond_id, pond in polls:
+        scheduler.poll(pond_id, pond, now)
+    scheduler_seconds = time.perf_counter() - start
+    
+    results = {
+        'full_polls_per_s': len(polls) / full_seconds,
+        'scheduler_polls_per_s': len(polls) / scheduler_seconds,
+        'recomputations': scheduler.recomputations,
+        'polls': len(polls)
+    }
+    logger.info(f"{len(polls)} polls - full: {full_seconds:.3f}s, scheduler: {scheduler_seconds:.3f}s "
+                f"({scheduler.recomputations} recomputations)")
+    
+    return results
+
+def _prepare_features_per_row(feature_columns: List[str], data: Dict) -> np.ndarray:
+    """
+    One-row feature vector built column by column, as prepare_features
+    did before FeedingFeatureAssembler
+    """
+    features = []
+    
+    for col in feature_columns:
+        if col in data:
+            features.append(data[col])
+        else:
+            features.append(FEATURE_DEFAULTS.get(col, 0))
+    
+    return np.array(features).reshape(1, -1)
+
+def benchmark_feature_assembly(system: FeedingRecommendationSystem,
+                               n_rows: int = 100_000) -> Dict[str, float]:
+    """
+    Rows per second of per-row feature preparation versus one assemble() call
+    """
+    data = create_sample_training_data().drop(columns=['optimal_feeding_rate'])
+    data = data.sample(n_rows, replace=True, random_state=0).reset_index(drop=True)
+    records = data.drop(columns=['season', 'weather_condition']).to_dict('records')
+    
+    start = time.perf_counter()
+    np.vstack([_prepare_features_per_row(system.feature_columns, record) for record in records])
+    per_row_seconds = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    system.feature_assembler.assemble(records)
+    records_seconds = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    system.feature_assembler.assemble(data)
+    frame_seconds = time.perf_counter() - start
+    
+    return {
+        'per_row_rows_per_s': n_rows / per_row_seconds,
+        'records_rows_per_s': n_rows / records_seconds,
+        'dataframe_rows_per_s': n_rows / frame_seconds
+    }
+
+def benchmark_hybrid_recommendation(system: FeedingRecommendationSystem,
+                                    n_ponds: int = 30_000, batch_size: int = 1000) -> Dict:
+    """
+    Per-path metrics of recommend_feeding_hybrid over a fleet, in batches
+    """
+    ponds = create_sample_ponds(n_ponds)
+    system.path_metrics.reset()
+    
+    for start in range(0, n_ponds, batch_size):
+        system.recommend_feeding_hybrid(ponds[start:start + batch_size])
+    
+    metrics = system.path_metrics.snapshot()
+    for path in FeedingPathMetrics.PATHS:
+        logger.info(f"{path} path - {metrics[path]['traffic_fraction']:.1%} of ponds, "
+                    f"p50 {metrics[path]['p50_ms']} ms per batch")
+    
+    return metrics
+
+def run_benchmarks():
+    """
+    Report rule engine parity and fleet-wide throughput
+    """
+    system = FeedingRecommendationSystem()
+    
+    parity = check_batch_parity(system, create_sample_ponds(5000))
+    print("Batch parity mismatches:", len(parity['mismatches']))
+    
+    throughput = benchmark_fleet_recommendation(system)
+    print("Fleet recommendation throughput (ponds/s):", throughput)
+    
+    polls = benchmark_feeder_polls(system)
+    print("Feeder polls:", polls)
+    
+    assembly = benchmark_feature_assembly(system)
+    print("Feature assembly:", assembly)
+    
+    print("Hybrid paths (rules only):", benchmark_hybrid_recommendation(system))
+    system.train_model(create_sample_training_data())
+    print("Hybrid paths (model loaded):", benchmark_hybrid_recommendation(system))
+    
+    return system
+
 if __name__ == "__main__":
-    system = main()
+    if len(sys.argv) > 1 and sys.argv[1] == 'benchmark':
+        system = run_benchmarks()
+    else:
+        system = main()
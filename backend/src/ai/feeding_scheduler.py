@@ -0,0 +1,303 @@
+"""
+AquaFarm Pro - Feeding Scheduler
+Day-ahead feeding slots per pond, recomputed only when inputs change
+"""
+
+import heapq
+import numbers
+import threading
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Change (by leaf input name) that invalidates a pond's plan; other fields
+# invalidate it on any change
+DEFAULT_CHANGE_THRESHOLDS = {
+    'temperature': 1.0, 'dissolved_oxygen': 0.5, 'ph': 0.2, 'ammonia': 0.1,
+    'turbidity': 1.0, 'nitrite': 0.1, 'nitrate': 2.0, 'fish_weight_avg': 5.0,
+    'fish_count': 50
+}
+
+# Rule cutoffs (by leaf input name): crossing one invalidates a pond's plan
+# even when the change is below its threshold. The feeding rules halve
+# portions above 0.5 ammonia, change frequency below 20 and above 30
+# degrees and scale portions when the last feeding was under 6 or over 24
+# hours ago. Inputs with cutoffs but no threshold change only by crossing.
+DEFAULT_CHANGE_RANGES = {
+    'last_feeding_hours': (6, 24),
+    'ammonia': (0.5,),
+    'temperature': (20, 30)
+}
+
+# Cutoffs taken from the pond species' row of the recommender's species
+# table: the temperature limits and the +/-5 degree band around the
+# optimum, the oxygen minimum and the pH range
+SPECIES_CHANGE_RANGES = {
+    'temperature': lambda c: (c.temp_min, c.temp_max, c.temp_optimal - 5, c.temp_optimal + 5),
+    'dissolved_oxygen': lambda c: (c.oxygen_min,),
+    'ph': lambda c: (c.ph_min, c.ph_max)
+}
+
+class FeedingSlot(NamedTuple):
+    """
+    One scheduled feeding
+    """
+    pond_id: str
+    due_at: datetime
+    amount: float
+    slot_index: int
+
+class PondPlan(NamedTuple):
+    """
+    A pond's feeding slots for the next horizon, plus the inputs they came from
+    """
+    pond_id: str
+    generation: int
+    inputs: Dict
+    recommendation: Dict
+    slots: List[FeedingSlot]
+    due_times: List[datetime]
+    generated_at: datetime
+    refresh_at: datetime
+
+class FeedingScheduler:
+    """
+    Precomputed feeding slots for many ponds
+
+    Each pond's plan spreads recommend_feeding's daily frequency evenly
+    over the feeding window, for the next horizon_hours. Plans live in a
+    dict keyed by pond (next_feeding is a bisect over the pond's slots)
+    and all slots sit in one heap keyed by due time (pop_due). Replaced
+    plans are invalidated lazily through their generation number.
+
+    update_pond only re-runs the recommender when the plan is due for a
+    refresh, an input moved beyond its change threshold or across one of
+    its rule cutoffs (change_ranges plus the pond species' limits), or an
+    input appeared, disappeared or became non-numeric, so frequent feeder
+    polls do not recompute anything.
+    """
+
+    def __init__(self, recommender, feeding_window: Tuple[int, int] = (6, 18),
+                 horizon_hours: int = 24, refresh_hours: int = 12,
+                 change_thresholds: Optional[Dict[str, float]] = None,
+                 change_ranges: Optional[Dict[str, Tuple[float, float]]] = None,
+                 ignore: Tuple[str, ...] = ()):
+        self.recommender = recommender
+        self.feeding_window = feeding_window
+        self.horizon = timedelta(hours=horizon_hours)
+        self.refresh = timedelta(hours=refresh_hours)
+        self.change_thresholds = DEFAULT_CHANGE_THRESHOLDS if change_thresholds is None else change_thresholds
+        self.change_ranges = DEFAULT_CHANGE_RANGES if change_ranges is None else change_ranges
+        self.ignore = set(ignore)
+        self._plans = {}
+        self._heap = []
+        self._live_slots = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.recomputations = 0
+        self.skipped_updates = 0
+
+    def update_pond(self, pond_id: str, pond_data: Dict, now: Optional[datetime] = None) -> bool:
+        """
+        Record a pond's latest inputs; returns True if its plan was rebuilt
+        """
+        now = now or datetime.now()
+        inputs = self._snapshot(pond_data)
+        plan = self._plans.get(pond_id)
+
+        if plan is not None and now < plan.refresh_at and not self._inputs_changed(plan.inputs, inputs):
+            self.skipped_updates += 1
+            return False
+
+        recommendation = self.recommender.recommend_feeding(pond_data)
+        if 'error' in recommendation:
+            logger.error(f"Could not plan feeding for pond {pond_id}: {recommendation['error']}")
+            return False
+
+        with self._lock:
+            self._generation += 1
+            plan = self._build_plan(pond_id, self._generation, inputs, recommendation, now)
+            previous = self._plans.get(pond_id)
+            self._plans[pond_id] = plan
+            self._live_slots += len(plan.slots) - (len(previous.slots) if previous else 0)
+
+            for slot in plan.slots:
+                heapq.heappush(self._heap, (slot.due_at, plan.generation, slot))
+            self._compact()
+
+        self.recomputations += 1
+        return True
+
+    def _snapshot(self, pond_data: Dict, prefix: str = '') -> Dict:
+        """
+        Flat {dotted name: value} copy of the inputs (nested dicts flattened)
+        """
+        snapshot = {}
+        for name, value in pond_data.items():
+            if name in self.ignore:
+                continue
+            if isinstance(value, dict):
+                snapshot.update(self._snapshot(value, f"{prefix}{name}."))
+            else:
+                snapshot[prefix + name] = value
+
+        return snapshot
+
+    def _inputs_changed(self, previous: Dict, current: Dict) -> bool:
+        if previous.keys() != current.keys():
+            return True
+
+        species_cutoffs = self._species_cutoffs(current.get('fish_species', 'tilapia'))
+
+        for name, new in current.items():
+            old = previous[name]
+            if old == new:
+                continue
+
+            if not (self._is_number(old) and self._is_number(new)):
+                return True
+
+            leaf = name.rpartition('.')[2]
+            cutoffs = (tuple(self.change_ranges.get(name, self.change_ranges.get(leaf, ())))
+                       + species_cutoffs.get(leaf, ()))
+            if self._cutoff_sides(old, cutoffs) != self._cutoff_sides(new, cutoffs):
+                return True
+
+            threshold = self.change_thresholds.get(name, self.change_thresholds.get(leaf))
+            if threshold is None:
+                if cutoffs:
+                    continue
+                return True
+            if not abs(new - old) <= threshold:
+                return True
+
+        return False
+
+    def _species_cutoffs(self, species) -> Dict[str, Tuple[float, ...]]:
+        """
+        {leaf input name: cutoffs} from the species' coefficients, if the
+        recommender has a species table
+        """
+        table = getattr(self.recommender, 'species_table', None)
+        if table is None or not isinstance(species, str):
+            return {}
+
+        coefficients = table.lookup(species)
+        return {name: tuple(cutoffs(coefficients)) for name, cutoffs in SPECIES_CHANGE_RANGES.items()}
+
+    @staticmethod
+    def _is_number(value) -> bool:
+        return isinstance(value, numbers.Real) and not isinstance(value, bool)
+
+    @staticmethod
+    def _cutoff_sides(value: float, cutoffs: Tuple[float, ...]) -> Tuple[int, ...]:
+        """
+        Below (-1), at (0) or above (1) each cutoff; rules compare with
+        both < and >, so equal sides mean the rules agree
+        """
+        return tuple((value > cutoff) - (value < cutoff) for cutoff in cutoffs)
+
+    def _build_plan(self, pond_id: str, generation: int, inputs: Dict,
+                    recommendation: Dict, now: datetime) -> PondPlan:
+        """
+        Spread the day's feedings evenly over the feeding window
+        """
+        frequency = max(int(recommendation['feeding_frequency']), 1)
+        start_hour, end_hour = self.feeding_window
+        spacing = timedelta(hours=(end_hour - start_hour) / frequency)
+        day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        end = now + self.horizon
+
+        slots = []
+        while day < end:
+            window_start = day + timedelta(hours=start_hour)
+            for i in range(frequency):
+                due_at = window_start + spacing * (i + 0.5)
+                if now <= due_at < end:
+                    slots.append(FeedingSlot(pond_id, due_at, recommendation['amount_per_feeding'], i))
+            day += timedelta(days=1)
+
+        return PondPlan(
+            pond_id=pond_id,
+            generation=generation,
+            inputs=inputs,
+            recommendation=recommendation,
+            slots=slots,
+            due_times=[slot.due_at for slot in slots],
+            generated_at=now,
+            refresh_at=now + self.refresh
+        )
+
+    def _compact(self):
+        """
+        Rebuild the heap once stale entries outnumber live ones
+
+        _live_slots counts the slots of current plans (popped ones included).
+        """
+        if len(self._heap) > 2 * self._live_slots + 64:
+            self._heap = [entry for entry in self._heap if self._is_live(entry)]
+            heapq.heapify(self._heap)
+
+    def _is_live(self, entry: Tuple) -> bool:
+        plan = self._plans.get(entry[2].pond_id)
+        return plan is not None and plan.generation == entry[1]
+
+    def plan(self, pond_id: str) -> Optional[PondPlan]:
+        return self._plans.get(pond_id)
+
+    def next_feeding(self, pond_id: str, now: Optional[datetime] = None) -> Optional[FeedingSlot]:
+        """
+        The pond's next slot at or after now (None if it has no plan)
+        """
+        plan = self._plans.get(pond_id)
+        if plan is None:
+            return None
+
+        i = bisect_left(plan.due_times, now or datetime.now())
+        return plan.slots[i] if i < len(plan.slots) else None
+
+    def poll(self, pond_id: str, pond_data: Optional[Dict] = None,
+             now: Optional[datetime] = None) -> Optional[FeedingSlot]:
+        """
+        Feeder poll: optionally report fresh inputs, then get the next slot
+        """
+        now = now or datetime.now()
+        if pond_data is not None:
+            self.update_pond(pond_id, pond_data, now)
+
+        return self.next_feeding(pond_id, now)
+
+    def pop_due(self, now: Optional[datetime] = None) -> List[FeedingSlot]:
+        """
+        Remove and return every live slot due at or before now, oldest first
+        """
+        now = now or datetime.now()
+        due = []
+
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                entry = heapq.heappop(self._heap)
+                if self._is_live(entry):
+                    due.append(entry[2])
+
+        return due
+
+    def remove_pond(self, pond_id: str):
+        """
+        Drop a pond's plan; its heap entries become stale
+        """
+        with self._lock:
+            plan = self._plans.pop(pond_id, None)
+            if plan is not None:
+                self._live_slots -= len(plan.slots)
+
+    def stats(self) -> Dict:
+        return {
+            'ponds': len(self._plans),
+            'heap_entries': len(self._heap),
+            'recomputations': self.recomputations,
+            'skipped_updates': self.skipped_updates
+        }
@@ -0,0 +1,338 @@
+"""
+AquaFarm Pro - Inference Server
+Asyncio micro-batching layer in front of the AI models
+"""
+
+import asyncio
+import importlib.util
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class BackpressureError(Exception):
+    """
+    Raised when a model's request queue is full
+    """
+
+class MicroBatcher:
+    """
+    Collect concurrent requests for one model into micro-batches
+
+    A batch is dispatched once it holds max_batch_size requests or
+    max_wait_ms has passed since its first request, whichever comes first.
+    batch_fn maps a list of requests to a list of results and runs in the
+    executor (a thread pool by default), so the event loop keeps accepting
+    requests while a batch runs. Batches run one at a time per model, and
+    a batch that raises is retried request by request so the error only
+    reaches the request that caused it.
+
+    At most max_queue_size requests wait at once; beyond that submit
+    raises BackpressureError (or waits for room with block=True).
+    """
+
+    def __init__(self, name: str, batch_fn: Callable[[List[Any]], List[Any]],
+                 max_batch_size: int = 64, max_wait_ms: float = 5.0,
+                 max_queue_size: int = 1024, executor: Optional[Executor] = None,
+                 max_samples: int = 10000):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue_size = max_queue_size
+        self.executor = executor
+        self._queue = None
+        self._worker = None
+        self._latencies = deque(maxlen=max_samples)
+        self._batch_sizes = deque(maxlen=max_samples)
+        self.requests = 0
+        self.rejected = 0
+        self.errors = 0
+        self.max_queue_depth = 0
+
+    def start(self):
+        """
+        Start the batching task on the running event loop
+        """
+        if self._worker is None:
+            self._queue = asyncio.Queue(self.max_queue_size)
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """
+        Finish queued requests, then stop the batching task
+        """
+        if self._worker is not None:
+            await self._queue.join()
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def submit(self, request: Any, block: bool = False) -> Any:
+        """
+        Queue a request and wait for its result
+        """
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        entry = (request, future, time.perf_counter())
+
+        if block:
+            await self._queue.put(entry)
+        else:
+            try:
+                self._queue.put_nowait(entry)
+            except asyncio.QueueFull:
+                self.rejected += 1
+                raise BackpressureError(f"{self.name} queue is full ({self.max_queue_size} requests)")
+
+        self.requests += 1
+        self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            await self._dispatch(loop, batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    async def _call(self, loop, requests: List) -> List:
+        results = await loop.run_in_executor(self.executor, self.batch_fn, requests)
+        if len(results) != len(requests):
+            raise RuntimeError(f"{self.name} batch returned {len(results)} results "
+                               f"for {len(requests)} requests")
+        return results
+
+    async def _dispatch(self, loop, batch: List):
+        """
+        Run one batch and resolve its futures
+
+        If the batch raises, its requests are retried one at a time so a
+        single bad request only fails its own future.
+        """
+        try:
+            results = await self._call(loop, [request for request, _, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                self._fail(batch[0], e)
+                return
+
+            logger.error(f"{self.name} batch of {len(batch)} failed ({e}), retrying one at a time")
+            for entry in batch:
+                try:
+                    result = (await self._call(loop, [entry[0]]))[0]
+                except Exception as single_error:
+                    self._fail(entry, single_error)
+                else:
+                    self._resolve(entry, result)
+            return
+
+        self._batch_sizes.append(len(batch))
+        for entry, result in zip(batch, results):
+            self._resolve(entry, result)
+
+    def _resolve(self, entry, result: Any):
+        _, future, submitted_at = entry
+        self._latencies.append(time.perf_counter() - submitted_at)
+        if not future.done():
+            future.set_result(result)
+
+    def _fail(self, entry, error: Exception):
+        logger.error(f"{self.name} request failed: {error}")
+        self.errors += 1
+        future = entry[1]
+        if not future.done():
+            future.set_exception(error)
+
+    def metrics(self) -> Dict:
+        latencies = np.array(self._latencies) * 1000
+        return {
+            'queue_depth': self._queue.qsize() if self._queue is not None else 0,
+            'max_queue_depth': self.max_queue_depth,
+            'requests': self.requests,
+            'rejected': self.rejected,
+            'errors': self.errors,
+            'mean_batch_size': float(np.mean(self._batch_sizes)) if self._batch_sizes else 0.0,
+            'p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else None,
+            'p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else None
+        }
+
+class InferenceServer:
+    """
+    Async front end for the disease, water quality and feeding models
+
+    Each configured model gets its own MicroBatcher; single requests are
+    answered from the models' list-of-records batch methods with the same
+    response shape as the synchronous calls:
+        predict_disease   -> DiseasePredictionModel.predict_disease_many
+        predict           -> WaterQualityPredictor.predict_many
+        recommend_feeding -> FeedingRecommendationSystem.recommend_feeding_many
+    """
+
+    def __init__(self, disease_model=None, water_predictor=None, feeding_system=None,
+                 max_batch_size: int = 64, max_wait_ms: float = 5.0,
+                 max_queue_size: int = 1024, executor: Optional[Executor] = None):
+        self.executor = executor or ThreadPoolExecutor(thread_name_prefix='inference')
+        self.batchers = {}
+
+        models = {
+            'disease': (disease_model, 'predict_disease_many'),
+            'water_quality': (water_predictor, 'predict_many'),
+            'feeding': (feeding_system, 'recommend_feeding_many')
+        }
+        for name, (model, method) in models.items():
+            if model is not None:
+                self.batchers[name] = MicroBatcher(
+                    name, getattr(model, method), max_batch_size, max_wait_ms,
+                    max_queue_size, self.executor
+                )
+
+    def _batcher(self, name: str) -> MicroBatcher:
+        if name not in self.batchers:
+            raise ValueError(f"No {name} model is configured")
+        return self.batchers[name]
+
+    async def predict_disease(self, input_data: Dict) -> Dict:
+        return await self._batcher('disease').submit(input_data)
+
+    async def predict(self, input_data: Dict) -> Dict[str, float]:
+        return await self._batcher('water_quality').submit(input_data)
+
+    async def recommend_feeding(self, pond_data: Dict) -> Dict:
+        return await self._batcher('feeding').submit(pond_data)
+
+    def metrics(self) -> Dict[str, Dict]:
+        """
+        Queue depth, batch size and latency per model
+        """
+        return {name: batcher.metrics() for name, batcher in self.batchers.items()}
+
+    async def close(self):
+        for batcher in self.batchers.values():
+            await batcher.stop()
+        self.executor.shutdown(wait=True)
+
+async def _load_level(call: Callable[[Any], Any], requests: Sequence[Any],
+                      concurrency: int) -> Dict[str, float]:
+    """
+    Send requests through call from concurrency clients, each waiting for
+    its response before sending the next
+    """
+    latencies = []
+    rejected = 0
+    position = 0
+
+    async def client():
+        nonlocal position, rejected
+        while position < len(requests):
+            request = requests[position]
+            position += 1
+            start = time.perf_counter()
+            try:
+                await call(request)
+                latencies.append(time.perf_counter() - start)
+            except BackpressureError:
+                rejected += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    seconds = time.perf_counter() - start
+    latencies = np.array(latencies) * 1000
+
+    return {
+        'concurrency': concurrency,
+        'requests_per_s': len(latencies) / seconds,
+        'p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else None,
+        'p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else None,
+        'rejected': rejected
+    }
+
+async def run_load_test(server: InferenceServer, method: str, requests: Sequence[Any],
+                        concurrency_levels: Sequence[int] = (1, 8, 32, 128)) -> List[Dict[str, float]]:
+    """
+    Throughput and client-side p50/p99 of one server method at increasing concurrency
+    """
+    results = []
+    for concurrency in concurrency_levels:
+        result = await _load_level(getattr(server, method), requests, concurrency)
+        results.append(result)
+        logger.info(f"{method} x{concurrency}: {result['requests_per_s']:.0f} req/s, "
+                    f"p50 {result['p50_ms']:.2f} ms, p99 {result['p99_ms']:.2f} ms")
+
+    return results
+
+def _load_script(filename: str):
+    """
+    Import a sibling model script (their file names are not module names)
+    """
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
+    spec = importlib.util.spec_from_file_location(filename.replace('-', '_')[:-3], path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def run_benchmarks(n_requests: int = 5000,
+                   concurrency_levels: Sequence[int] = (1, 8, 32, 128)) -> Dict[str, Dict]:
+    """
+    Load test every model with micro-batching and with batches of one
+    """
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    disease = _load_script('disease-prediction.py')
+    water = _load_script('water-quality-predictor.py')
+    feeding = _load_script('feeding-recommendation.py')
+
+    disease_model = disease.DiseasePredictionModel()
+    disease_model.train_model(disease.create_sample_training_data())
+    water_predictor = water.WaterQualityPredictor()
+    water_predictor.train_models(water.create_sample_data(), strategy='multi_output')
+    feeding_system = feeding.FeedingRecommendationSystem()
+
+    workloads = {
+        'predict_disease': disease.create_sample_training_data(n_requests)
+        .drop(columns=['disease_category']).to_dict('records'),
+        'predict': water.create_sample_data(n_requests)
+        .assign(timestamp=lambda df: df['timestamp'].astype(str)).to_dict('records'),
+        'recommend_feeding': feeding.create_sample_ponds(n_requests)
+    }
+
+    async def run():
+        results = {}
+        for label, max_batch_size in (('micro_batched', 64), ('unbatched', 1)):
+            server = InferenceServer(disease_model, water_predictor, feeding_system,
+                                     max_batch_size=max_batch_size, max_queue_size=n_requests)
+            results[label] = {
+                method: await run_load_test(server, method, requests, concurrency_levels)
+                for method, requests in workloads.items()
+            }
+            results[label]['metrics'] = server.metrics()
+            await server.close()
+        return results
+
+    return asyncio.run(run())
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(run_benchmarks())
@@ -0,0 +1,216 @@
+"""
+AquaFarm Pro - Model Artifacts
+Directory-based model artifacts with memory-mapped tree arrays
+"""
+
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from typing import Callable, Dict, Optional
+import logging
+
+import numpy as np
+from sklearn.preprocessing import StandardScaler
+
+from tree_ensemble import TreeEnsemble
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = 'manifest.json'
+METADATA_FILE = 'metadata.json'
+
+class ModelArtifact:
+    """
+    A saved model as a directory of uncompressed arrays plus JSON sidecars
+
+    Layout:
+        manifest.json            ensemble descriptions and scaler statistics
+        metadata.json            model metadata, read lazily on first access
+        <name>.<field>.npy       flattened tree arrays (see TreeEnsemble)
+
+    Tree arrays are opened with mmap_mode='r', so every worker process
+    loading the same artifact shares the pages through the OS page cache
+    instead of holding a private unpickled copy of the forests.
+    """
+
+    def __init__(self, directory: str, mmap_mode: Optional[str] = 'r'):
+        self.directory = directory
+        self.mmap_mode = mmap_mode
+        self._manifest = None
+        self._metadata = None
+        self._ensembles = {}
+
+    @staticmethod
+    def is_artifact(path: str) -> bool:
+        """
+        True if path is an artifact directory rather than a joblib file
+        """
+        return os.path.isfile(os.path.join(path, MANIFEST_FILE))
+
+    @classmethod
+    def write(cls, directory: str, ensembles: Dict[str, object],
+              scalers: Dict[str, StandardScaler], metadata: Dict) -> 'ModelArtifact':
+        """
+        Write an artifact; estimators are flattened to TreeEnsemble arrays
+
+        Files are written to a sibling temporary directory which then
+        replaces the target, so readers never see a half-written artifact.
+        """
+        parent = os.path.dirname(os.path.abspath(directory))
+        os.makedirs(parent, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix='.artifact-', dir=parent)
+
+        try:
+            manifest = {
+                'format': 1,
+                'ensembles': {
+                    name: TreeEnsemble.from_sklearn(estimator).save(staging, name)
+                    for name, estimator in ensembles.items()
+                },
+                'scalers': {name: scaler_to_dict(scaler) for name, scaler in scalers.items()}
+            }
+
+            with open(os.path.join(staging, MANIFEST_FILE), 'w') as f:
+                json.dump(manifest, f)
+            with open(os.path.join(staging, METADATA_FILE), 'w') as f:
+                json.dump(metadata, f, ensure_ascii=False)
+
+            if os.path.exists(directory):
+                shutil.rmtree(directory)
+            os.rename(staging, directory)
+
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        logger.info(f"Artifact written to {directory}")
+        return cls(directory)
+
+    @property
+    def manifest(self) -> Dict:
+        if self._manifest is None:
+            with open(os.path.join(self.directory, MANIFEST_FILE)) as f:
+                self._manifest = json.load(f)
+        return self._manifest
+
+    @property
+    def metadata(self) -> Dict:
+        if self._metadata is None:
+            with open(os.path.join(self.directory, METADATA_FILE)) as f:
+                self._metadata = json.load(f)
+        return self._metadata
+
+    def ensemble(self, name: str) -> TreeEnsemble:
+        """
+        Memory-mapped ensemble by name, opened on first access
+        """
+        if name not in self._ensembles:
+            self._ensembles[name] = TreeEnsemble.load(
+                self.directory, name, self.manifest['ensembles'][name], self.mmap_mode
+            )
+        return self._ensembles[name]
+
+    def ensemble_names(self):
+        return list(self.manifest['ensembles'])
+
+    def scaler(self, name: str) -> StandardScaler:
+        return scaler_from_dict(self.manifest['scalers'][name])
+
+def scaler_to_dict(scaler: StandardScaler) -> Dict:
+    """
+    JSON-serializable StandardScaler state
+    """
+    state = {
+        'with_mean': scaler.with_mean,
+        'with_std': scaler.with_std,
+        'mean': None if scaler.mean_ is None else scaler.mean_.tolist(),
+        'scale': None if scaler.scale_ is None else scaler.scale_.tolist(),
+        'var': None if scaler.var_ is None else scaler.var_.tolist(),
+        'n_samples_seen': np.asarray(scaler.n_samples_seen_).tolist(),
+        'n_features_in': int(scaler.n_features_in_)
+    }
+    if hasattr(scaler, 'feature_names_in_'):
+        state['feature_names_in'] = scaler.feature_names_in_.tolist()
+
+    return state
+
+def scaler_from_dict(state: Dict) -> StandardScaler:
+    """
+    Rebuild a fitted StandardScaler from scaler_to_dict output
+    """
+    scaler = StandardScaler(with_mean=state['with_mean'], with_std=state['with_std'])
+
+    for attribute, key in (('mean_', 'mean'), ('scale_', 'scale'), ('var_', 'var')):
+        value = state[key]
+        setattr(scaler, attribute, None if value is None else np.array(value, dtype=np.float64))
+
+    scaler.n_samples_seen_ = np.asarray(state['n_samples_seen'])
+    if scaler.n_samples_seen_.ndim == 0:
+        scaler.n_samples_seen_ = int(scaler.n_samples_seen_)
+    scaler.n_features_in_ = state['n_features_in']
+    if 'feature_names_in' in state:
+        scaler.feature_names_in_ = np.array(state['feature_names_in'], dtype=object)
+
+    return scaler
+
+def _memory_status() -> Dict[str, int]:
+    """
+    Resident memory of this process in kB (Linux /proc, VmRSS split by type)
+    """
+    status = {}
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in ('VmRSS', 'RssAnon', 'RssFile'):
+                    status[key] = int(value.split()[0])
+    except OSError:
+        import resource
+        status['VmRSS'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return status
+
+def _measure_load(load: Callable[[], object], warmup: Optional[Callable[[object], None]], queue):
+    before = _memory_status()
+    start = time.perf_counter()
+    model = load()
+    load_seconds = time.perf_counter() - start
+    after_load = _memory_status()
+
+    if warmup is not None:
+        warmup(model)
+    after_warmup = _memory_status()
+
+    queue.put({
+        'load_seconds': load_seconds,
+        'rss_kb_before': before,
+        'rss_kb_after_load': after_load,
+        'rss_kb_after_warmup': after_warmup
+    })
+
+def benchmark_model_loading(loaders: Dict[str, Callable[[], object]],
+                            warmup: Optional[Callable[[object], None]] = None) -> Dict[str, Dict]:
+    """
+    Load time and per-process RSS for each loader, each in a fresh worker
+
+    Every loader runs in a forked child process, as a gunicorn worker
+    would. RssAnon is private memory; RssFile includes the memory-mapped
+    tree arrays, which are shared between workers via the page cache.
+    """
+    context = multiprocessing.get_context('fork')
+    results = {}
+
+    for name, load in loaders.items():
+        queue = context.Queue()
+        worker = context.Process(target=_measure_load, args=(load, warmup, queue))
+        worker.start()
+        results[name] = queue.get()
+        worker.join()
+
+        logger.info(f"{name}: loaded in {results[name]['load_seconds']:.3f}s, "
+                    f"RSS after warmup {results[name]['rss_kb_after_warmup']}")
+
+    return results
@@ -0,0 +1,363 @@
+"""
+AquaFarm Pro - Model Registry
+Versioned model artifacts with background loading and atomic hot swap
+"""
+
+import json
+import os
+import shutil
+import threading
+import uuid
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class ActivationSuperseded(Exception):
+    """
+    Raised for an activation that finished loading after a later one was requested
+    """
+
+MANIFEST_FILE = 'manifest.json'
+
+class VersionStats:
+    """
+    Prediction counters and latency samples for one model version
+    """
+
+    def __init__(self, max_samples: int = 10000):
+        self.predictions = 0
+        self.errors = 0
+        self._latencies = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, error: bool = False):
+        with self._lock:
+            self.predictions += 1
+            if error:
+                self.errors += 1
+            self._latencies.append(seconds)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            latencies = np.array(self._latencies) * 1000
+
+        return {
+            'predictions': self.predictions,
+            'errors': self.errors,
+            'p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else None,
+            'p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else None
+        }
+
+class ModelBundle(NamedTuple):
+    """
+    Immutable pairing of a loaded model with its version
+
+    The model object must not be mutated once it is in a bundle (no
+    load_model calls); new weights always arrive as a new bundle.
+    """
+    name: str
+    version: str
+    model: Any
+    loaded_at: float
+    stats: VersionStats
+
+class ModelRegistry:
+    """
+    Local registry of versioned model artifacts
+
+    Layout:
+        <root>/<model_name>/manifest.json   versions and the active version
+        <root>/<model_name>/<version>/      saved model (artifact or joblib)
+
+    Each model name is registered with a saver and a loader, e.g.
+
+        def load_disease_model(path):
+            model = DiseasePredictionModel()
+            model.load_model(path)
+            return model
+
+        registry.register_model_type(
+            'disease',
+            saver=lambda model, path: model.save_model(path, memory_mapped=True),
+            loader=load_disease_model
+        )
+
+    At startup, register every model type and then call load_active() to
+    bring back the versions that were active when the process last ran.
+
+    Loading runs on a background thread pool. Activation replaces the
+    active bundle with a single reference assignment, so a request always
+    sees one complete model version, never a mix of old and new parts. The
+    last keep_warm previously active versions stay loaded for instant rollback.
+    """
+
+    def __init__(self, root: str, keep_warm: int = 2, max_workers: int = 2):
+        self.root = root
+        self.keep_warm = keep_warm
+        self._types = {}
+        self._active = {}
+        self._warm = {}
+        self._history = {}
+        self._activation_seq = {}
+        self._publishing = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='model-registry')
+        os.makedirs(root, exist_ok=True)
+
+    def register_model_type(self, model_name: str, saver: Callable[[Any, str], None],
+                            loader: Callable[[str], Any]):
+        """
+        Declare how models of this name are saved to and loaded from a path
+        """
+        self._types[model_name] = {'saver': saver, 'loader': loader}
+        self._warm.setdefault(model_name, {})
+        self._history.setdefault(model_name, [])
+
+    def load_active(self, model_name: Optional[str] = None) -> Dict[str, ModelBundle]:
+        """
+        Activate the version each manifest records as active, waiting for
+        them to load (all registered model types by default)
+
+        Models with no recorded active version, or already active in this
+        process, are skipped.
+        """
+        names = [model_name] if model_name is not None else list(self._types)
+        pending = {}
+        for name in names:
+            version = self._read_manifest(name).get('active')
+            if version is not None and name not in self._active:
+                pending[name] = self.activate_async(name, version)
+
+        return {name: future.result() for name, future in pending.items()}
+
+    def _model_dir(self, model_name: str) -> str:
+        return os.path.join(self.root, model_name)
+
+    def _read_manifest(self, model_name: str) -> Dict:
+        path = os.path.join(self._model_dir(model_name), MANIFEST_FILE)
+        if not os.path.exists(path):
+            return {'versions': [], 'active': None}
+
+        with open(path) as f:
+            return json.load(f)
+
+    def _write_manifest(self, model_name: str, manifest: Dict):
+        path = os.path.join(self._model_dir(model_name), MANIFEST_FILE)
+        staging = f"{path}.tmp"
+        with open(staging, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(staging, path)
+
+    def publish(self, model_name: str, model: Any, version: Optional[str] = None) -> str:
+        """
+        Save a trained model as a new version (does not activate it)
+
+        The model is saved to a staging path that is renamed into place
+        once the version is known to be new, so publishing never touches
+        the files of an existing version.
+        """
+        version = version or datetime.now().strftime('%Y%m%d%H%M%S%f')
+        model_dir = self._model_dir(model_name)
+        path = os.path.join(model_dir, version)
+        staging = os.path.join(model_dir, f".staging-{version}-{uuid.uuid4().hex}")
+        os.makedirs(model_dir, exist_ok=True)
+
+        with self._lock:
+            manifest = self._read_manifest(model_name)
+            if ((model_name, version) in self._publishing or os.path.exists(path)
+                    or any(entry['version'] == version for entry in manifest['versions'])):
+                raise ValueError(f"{model_name} version {version} already exists")
+            self._publishing.add((model_name, version))
+
+        try:
+            self._types[model_name]['saver'](model, staging)
+
+            with self._lock:
+                os.rename(staging, path)
+                manifest = self._read_manifest(model_name)
+                manifest['versions'].append({
+                    'version': version,
+                    'created_at': datetime.now().isoformat()
+                })
+                self._write_manifest(model_name, manifest)
+        except Exception:
+            if os.path.isdir(staging):
+                shutil.rmtree(staging, ignore_errors=True)
+            elif os.path.exists(staging):
+                os.remove(staging)
+            raise
+        finally:
+            with self._lock:
+                self._publishing.discard((model_name, version))
+
+        logger.info(f"Published {model_name} version {version}")
+        return version
+
+    def versions(self, model_name: str) -> List[Dict]:
+        return self._read_manifest(model_name)['versions']
+
+    def load_async(self, model_name: str, version: str) -> Future:
+        """
+        Load a version in the background; resolves to its ModelBundle
+        """
+        with self._lock:
+            bundle = self._warm[model_name].get(version)
+        if bundle is not None:
+            future = Future()
+            future.set_result(bundle)
+            return future
+
+        return self._executor.submit(self._load, model_name, version)
+
+    def _load(self, model_name: str, version: str) -> ModelBundle:
+        path = os.path.join(self._model_dir(model_name), version)
+        if not os.path.exists(path):
+            raise ValueError(f"Unknown {model_name} version: {version}")
+
+        start = time.perf_counter()
+        model = self._types[model_name]['loader'](path)
+        bundle = ModelBundle(model_name, version, model, time.time(), VersionStats())
+
+        with self._lock:
+            self._warm[model_name].setdefault(version, bundle)
+            bundle = self._warm[model_name][version]
+
+        logger.info(f"Loaded {model_name} version {version} in {time.perf_counter() - start:.2f}s")
+        return bundle
+
+    def activate_async(self, model_name: str, version: Optional[str] = None) -> Future:
+        """
+        Load (if needed) and activate a version without blocking the caller
+
+        Defaults to the most recently published version. Requests keep
+        using the current bundle until the new one is fully loaded.
+        Activations take effect in the order they were requested: one
+        that finishes loading after a later request (activate or
+        rollback) fails with ActivationSuperseded instead of swapping.
+        """
+        if version is None:
+            versions = self.versions(model_name)
+            if not versions:
+                raise ValueError(f"No published versions for {model_name}")
+            version = versions[-1]['version']
+
+        with self._lock:
+            seq = self._activation_seq.get(model_name, 0) + 1
+            self._activation_seq[model_name] = seq
+
+        activated = Future()
+
+        def swap(loaded: Future):
+            try:
+                bundle = loaded.result()
+                self._swap(bundle, seq)
+                activated.set_result(bundle)
+            except ActivationSuperseded as e:
+                logger.info(str(e))
+                activated.set_exception(e)
+            except Exception as e:
+                logger.error(f"Activation of {model_name} version {version} failed: {e}")
+                activated.set_exception(e)
+
+        self.load_async(model_name, version).add_done_callback(swap)
+        return activated
+
+    def activate(self, model_name: str, version: Optional[str] = None) -> ModelBundle:
+        """
+        Activate a version, waiting for it to load
+        """
+        return self.activate_async(model_name, version).result()
+
+    def _swap(self, bundle: ModelBundle, seq: int):
+        with self._lock:
+            if seq < self._activation_seq[bundle.name]:
+                raise ActivationSuperseded(
+                    f"Activation of {bundle.name} version {bundle.version} "
+                    f"superseded by a later request"
+                )
+
+            previous = self._active.get(bundle.name)
+
+            # Single reference assignment: readers see old or new, never a mix
+            self._active[bundle.name] = bundle
+
+            history = self._history[bundle.name]
+            if bundle.version in history:
+                history.remove(bundle.version)
+            history.append(bundle.version)
+
+            # Keep the active version plus keep_warm previous ones loaded
+            retained = set(history[-(self.keep_warm + 1):])
+            for version in list(self._warm[bundle.name]):
+                if version not in retained:
+                    del self._warm[bundle.name][version]
+
+            manifest = self._read_manifest(bundle.name)
+            manifest['active'] = bundle.version
+            self._write_manifest(bundle.name, manifest)
+
+        logger.info(f"Activated {bundle.name} version {bundle.version}"
+                    + (f" (was {previous.version})" if previous else ""))
+
+    def rollback(self, model_name: str) -> ModelBundle:
+        """
+        Re-activate the previously active version (instant if still warm)
+        """
+        with self._lock:
+            history = self._history[model_name]
+            if len(history) < 2:
+                raise ValueError(f"No previous version of {model_name} to roll back to")
+            version = history[-2]
+
+        return self.activate(model_name, version)
+
+    def get(self, model_name: str) -> ModelBundle:
+        """
+        The active bundle; hold on to it for the duration of a request
+        """
+        bundle = self._active.get(model_name)
+        if bundle is None:
+            raise ValueError(f"No active version for {model_name}")
+        return bundle
+
+    def predict(self, model_name: str, method: str, *args, **kwargs) -> Any:
+        """
+        Call a prediction method on the active version and record its stats
+        """
+        bundle = self.get(model_name)
+        start = time.perf_counter()
+        error = False
+
+        try:
+            result = getattr(bundle.model, method)(*args, **kwargs)
+            error = isinstance(result, dict) and 'error' in result
+            return result
+        except Exception:
+            error = True
+            raise
+        finally:
+            bundle.stats.record(time.perf_counter() - start, error)
+
+    def stats(self, model_name: str) -> Dict[str, Dict]:
+        """
+        Per-version prediction counters and latency for loaded versions
+        """
+        with self._lock:
+            bundles = dict(self._warm[model_name])
+            active = self._active.get(model_name)
+
+        return {
+            version: {**bundle.stats.snapshot(), 'active': bundle is active}
+            for version, bundle in bundles.items()
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,265 @@
+"""
+AquaFarm Pro - Prediction Result Cache
+Shared memoization layer in front of the AI models
+"""
+
+import copy
+import hashlib
+import json
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+class CacheKeyBuilder:
+    """
+    Build hashable cache keys from model inputs
+
+    Floats are quantized to sensor precision (e.g. pH to 0.01) so readings
+    that differ only by sensor noise share a cache entry. Nested dicts are
+    flattened to dotted names; precision is looked up by the full dotted
+    name first, then by the leaf name.
+    """
+
+    def __init__(self, precision: Optional[Dict[str, float]] = None,
+                 default_precision: Optional[float] = None,
+                 ignore: Tuple[str, ...] = ()):
+        self.precision = precision or {}
+        self.default_precision = default_precision
+        self.ignore = set(ignore)
+
+    def build(self, inputs: Dict) -> Tuple:
+        """
+        Return a hashable key for the given inputs
+        """
+        return tuple(self._flatten(inputs, ''))
+
+    def _flatten(self, inputs: Dict, prefix: str):
+        for name in sorted(inputs):
+            if name in self.ignore:
+                continue
+
+            value = inputs[name]
+            path = f"{prefix}{name}"
+
+            if isinstance(value, dict):
+                yield from self._flatten(value, f"{path}.")
+            else:
+                yield path, self._quantize(path, name, value)
+
+    def _quantize(self, path: str, name: str, value: Any) -> Any:
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return value if isinstance(value, (str, int, type(None))) else repr(value)
+
+        step = self.precision.get(path, self.precision.get(name, self.default_precision))
+        if step is None or value != value:
+            return float(value)
+
+        return int(round(float(value) / step))
+
+class MemoryCacheBackend:
+    """
+    In-process cache backend with LRU eviction, TTL and a memory budget
+
+    Entry sizes are estimated from their pickled length. Values are deep
+    copied on the way in and out so callers cannot mutate cached results.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: Optional[float] = None,
+                 max_bytes: Optional[int] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Tuple) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            value, expires_at, size = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                self._bytes -= size
+                self.expirations += 1
+                return None
+
+            self._entries.move_to_end(key)
+
+        return copy.deepcopy(value)
+
+    def set(self, key: Tuple, value: Any):
+        size = len(pickle.dumps((key, value), pickle.HIGHEST_PROTOCOL))
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        value = copy.deepcopy(value)
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[2]
+
+            self._entries[key] = (value, expires_at, size)
+            self._bytes += size
+
+            while self._entries and (
+                len(self._entries) > self.max_entries or
+                (self.max_bytes is not None and self._bytes > self.max_bytes)
+            ):
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        return {
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'evictions': self.evictions,
+            'expirations': self.expirations
+        }
+
+class RedisCacheBackend:
+    """
+    Redis cache backend shared across worker processes
+
+    Values are stored as JSON under a per-namespace generation number;
+    NumPy scalars and arrays are stored as Python numbers and lists, and
+    other non-JSON values raise TypeError.
+    Invalidation bumps the generation, which orphans old entries (they
+    expire through their TTL) without scanning keys. Workers re-read the
+    generation at most every generation_refresh seconds.
+    """
+
+    def __init__(self, redis_client, namespace: str, ttl: Optional[int] = 3600,
+                 prefix: str = 'prediction_cache', generation_refresh: float = 1.0):
+        self.redis = redis_client
+        self.namespace = namespace
+        self.ttl = ttl
+        self.prefix = prefix
+        self.generation_refresh = generation_refresh
+        self._generation_key = f"{prefix}:{namespace}:generation"
+        self._generation = None
+        self._generation_read_at = 0.0
+
+    def _current_generation(self) -> int:
+        now = time.monotonic()
+        if self._generation is None or now - self._generation_read_at >= self.generation_refresh:
+            self._generation = int(self.redis.get(self._generation_key) or 0)
+            self._generation_read_at = now
+        return self._generation
+
+    def _redis_key(self, key: Tuple) -> str:
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return f"{self.prefix}:{self.namespace}:{self._current_generation()}:{digest}"
+
+    def get(self, key: Tuple) -> Optional[Any]:
+        raw = self.redis.get(self._redis_key(key))
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key: Tuple, value: Any):
+        self.redis.set(self._redis_key(key), json.dumps(value, default=_json_default), ex=self.ttl)
+
+    def clear(self):
+        self._generation = int(self.redis.incr(self._generation_key))
+        self._generation_read_at = time.monotonic()
+
+    def stats(self) -> Dict:
+        return {'generation': self._generation}
+
+def _json_default(value: Any) -> Any:
+    """
+    JSON encoding for NumPy scalars and arrays; anything else is an error
+    """
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError(f"Cannot cache value of type {type(value).__name__} in Redis")
+
+class PredictionCache:
+    """
+    Memoization layer for one model's predictions
+    """
+
+    def __init__(self, name: str, key_builder: Optional[CacheKeyBuilder] = None,
+                 backend=None):
+        self.name = name
+        self.key_builder = key_builder or CacheKeyBuilder()
+        self.backend = backend or MemoryCacheBackend()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, inputs: Dict, compute: Callable[[], Any],
+                       cacheable: Callable[[Any], bool] = bool) -> Any:
+        """
+        Return the cached result for inputs, computing and storing it on a miss
+
+        Results for which cacheable(result) is false (e.g. error responses)
+        are returned but not stored.
+        """
+        key = self.key_builder.build(inputs)
+
+        try:
+            cached = self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"{self.name} cache read failed: {e}")
+            cached = None
+
+        with self._lock:
+            if cached is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if cached is not None:
+            return cached
+
+        result = compute()
+
+        if cacheable(result):
+            try:
+                self.backend.set(key, result)
+            except Exception as e:
+                logger.warning(f"{self.name} cache write failed: {e}")
+
+        return result
+
+    def invalidate(self):
+        """
+        Drop every cached result, e.g. after the underlying model is swapped
+        """
+        self.backend.clear()
+        logger.info(f"{self.name} prediction cache invalidated")
+
+    def stats(self) -> Dict:
+        """
+        Hit/miss counters plus backend statistics
+        """
+        with self._lock:
+            hits, misses = self.hits, self.misses
+
+        lookups = hits + misses
+        stats = {
+            'name': self.name,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / lookups if lookups else 0.0
+        }
+        stats.update(self.backend.stats())
+
+        return stats
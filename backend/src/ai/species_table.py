@@ -0,0 +1,185 @@
+"""
+AquaFarm Pro - Species Coefficient Table
+Array-backed feeding coefficients indexed by integer species id
+"""
+
+import csv
+import json
+import os
+from typing import Dict, Iterable, List, NamedTuple, Optional, Union
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+COEFFICIENT_FIELDS = (
+    'base_rate', 'temp_optimal', 'temp_min', 'temp_max',
+    'oxygen_min', 'ph_optimal', 'ph_min', 'ph_max'
+)
+
+class SpeciesCoefficients(NamedTuple):
+    """
+    Coefficients of one species (scalar rule path)
+    """
+    species: str
+    base_rate: float
+    temp_optimal: float
+    temp_min: float
+    temp_max: float
+    oxygen_min: float
+    ph_optimal: float
+    ph_min: float
+    ph_max: float
+
+class SpeciesCoefficientTable:
+    """
+    Species feeding coefficients compiled into one float64 array
+
+    Row i holds the COEFFICIENT_FIELDS of species id i. Names are resolved
+    to ids once (encode), after which every lookup is an integer gather.
+    Unknown species resolve to the default species. The table holds only
+    a list of names and a NumPy array, so it is cheap to pickle or share
+    with worker processes.
+    """
+
+    def __init__(self, names: List[str], values: np.ndarray, default: Optional[str] = 'tilapia'):
+        values = np.asarray(values, dtype=np.float64)
+        if default is None and names:
+            default = names[0]
+        if values.shape != (len(names), len(COEFFICIENT_FIELDS)):
+            raise ValueError(f"Expected a ({len(names)}, {len(COEFFICIENT_FIELDS)}) coefficient array, "
+                             f"got {values.shape}")
+        if default not in names:
+            raise ValueError(f"Default species {default} is not in the table")
+
+        self.names = list(names)
+        self.values = values
+        self.default = default
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        self.default_id = self.ids[default]
+        self._index = pd.Index(self.names)
+        self._rows = [SpeciesCoefficients(name, *map(float, row)) for name, row in zip(self.names, values)]
+
+    @classmethod
+    def from_dict(cls, coefficients: Dict[str, Dict],
+                  default: Optional[str] = 'tilapia') -> 'SpeciesCoefficientTable':
+        """
+        Build from the species_coefficients dict layout
+
+        The pH bounds may be given as 'ph_range': (min, max) or as
+        'ph_min' and 'ph_max'. default=None uses the first species.
+        """
+        names = list(coefficients)
+        values = np.empty((len(names), len(COEFFICIENT_FIELDS)), dtype=np.float64)
+
+        for i, name in enumerate(names):
+            coeffs = dict(coefficients[name])
+            if 'ph_range' in coeffs:
+                coeffs['ph_min'], coeffs['ph_max'] = coeffs.pop('ph_range')
+
+            missing = [field for field in COEFFICIENT_FIELDS if field not in coeffs]
+            if missing:
+                raise ValueError(f"Species {name} is missing coefficients: {missing}")
+
+            values[i] = [coeffs[field] for field in COEFFICIENT_FIELDS]
+
+        return cls(names, values, default)
+
+    @classmethod
+    def from_file(cls, filepath: str, default: Optional[str] = 'tilapia') -> 'SpeciesCoefficientTable':
+        """
+        Load species from a JSON file (species_coefficients layout) or a CSV
+        file with a 'species' column plus one column per coefficient
+        """
+        if os.path.splitext(filepath)[1].lower() == '.csv':
+            with open(filepath, newline='') as f:
+                coefficients = {
+                    row.pop('species'): {field: float(value) for field, value in row.items()}
+                    for row in csv.DictReader(f)
+                }
+        else:
+            with open(filepath) as f:
+                coefficients = json.load(f)
+
+        logger.info(f"Loaded {len(coefficients)} species from {filepath}")
+        return cls.from_dict(coefficients, default)
+
+    def with_species(self, other: Union['SpeciesCoefficientTable', Dict[str, Dict]]) -> 'SpeciesCoefficientTable':
+        """
+        New table with other's species added (or replacing same-named ones)
+
+        Existing species keep their ids, so encoded arrays stay valid.
+        """
+        if isinstance(other, dict):
+            other = SpeciesCoefficientTable.from_dict(other, default=None)
+
+        names = list(self.names)
+        values = [row for row in self.values]
+        for name, row in zip(other.names, other.values):
+            if name in self.ids:
+                values[self.ids[name]] = row
+            else:
+                names.append(name)
+                values.append(row)
+
+        return SpeciesCoefficientTable(names, np.vstack(values), self.default)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.ids
+
+    def id_of(self, name: str) -> int:
+        """
+        Species id of a name; unknown names map to the default species
+        """
+        return self.ids.get(name, self.default_id)
+
+    def lookup(self, name: str) -> SpeciesCoefficients:
+        """
+        Coefficients of one species (unknown names give the default species)
+        """
+        return self._rows[self.ids.get(name, self.default_id)]
+
+    def encode(self, species: Iterable) -> np.ndarray:
+        """
+        Species ids for an array of names (unknown names give the default id)
+
+        Integer input is treated as ids already and returned unchanged.
+        """
+        species = np.asarray(species)
+        if species.dtype.kind in 'iu':
+            return species.astype(np.intp, copy=False)
+
+        ids = self._index.get_indexer(species.astype(object))
+        ids[ids < 0] = self.default_id
+
+        return ids
+
+    def gather(self, ids: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Per-row coefficient arrays for an array of species ids
+        """
+        rows = self.values[ids]
+        return {field: rows[:, i] for i, field in enumerate(COEFFICIENT_FIELDS)}
+
+    def to_dict(self) -> Dict[str, Dict]:
+        """
+        Species coefficients in the species_coefficients dict layout
+        """
+        coefficients = {}
+        for row in self._rows:
+            coefficients[row.species] = {
+                'base_rate': row.base_rate,
+                'temp_optimal': row.temp_optimal,
+                'temp_min': row.temp_min,
+                'temp_max': row.temp_max,
+                'oxygen_min': row.oxygen_min,
+                'ph_optimal': row.ph_optimal,
+                'ph_range': (row.ph_min, row.ph_max)
+            }
+
+        return coefficients
@@ -0,0 +1,253 @@
+"""
+AquaFarm Pro - Training Data Utilities
+Shared training matrices and chunked training sources for the AI trainers
+"""
+
+import glob
+import os
+import shutil
+import tempfile
+import time
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+import logging
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet partitions are then read whole through pandas
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+PARTITION_EXTENSIONS = ('.csv', '.parquet', '.pq')
+
+class SharedTrainingMatrix:
+    """
+    Training arrays written once to a temporary directory as .npy files
+
+    Worker processes open them with mmap_mode='r', so the pages are shared
+    through the OS page cache instead of a pickled copy being sent to every
+    worker. Use as a context manager; the directory is removed on exit.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], directory: Optional[str] = None):
+        self.directory = tempfile.mkdtemp(prefix='aquafarm-train-', dir=directory)
+        self.paths = {}
+
+        for name, array in arrays.items():
+            path = os.path.join(self.directory, f"{name}.npy")
+            np.save(path, np.ascontiguousarray(array))
+            self.paths[name] = path
+
+    def __getitem__(self, name: str) -> str:
+        return self.paths[name]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Remove the backing files
+        """
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+def fit_on_shared_matrix(estimator, X_path: str, y_path: str,
+                         y_column: Optional[int] = None,
+                         rows: Optional[np.ndarray] = None) -> Tuple[object, float]:
+    """
+    Fit an estimator on memory-mapped training arrays (process pool worker)
+
+    Returns the fitted estimator and the fit wall-clock time in seconds.
+    """
+    X = np.load(X_path, mmap_mode='r')
+    y = np.load(y_path, mmap_mode='r')
+
+    if y_column is not None:
+        y = y[:, y_column]
+    if rows is not None:
+        X, y = X[rows], y[rows]
+
+    start = time.perf_counter()
+    estimator.fit(X, y)
+
+    return estimator, time.perf_counter() - start
+
+class ChunkedTrainingSource:
+    """
+    Training history stored as CSV or Parquet partitions, read lazily in chunks
+
+    paths may be a file, a directory (every partition inside it), a glob
+    pattern or a list of files. Only the requested columns are read and
+    float64 columns are downcast to float32, so a chunk holds only what the
+    trainer needs. Iterating the source again re-reads the partitions.
+    """
+
+    def __init__(self, paths: Union[str, Sequence[str]], columns: Optional[List[str]] = None,
+                 chunk_size: int = 100_000, downcast: bool = True):
+        self.paths = self._resolve(paths)
+        self.columns = columns
+        self.chunk_size = chunk_size
+        self.downcast = downcast
+
+        if not self.paths:
+            raise ValueError(f"No CSV or Parquet partitions found in {paths}")
+
+    @staticmethod
+    def _resolve(paths: Union[str, Sequence[str]]) -> List[str]:
+        if not isinstance(paths, str):
+            return list(paths)
+        if os.path.isdir(paths):
+            return sorted(
+                os.path.join(paths, name) for name in os.listdir(paths)
+                if name.lower().endswith(PARTITION_EXTENSIONS)
+            )
+        if os.path.isfile(paths):
+            return [paths]
+        return sorted(glob.glob(paths))
+
+    def with_columns(self, columns: List[str]) -> 'ChunkedTrainingSource':
+        """
+        Same partitions, reading only the given columns (missing ones are skipped)
+        """
+        return ChunkedTrainingSource(self.paths, columns, self.chunk_size, self.downcast)
+
+    def __iter__(self) -> Iterator[pd.DataFrame]:
+        for path in self.paths:
+            if path.lower().endswith('.csv'):
+                chunks = self._read_csv(path)
+            else:
+                chunks = self._read_parquet(path)
+
+            for chunk in chunks:
+                yield self._downcast(chunk) if self.downcast else chunk
+
+    def _read_csv(self, path: str) -> Iterator[pd.DataFrame]:
+        columns = set(self.columns) if self.columns is not None else None
+        usecols = (lambda col: col in columns) if columns is not None else None
+        yield from pd.read_csv(path, usecols=usecols, chunksize=self.chunk_size)
+
+    def _read_parquet(self, path: str) -> Iterator[pd.DataFrame]:
+        if pq is not None:
+            parquet_file = pq.ParquetFile(path)
+            columns = self.columns
+            if columns is not None:
+                columns = [col for col in columns if col in parquet_file.schema_arrow.names]
+
+            for batch in parquet_file.iter_batches(batch_size=self.chunk_size, columns=columns):
+                yield batch.to_pandas()
+            return
+
+        frame = pd.read_parquet(path)
+        if self.columns is not None:
+            frame = frame[[col for col in self.columns if col in frame.columns]]
+        for start in range(0, len(frame), self.chunk_size):
+            yield frame.iloc[start:start + self.chunk_size]
+
+    @staticmethod
+    def _downcast(chunk: pd.DataFrame) -> pd.DataFrame:
+        floats = chunk.select_dtypes(include='float64').columns
+        if len(floats):
+            chunk = chunk.astype({col: np.float32 for col in floats})
+        return chunk
+
+class ReservoirSample:
+    """
+    Uniform random sample of at most capacity rows from a stream of chunks
+
+    Vectorized Algorithm R: row t of the stream replaces a random slot with
+    probability capacity / (t + 1), so memory stays bounded by capacity
+    regardless of how many rows are seen.
+    """
+
+    def __init__(self, capacity: int, seed: int = 42):
+        if capacity <= 0:
+            raise ValueError(f"Reservoir capacity must be positive, got {capacity}")
+        self.capacity = capacity
+        self.rows_seen = 0
+        self._rng = np.random.default_rng(seed)
+        self._sample = None
+
+    def add(self, chunk: pd.DataFrame):
+        chunk = chunk.reset_index(drop=True)
+        n_rows = len(chunk)
+        fill = min(max(self.capacity - self.rows_seen, 0), n_rows)
+
+        if fill:
+            head = chunk.iloc[:fill]
+            self._sample = head.copy() if self._sample is None else pd.concat(
+                [self._sample, head], ignore_index=True
+            )
+
+        if fill < n_rows:
+            stream_index = self.rows_seen + np.arange(fill, n_rows)
+            slots = self._rng.integers(0, stream_index + 1)
+            replaced = slots < self.capacity
+
+            rows = np.arange(fill, n_rows)[replaced]
+            slots = slots[replaced]
+
+            # Later rows win when several target the same slot, as in the
+            # sequential algorithm
+            _, last = np.unique(slots[::-1], return_index=True)
+            keep = len(slots) - 1 - last
+            for j, col in enumerate(self._sample.columns):
+                self._sample.iloc[slots[keep], j] = chunk[col].to_numpy()[rows[keep]]
+
+        self.rows_seen += n_rows
+
+    def frame(self) -> pd.DataFrame:
+        return self._sample if self._sample is not None else pd.DataFrame()
+
+class StratifiedSample:
+    """
+    Reservoir sample per class of a label column (rare classes are kept)
+    """
+
+    def __init__(self, column: str, capacity_per_class: int, seed: int = 42):
+        if capacity_per_class <= 0:
+            raise ValueError(f"Capacity per class must be positive, got {capacity_per_class}")
+        self.column = column
+        self.capacity_per_class = capacity_per_class
+        self.seed = seed
+        self.rows_seen = 0
+        self._reservoirs = {}
+
+    def add(self, chunk: pd.DataFrame):
+        for label, rows in chunk.groupby(self.column, sort=False):
+            if label not in self._reservoirs:
+                self._reservoirs[label] = ReservoirSample(
+                    self.capacity_per_class, self.seed + len(self._reservoirs)
+                )
+            self._reservoirs[label].add(rows)
+
+        self.rows_seen += len(chunk)
+
+    def frame(self) -> pd.DataFrame:
+        frames = [reservoir.frame() for reservoir in self._reservoirs.values()]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+def fit_and_score_on_shared_matrix(estimator, X_path: str, y_path: str,
+                                   train_rows: np.ndarray, test_rows: np.ndarray) -> Dict:
+    """
+    Fit on one cross-validation fold of memory-mapped arrays and score the
+    held-out rows (process pool worker)
+
+    Returns the score, fit time and boosting iterations actually run (when
+    early stopping applies).
+    """
+    estimator, fit_seconds = fit_on_shared_matrix(estimator, X_path, y_path, rows=train_rows)
+
+    X = np.load(X_path, mmap_mode='r')
+    y = np.load(y_path, mmap_mode='r')
+    score = estimator.score(X[test_rows], y[test_rows])
+
+    return {
+        'score': float(score),
+        'fit_seconds': fit_seconds,
+        'n_iter': int(getattr(estimator, 'n_estimators_', getattr(estimator, 'n_iter_', 0)))
+    }
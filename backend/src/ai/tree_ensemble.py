@@ -0,0 +1,372 @@
+"""
+AquaFarm Pro - Flattened Tree Ensembles
+Tree ensembles stored as contiguous NumPy node arrays
+"""
+
+import os
+import time
+from typing import Dict, Iterable, Optional
+import logging
+
+import numpy as np
+from scipy.special import expit, softmax
+from sklearn.dummy import DummyClassifier
+from sklearn.ensemble import GradientBoostingClassifier, RandomForestRegressor
+
+logger = logging.getLogger(__name__)
+
+class TreeEnsemble:
+    """
+    Tree ensemble flattened into contiguous node arrays
+
+    The nodes of every tree are concatenated into feature, threshold, left
+    and right arrays (absolute node indices, -1 at leaves) plus a value
+    array of shape (n_nodes, n_outputs); roots holds each tree's root node.
+    Arrays are plain ndarrays, so they can be saved uncompressed and loaded
+    with mmap_mode='r' to share pages across worker processes.
+
+    Two kinds are supported, mirroring the sklearn estimators they come from:
+    - 'forest_regressor': prediction is the mean of the tree values
+    - 'boosting_classifier': raw scores are base_score plus the sum of the
+      tree values (learning rate folded in), turned into probabilities with
+      softmax (multiclass) or the logistic function (binary)
+
+    Exposes the subset of the sklearn estimator API the AI models use
+    (predict, predict_proba, classes_, feature_importances_).
+
+    Exported ensembles compare float32 features like sklearn does and
+    reproduce its outputs. fold_scaler() returns a compiled ensemble whose
+    thresholds are expressed in raw feature units, so the StandardScaler
+    pass is skipped at predict time.
+    """
+
+    # Upper bound on rows x trees evaluated at once (bounds temporary memory)
+    max_chunk_cells = 1 << 18
+
+    ARRAY_FIELDS = ('feature', 'threshold', 'left', 'right', 'value', 'roots',
+                    'feature_importances')
+
+    def __init__(self, kind: str, arrays: Dict[str, np.ndarray], n_features: int,
+                 base_score: Optional[np.ndarray] = None,
+                 classes: Optional[np.ndarray] = None,
+                 input_dtype: str = 'float32'):
+        self.kind = kind
+        self.feature = arrays['feature']
+        self.threshold = arrays['threshold']
+        self.left = arrays['left']
+        self.right = arrays['right']
+        self.value = arrays['value']
+        self.roots = arrays['roots']
+        self.feature_importances_ = arrays['feature_importances']
+        self.n_features_in_ = n_features
+        self.base_score = base_score
+        self.classes_ = classes
+        self.input_dtype = np.dtype(input_dtype)
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def n_outputs(self) -> int:
+        return self.value.shape[1]
+
+    @classmethod
+    def from_sklearn(cls, estimator) -> 'TreeEnsemble':
+        """
+        Flatten a fitted RandomForestRegressor or GradientBoostingClassifier
+        """
+        if isinstance(estimator, TreeEnsemble):
+            return estimator
+
+        if isinstance(estimator, RandomForestRegressor):
+            trees = [(est.tree_, None) for est in estimator.estimators_]
+            n_outputs = estimator.n_outputs_
+            return cls('forest_regressor', _flatten_trees(trees, n_outputs, 1.0,
+                                                          estimator.feature_importances_),
+                       estimator.n_features_in_)
+
+        if isinstance(estimator, GradientBoostingClassifier):
+            if not (estimator.init_ == 'zero' or isinstance(estimator.init_, DummyClassifier)):
+                raise ValueError("Only constant init estimators can be flattened")
+
+            n_outputs = estimator.estimators_.shape[1]
+            trees = [
+                (estimator.estimators_[stage, k].tree_, k)
+                for stage in range(estimator.estimators_.shape[0])
+                for k in range(n_outputs)
+            ]
+            base_score = estimator._raw_predict_init(
+                np.zeros((1, estimator.n_features_in_), dtype=np.float32)
+            )[0].astype(np.float64)
+
+            return cls('boosting_classifier',
+                       _flatten_trees(trees, n_outputs, estimator.learning_rate,
+                                      estimator.feature_importances_),
+                       estimator.n_features_in_, base_score, estimator.classes_)
+
+        raise TypeError(f"Cannot flatten {type(estimator).__name__}")
+
+    def save(self, directory: str, name: str) -> Dict:
+        """
+        Write the node arrays as uncompressed .npy files
+
+        Returns the JSON-serializable description needed by load().
+        """
+        for field in self.ARRAY_FIELDS:
+            np.save(os.path.join(directory, f"{name}.{field}.npy"),
+                    np.ascontiguousarray(getattr(self, _attribute(field))))
+
+        return {
+            'kind': self.kind,
+            'n_features': int(self.n_features_in_),
+            'base_score': None if self.base_score is None else self.base_score.tolist(),
+            'classes': None if self.classes_ is None else self.classes_.tolist(),
+            'input_dtype': self.input_dtype.name
+        }
+
+    @classmethod
+    def load(cls, directory: str, name: str, description: Dict,
+             mmap_mode: Optional[str] = 'r') -> 'TreeEnsemble':
+        """
+        Load node arrays written by save(), memory-mapped by default
+        """
+        arrays = {
+            field: np.load(os.path.join(directory, f"{name}.{field}.npy"), mmap_mode=mmap_mode)
+            for field in cls.ARRAY_FIELDS
+        }
+        base_score = description.get('base_score')
+        classes = description.get('classes')
+
+        return cls(
+            description['kind'], arrays, description['n_features'],
+            None if base_score is None else np.array(base_score, dtype=np.float64),
+            None if classes is None else np.array(classes),
+            description.get('input_dtype', 'float32')
+        )
+
+    def fold_scaler(self, scaler) -> 'TreeEnsemble':
+        """
+        Compiled copy with a fitted StandardScaler folded into the thresholds
+
+        A split float32((x - mean) / scale) <= t becomes x <= T for raw
+        float64 features, where T is the exact boundary of the original test
+        (see _fold_thresholds), so splits are unchanged. Node arrays other
+        than threshold are shared with this ensemble.
+        """
+        n_features = self.n_features_in_
+        mean = scaler.mean_ if scaler.with_mean else np.zeros(n_features)
+        scale = scaler.scale_ if scaler.with_std else np.ones(n_features)
+
+        internal = self.left != -1
+        feature = self.feature[internal]
+        threshold = np.array(self.threshold, dtype=np.float64)
+        threshold[internal] = _fold_thresholds(
+            threshold[internal], mean[feature], scale[feature],
+            self.input_dtype == np.float32
+        )
+
+        arrays = {field: getattr(self, _attribute(field)) for field in self.ARRAY_FIELDS}
+        arrays['threshold'] = threshold
+
+        return TreeEnsemble(self.kind, arrays, n_features, self.base_score,
+                            self.classes_, 'float64')
+
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        """
+        Leaf node index reached by every row in every tree, shape (n_rows, n_trees)
+
+        All trees advance one level per step over the whole batch, in row
+        chunks of at most max_chunk_cells rows x trees.
+        """
+        X = np.asarray(X, dtype=self.input_dtype)
+        n_rows = X.shape[0]
+        leaves = np.empty((n_rows, self.n_trees), dtype=np.intp)
+        chunk_rows = max(1, self.max_chunk_cells // max(1, self.n_trees))
+
+        for start in range(0, n_rows, chunk_rows):
+            X_chunk = X[start:start + chunk_rows]
+            rows = np.arange(len(X_chunk))[:, None]
+            node = np.repeat(self.roots[None, :].astype(np.intp), len(X_chunk), axis=0)
+
+            while True:
+                left = self.left[node]
+                internal = left != -1
+                if not internal.any():
+                    break
+
+                go_left = X_chunk[rows, self.feature[node]] <= self.threshold[node]
+                node = np.where(internal, np.where(go_left, left, self.right[node]), node)
+
+            leaves[start:start + len(X_chunk)] = node
+
+        return leaves
+
+    def raw_predict(self, X: np.ndarray) -> np.ndarray:
+        """
+        Accumulated tree values, shape (n_rows, n_outputs)
+
+        Values are summed tree by tree (a running cumsum), the same order
+        sklearn accumulates boosting stages in.
+        """
+        leaves = self.apply(X)
+        raw = np.empty((leaves.shape[0], self.n_outputs), dtype=np.float64)
+        base = self.base_score if self.base_score is not None else np.zeros(self.n_outputs)
+        chunk_rows = max(1, self.max_chunk_cells // max(1, self.n_trees))
+
+        for start in range(0, leaves.shape[0], chunk_rows):
+            chunk = leaves[start:start + chunk_rows]
+            terms = np.empty((len(chunk), self.n_trees + 1, self.n_outputs), dtype=np.float64)
+            terms[:, 0] = base
+            terms[:, 1:] = self.value[chunk]
+            raw[start:start + len(chunk)] = np.cumsum(terms, axis=1)[:, -1]
+
+        return raw
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        if self.kind == 'boosting_classifier':
+            return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
+
+        prediction = self.raw_predict(X) / self.n_trees
+        return prediction[:, 0] if self.n_outputs == 1 else prediction
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        if self.kind != 'boosting_classifier':
+            raise AttributeError("predict_proba is only available for classifiers")
+
+        raw = self.raw_predict(X)
+        if self.n_outputs == 1:
+            positive = expit(raw[:, 0])
+            return np.column_stack([1 - positive, positive])
+
+        return softmax(raw, axis=1)
+
+def _fold_thresholds(threshold: np.ndarray, mean: np.ndarray, scale: np.ndarray,
+                     float32_inputs: bool) -> np.ndarray:
+    """
+    Largest raw float64 x per split that still takes the left branch
+
+    The scaled test is monotone in x, so its boundary is found by bracketing
+    around t * scale + mean and bisecting until the bracket is two adjacent
+    floats.
+    """
+    def goes_left(x):
+        scaled = (x - mean) / scale
+        if float32_inputs:
+            scaled = scaled.astype(np.float32)
+        return scaled <= threshold
+
+    guess = threshold * scale + mean
+    lo, hi = guess.copy(), guess.copy()
+
+    # Widen until every bracket satisfies goes_left(lo) and not goes_left(hi)
+    for bound, moves_left in ((lo, True), (hi, False)):
+        width = np.abs(guess) * 1e-7 + 1e-12
+        for _ in range(2048):
+            outside = goes_left(bound) != moves_left
+            if not outside.any():
+                break
+            bound[outside] += -width[outside] if moves_left else width[outside]
+            width[outside] *= 2
+
+    for _ in range(2048):
+        mid = lo + (hi - lo) / 2
+        active = (mid > lo) & (mid < hi)
+        if not active.any():
+            break
+        left = goes_left(mid)
+        lo = np.where(active & left, mid, lo)
+        hi = np.where(active & ~left, mid, hi)
+
+    return lo
+
+def _attribute(field: str) -> str:
+    return 'feature_importances_' if field == 'feature_importances' else field
+
+def _flatten_trees(trees, n_outputs: int, scale: float,
+                   feature_importances: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Concatenate sklearn Tree objects into absolute-index node arrays
+
+    trees is a list of (tree, output) pairs; output None means the tree
+    predicts every output (forests), an int means it adds to that output
+    column only (one tree per class in gradient boosting). Leaf values are
+    multiplied by scale (the boosting learning rate).
+    """
+    sizes = [tree.node_count for tree, _ in trees]
+    offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int64)
+    n_nodes = int(np.sum(sizes))
+
+    feature = np.empty(n_nodes, dtype=np.int32)
+    threshold = np.empty(n_nodes, dtype=np.float64)
+    left = np.empty(n_nodes, dtype=np.int32)
+    right = np.empty(n_nodes, dtype=np.int32)
+    value = np.zeros((n_nodes, n_outputs), dtype=np.float64)
+
+    for (tree, output), offset, size in zip(trees, offsets, sizes):
+        nodes = slice(offset, offset + size)
+        is_leaf = tree.children_left == -1
+
+        feature[nodes] = np.where(is_leaf, 0, tree.feature)
+        threshold[nodes] = tree.threshold
+        left[nodes] = np.where(is_leaf, -1, tree.children_left + offset)
+        right[nodes] = np.where(is_leaf, -1, tree.children_right + offset)
+
+        tree_value = tree.value[:, :, 0]
+        if output is None:
+            value[nodes] = tree_value * scale if scale != 1.0 else tree_value
+        else:
+            value[nodes, output] = scale * tree_value[:, 0]
+
+    return {
+        'feature': feature,
+        'threshold': threshold,
+        'left': left,
+        'right': right,
+        'value': value,
+        'roots': offsets,
+        'feature_importances': np.asarray(feature_importances, dtype=np.float64)
+    }
+
+def benchmark_against_sklearn(estimator, scaler, X: np.ndarray,
+                              batch_sizes: Iterable[int] = (1, 10, 100, 1000, 10_000, 100_000),
+                              repeats: int = 3) -> Dict[int, Dict[str, float]]:
+    """
+    Compare the compiled (scaler-folded) engine with scaler + sklearn per batch size
+
+    X holds unscaled features; rows are reused cyclically for batches larger
+    than X. Reports the best-of-repeats time of each path and the largest
+    absolute output difference.
+    """
+    compiled = TreeEnsemble.from_sklearn(estimator).fold_scaler(scaler)
+    X_raw = np.asarray(X, dtype=np.float64)
+    method = 'predict_proba' if compiled.kind == 'boosting_classifier' else 'predict'
+
+    def best_time(predict, batch):
+        best, output = float('inf'), None
+        for _ in range(repeats):
+            start = time.perf_counter()
+            output = predict(batch)
+            best = min(best, time.perf_counter() - start)
+        return best, output
+
+    results = {}
+    for size in batch_sizes:
+        rows = np.arange(size) % len(X_raw)
+        # Keep DataFrame input for the scaler so feature names are checked as usual
+        batch = X.iloc[rows] if hasattr(X, 'iloc') else X_raw[rows]
+
+        sklearn_seconds, expected = best_time(
+            lambda b: getattr(estimator, method)(scaler.transform(b)), batch
+        )
+        compiled_seconds, actual = best_time(getattr(compiled, method), X_raw[rows])
+
+        results[size] = {
+            'sklearn_rows_per_second': size / sklearn_seconds,
+            'compiled_rows_per_second': size / compiled_seconds,
+            'speedup': sklearn_seconds / compiled_seconds,
+            'max_abs_diff': float(np.max(np.abs(np.asarray(expected) - np.asarray(actual))))
+        }
+        logger.info(f"Batch {size}: {results[size]}")
+
+    return results
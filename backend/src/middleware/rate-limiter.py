@@ -3,51 +3,410 @@ AquaFarm Pro - Rate Limiting Middleware
 Per-tenant rate limiting for API protection
 """
 
+import atexit
+import json
+import sys
+import threading
 import time
 import redis
-from typing import Dict, Optional, Tuple
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+from typing import Callable, Dict, List, Mapping, Optional, Tuple
 from functools import wraps
 from flask import request, jsonify, g
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Server-side rate limit algorithms, each run atomically in one round trip.
+# KEYS[1] = state key, KEYS[2] (optional) = the tenant's key set; ARGV = max
+# requests, window (seconds), cost (requests to consume; 0 only reads,
+# negative returns unused ones), burst (gcra only).
+# Every script returns {allowed (1/0), count, remaining, reset seconds} and
+# keeps O(1) state per key. A key left behind by a different algorithm is
+# replaced rather than misread.
+
+# Shared prelude: record KEYS[1] in the tenant's key set, a sorted set
+# scored by the unix time by which the key will have expired. Members past
+# their score are trimmed on every write, so per-user keys do not pile up,
+# and the set lives at least as long as its newest member. A plain set
+# left by the former layout is converted, scoring its members with the
+# set's own expiry.
+TRACK_KEY_LUA = """
+local function track(seconds)
+    if KEYS[2] then
+        local now = tonumber(redis.call('TIME')[1])
+        if redis.call('TYPE', KEYS[2]).ok == 'set' then
+            local expires = now + math.max(redis.call('TTL', KEYS[2]), 0)
+            local members = redis.call('SMEMBERS', KEYS[2])
+            redis.call('DEL', KEYS[2])
+            for _, member in ipairs(members) do
+                redis.call('ZADD', KEYS[2], expires, member)
+            end
+        end
+
+        redis.call('ZADD', KEYS[2], now + seconds, KEYS[1])
+        redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', '(' .. now)
+        if redis.call('TTL', KEYS[2]) < seconds then
+            redis.call('EXPIRE', KEYS[2], seconds)
+        end
+    end
+end
+"""
+
+# Fixed window: one counter that expires with the window
+FIXED_WINDOW_SCRIPT = TRACK_KEY_LUA + """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+
+local kind = redis.call('TYPE', KEYS[1]).ok
+if kind ~= 'none' and kind ~= 'string' then
+    redis.call('DEL', KEYS[1])
+end
+
+local count = tonumber(redis.call('GET', KEYS[1]) or '0')
+local allowed = count + cost <= limit
+if allowed and cost ~= 0 then
+    count = redis.call('INCRBY', KEYS[1], cost)
+    if redis.call('TTL', KEYS[1]) == -1 then
+        redis.call('EXPIRE', KEYS[1], window)
+    end
+    track(window)
+end
+
+local ttl = redis.call('TTL', KEYS[1])
+if ttl < 0 then
+    ttl = window
+end
+
+return {allowed and 1 or 0, count, math.max(limit - count, 0), ttl}
+"""
+
+# Sliding window counter: this window's and the previous window's counts,
+# with the previous one weighted by how much of it still overlaps the
+# sliding window. Stored as a hash {window, current, previous}.
+SLIDING_WINDOW_SCRIPT = TRACK_KEY_LUA + """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+
+local kind = redis.call('TYPE', KEYS[1]).ok
+if kind ~= 'none' and kind ~= 'hash' then
+    redis.call('DEL', KEYS[1])
+end
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local index = math.floor(now / window)
+local elapsed = now - index * window
+
+local state = redis.call('HMGET', KEYS[1], 'window', 'current', 'previous')
+local stored = tonumber(state[1]) or index
+local current = tonumber(state[2]) or 0
+local previous = tonumber(state[3]) or 0
+if stored ~= index then
+    if stored == index - 1 then
+        previous = current
+    else
+        previous = 0
+    end
+    current = 0
+end
+
+local weighted = previous * (window - elapsed) / window + current
+if weighted + cost > limit then
+    -- Wait until enough of the previous window has slid out
+    local retry = window - elapsed
+    if previous > 0 and limit - current - cost >= 0 then
+        retry = retry - (limit - current - cost) * window / previous
+    end
+    local count = math.ceil(weighted)
+    return {0, count, math.max(limit - count, 0), math.ceil(retry)}
+end
+
+if cost ~= 0 then
+    current = math.max(current + cost, 0)
+    redis.call('HSET', KEYS[1], 'window', index, 'current', current, 'previous', previous)
+    redis.call('EXPIRE', KEYS[1], 2 * window)
+    track(2 * window)
+end
+
+local count = math.ceil(weighted + cost)
+return {1, count, math.max(limit - count, 0), math.ceil(window - elapsed)}
+"""
+
+# GCRA (token bucket without a refill loop): the theoretical arrival time
+# of the next request advances by window / limit per request, and up to
+# burst requests may be early. Stored as a hash {tat} in milliseconds.
+GCRA_SCRIPT = TRACK_KEY_LUA + """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local burst = tonumber(ARGV[4])
+
+local kind = redis.call('TYPE', KEYS[1]).ok
+if kind ~= 'none' and kind ~= 'hash' then
+    redis.call('DEL', KEYS[1])
+end
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + tonumber(time[2]) / 1000
+local interval = window * 1000 / limit
+local tolerance = interval * burst
+
+local tat = tonumber(redis.call('HGET', KEYS[1], 'tat')) or now
+if tat < now then
+    tat = now
+end
+
+local new_tat = tat + interval * cost
+if new_tat - now > tolerance then
+    local count = math.ceil((tat - now) / interval)
+    local retry = (new_tat - tolerance - now) / 1000
+    return {0, count, math.max(burst - count, 0), math.ceil(retry)}
+end
+
+if cost ~= 0 then
+    redis.call('HSET', KEYS[1], 'tat', string.format('%.3f', new_tat))
+    redis.call('PEXPIRE', KEYS[1], math.ceil(new_tat - now))
+    track(math.max(math.ceil((new_tat - now) / 1000), 1))
+end
+
+local count = math.ceil((new_tat - now) / interval)
+return {1, count, math.max(burst - count, 0), math.ceil((new_tat - now) / 1000)}
+"""
+
+RATE_LIMIT_SCRIPTS = {
+    'fixed_window': FIXED_WINDOW_SCRIPT,
+    'sliding_window': SLIDING_WINDOW_SCRIPT,
+    'gcra': GCRA_SCRIPT
+}
+
+# 'algorithm' is one of RATE_LIMIT_SCRIPTS (default 'fixed_window');
+# 'gcra' also takes 'burst', the requests allowed back to back
+# (default: the whole limit)
+DEFAULT_LIMITS = {
+    'api': {'requests': 1000, 'window': 3600, 'algorithm': 'fixed_window'},  # 1000 requests per hour
+    'auth': {'requests': 10, 'window': 300, 'algorithm': 'fixed_window'},     # 10 requests per 5 minutes
+    'upload': {'requests': 50, 'window': 3600, 'algorithm': 'fixed_window'}, # 50 uploads per hour
+    'ai': {'requests': 100, 'window': 3600, 'algorithm': 'fixed_window'},    # 100 AI requests per hour
+    # 10000 IoT requests per hour; sliding so gateways reconnecting on
+    # the hour cannot get two windows' worth at the boundary
+    'iot': {'requests': 10000, 'window': 3600, 'algorithm': 'sliding_window'}
+}
+
+# Per-plan overrides of the default limits, by endpoint type
+PLAN_LIMITS = {
+    'standard': {},
+    'premium': {
+        'api': {'requests': 5000},
+        'ai': {'requests': 500},
+        'upload': {'requests': 200}
+    },
+    'enterprise': {
+        'api': {'requests': 20000},
+        'ai': {'requests': 2000},
+        'upload': {'requests': 1000}
+    }
+}
+
+# Plan of tenants that are not in the tenant table, by tenant id prefix
+PLAN_PREFIXES = (('premium_', 'premium'), ('enterprise_', 'enterprise'))
+
+class TenantLimitsResolver:
+    """
+    Resolve a tenant's rate limits from a plan table
+    
+    Each plan's limits are built once as read-only mappings (shared by all
+    tenants on the plan, so they cannot be changed through one request).
+    default_limits is copied into the same read-only form. A tenant's plan
+    comes from tenant_plans, then plan_lookup (e.g. a database query),
+    then its id prefix, else 'standard'. Resolved tenants are kept in an
+    LRU cache with a TTL, so a hit is one dict lookup and allocates
+    nothing. Call invalidate when a tenant's plan changes.
+    """
+    
+    def __init__(self, default_limits: Dict[str, Dict], plans: Optional[Dict[str, Dict]] = None,
+                 tenant_plans: Optional[Dict[str, str]] = None,
+                 plan_lookup: Optional[Callable[[str], Optional[str]]] = None,
+                 cache_size: int = 10000, ttl: Optional[float] = 300):
+        self.default_limits = MappingProxyType({
+            endpoint_type: MappingProxyType(dict(config))
+            for endpoint_type, config in default_limits.items()
+        })
+        self.tenant_plans = dict(tenant_plans or {})
+        self.plan_lookup = plan_lookup
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.set_plans(PLAN_LIMITS if plans is None else plans)
+    
+    @classmethod
+    def from_file(cls, filepath: str, default_limits: Dict[str, Dict], **kwargs) -> 'TenantLimitsResolver':
+        """
+        Load plans and tenant assignments from a JSON file:
+        {"plans": {plan: {endpoint: {overrides}}}, "tenants": {tenant_id: plan}}
+        
+        Plans in the file are added to (or replace) PLAN_LIMITS.
+        """
+        with open(filepath) as f:
+            config = json.load(f)
+        
+        logger.info(f"Loaded {len(config.get('plans', {}))} plans and "
+                    f"{len(config.get('tenants', {}))} tenants from {filepath}")
+        return cls(default_limits, plans={**PLAN_LIMITS, **config.get('plans', {})},
+                   tenant_plans=config.get('tenants'), **kwargs)
+    
+    def set_plans(self, plans: Dict[str, Dict]):
+        """
+        Replace the plan table and drop every cached tenant
+        """
+        if 'standard' not in plans:
+            plans = dict(plans, standard={})
+        
+        self.plans = {name: self._freeze(overrides) for name, overrides in plans.items()}
+        self.invalidate()
+    
+    def _freeze(self, overrides: Dict[str, Dict]) -> Mapping[str, Mapping]:
+        limits = {}
+        for endpoint_type in {**self.default_limits, **overrides}:
+            config = dict(self.default_limits.get(endpoint_type, {}))
+            config.update(overrides.get(endpoint_type, {}))
+            limits[endpoint_type] = MappingProxyType(config)
+        
+        return MappingProxyType(limits)
+    
+    def set_tenant_plan(self, tenant_id: str, plan: str):
+        """
+        Move a tenant to another plan
+        """
+        if plan not in self.plans:
+            raise ValueError(f"Unknown plan: {plan}")
+        
+        self.tenant_plans[tenant_id] = plan
+        self.invalidate(tenant_id)
+    
+    def invalidate(self, tenant_id: Optional[str] = None):
+        """
+        Drop one tenant (or every tenant) from the cache
+        """
+        with self._lock:
+            if tenant_id is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(tenant_id, None)
+    
+    def plan_for(self, tenant_id: str) -> str:
+        plan = self.tenant_plans.get(tenant_id)
+        if plan is None and self.plan_lookup is not None:
+            plan = self.plan_lookup(tenant_id)
+        if plan is None:
+            plan = next((name for prefix, name in PLAN_PREFIXES if tenant_id.startswith(prefix)), 'standard')
+        
+        if plan not in self.plans:
+            logger.error(f"Tenant {tenant_id} has unknown plan {plan}, using standard limits")
+            plan = 'standard'
+        
+        return plan
+    
+    def resolve(self, tenant_id: str) -> Mapping[str, Mapping]:
+        """
+        Read-only {endpoint type: limit config} for a tenant
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(tenant_id)
+            if entry is not None and (entry[1] is None or now < entry[1]):
+                self._cache.move_to_end(tenant_id)
+                self.hits += 1
+                return entry[0]
+        
+        limits = self.plans[self.plan_for(tenant_id)]
+        expires_at = now + self.ttl if self.ttl is not None else None
+        
+        with self._lock:
+            self.misses += 1
+            self._cache[tenant_id] = (limits, expires_at)
+            self._cache.move_to_end(tenant_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        
+        return limits
+
 class RateLimiter:
     """
     Rate limiter with per-tenant support
     """
     
-    def __init__(self, redis_client: redis.Redis):
+    def __init__(self, redis_client: redis.Redis,
+                 limits_resolver: Optional[TenantLimitsResolver] = None):
         self.redis = redis_client
-        self.default_limits = {
-            'api': {'requests': 1000, 'window': 3600},  # 1000 requests per hour
-            'auth': {'requests': 10, 'window': 300},     # 10 requests per 5 minutes
-            'upload': {'requests': 50, 'window': 3600}, # 50 uploads per hour
-            'ai': {'requests': 100, 'window': 3600},    # 100 AI requests per hour
-            'iot': {'requests': 10000, 'window': 3600}  # 10000 IoT requests per hour
+        self.limits_resolver = limits_resolver or TenantLimitsResolver(DEFAULT_LIMITS)
+        self.default_limits = self.limits_resolver.default_limits
+        
+        # Loaded once per server; later calls are a single EVALSHA
+        self._scripts = {
+            name: self.redis.register_script(script)
+            for name, script in RATE_LIMIT_SCRIPTS.items()
         }
     
     def get_tenant_limits(self, tenant_id: str) -> Dict[str, Dict]:
         """
-        Get rate limits for a specific tenant
+        Get rate limits for a specific tenant (read-only, see TenantLimitsResolver)
+        """
+        return self.limits_resolver.resolve(tenant_id)
+    
+    def _key(self, tenant_id: str, endpoint_type: str, user_id: str = None) -> str:
+        """
+        rate_limit:{tenant}:endpoint[:user]
+        
+        The braces are a Redis Cluster hash tag, so all of a tenant's keys
+        and its key set (_index_key) share a slot and one script can touch
+        both.
+        """
+        key_parts = [f"{{{tenant_id}}}", endpoint_type]
+        if user_id:
+            key_parts.append(user_id)
+        
+        return f"rate_limit:{':'.join(key_parts)}"
+    
+    def _index_key(self, tenant_id: str) -> str:
+        """
+        Sorted set of the tenant's rate limit keys that may still exist,
+        scored by expiry (see TRACK_KEY_LUA)
         """
-        # In production, this would fetch from database
-        # For now, return default limits with tenant-specific adjustments
-        limits = self.default_limits.copy()
+        return f"rate_limit:{{{tenant_id}}}:keys"
+    
+    def _run_script(self, key: str, limit_config: Mapping, cost: int = 1, client=None):
+        algorithm = limit_config.get('algorithm', 'fixed_window')
+        if algorithm not in self._scripts:
+            raise ValueError(f"Unknown rate limit algorithm: {algorithm}")
         
-        # Premium tenants get higher limits
-        if tenant_id.startswith('premium_'):
-            limits['api']['requests'] = 5000
-            limits['ai']['requests'] = 500
-            limits['upload']['requests'] = 200
+        # Tenant keys are tracked in their tenant's key set
+        keys = [key]
+        if key.startswith('rate_limit:{'):
+            keys.append(key[:key.index('}') + 1] + ':keys')
         
-        # Enterprise tenants get even higher limits
-        elif tenant_id.startswith('enterprise_'):
-            limits['api']['requests'] = 20000
-            limits['ai']['requests'] = 2000
-            limits['upload']['requests'] = 1000
+        return self._scripts[algorithm](
+            keys=keys,
+            args=[limit_config['requests'], limit_config['window'], cost,
+                  limit_config.get('burst', limit_config['requests'])],
+            client=client
+        )
+    
+    def _check(self, key: str, limit_config: Mapping, cost: int = 1) -> Tuple[bool, int, int, int]:
+        """
+        Run the endpoint's algorithm on key: (allowed, count, remaining, reset seconds)
         
-        return limits
+        cost=0 reads the current state without counting a request.
+        """
+        allowed, count, remaining, reset_time = self._run_script(key, limit_config, cost)
+        return bool(allowed), count, remaining, reset_time
     
     def is_allowed(self, tenant_id: str, endpoint_type: str, 
                    user_id: str = None) -> Tuple[bool, Dict]:
@@ -66,42 +425,27 @@ class RateLimiter:
             max_requests = limit_config['requests']
             
             # Create unique key for this tenant/endpoint/user combination
-            key_parts = [tenant_id, endpoint_type]
-            if user_id:
-                key_parts.append(user_id)
+            key = self._key(tenant_id, endpoint_type, user_id)
             
-            key = f"rate_limit:{':'.join(key_parts)}"
-            
-            # Get current count
-            current_count = self.redis.get(key)
-            if current_count is None:
-                current_count = 0
-            else:
-                current_count = int(current_count)
+            # Check and increment in one atomic round trip
+            allowed, current_count, remaining, reset_time = self._check(key, limit_config)
             
             # Check if limit exceeded
-            if current_count >= max_requests:
+            if not allowed:
                 return False, {
                     'limit_exceeded': True,
                     'current_count': current_count,
                     'max_requests': max_requests,
                     'window': window,
-                    'reset_time': self.redis.ttl(key)
+                    'reset_time': reset_time
                 }
             
-            # Increment counter
-            if current_count == 0:
-                # First request in window, set expiration
-                self.redis.setex(key, window, 1)
-            else:
-                # Increment existing counter
-                self.redis.incr(key)
-            
             return True, {
-                'current_count': current_count + 1,
+                'current_count': current_count,
                 'max_requests': max_requests,
                 'window': window,
-                'remaining': max_requests - (current_count + 1)
+                'remaining': remaining,
+                'reset_time': reset_time
             }
             
         except Exception as e:
@@ -113,21 +457,40 @@ class RateLimiter:
         """
         Get usage statistics for a tenant
         """
+        return self.get_usage_stats_many([tenant_id]).get(tenant_id, {})
+    
+    def get_usage_stats_many(self, tenant_ids: List[str], batch_size: int = 1000) -> Dict[str, Dict]:
+        """
+        Usage statistics for many tenants, one pipelined round trip per
+        batch_size tenants
+        
+        Every endpoint is read with its algorithm's script at cost 0, so
+        nothing is counted. Endpoints without usage are left out.
+        """
         try:
-            stats = {}
-            limits = self.get_tenant_limits(tenant_id)
+            stats = {tenant_id: {} for tenant_id in tenant_ids}
             
-            for endpoint_type, limit_config in limits.items():
-                key = f"rate_limit:{tenant_id}:{endpoint_type}"
-                current_count = self.redis.get(key)
+            for start in range(0, len(tenant_ids), batch_size):
+                pipe = self.redis.pipeline(transaction=False)
+                queued = []
+                for tenant_id in tenant_ids[start:start + batch_size]:
+                    for endpoint_type, limit_config in self.get_tenant_limits(tenant_id).items():
+                        self._run_script(self._key(tenant_id, endpoint_type), limit_config, cost=0, client=pipe)
+                        queued.append((tenant_id, endpoint_type, limit_config))
                 
-                if current_count is not None:
-                    stats[endpoint_type] = {
-                        'current_usage': int(current_count),
-                        'limit': limit_config['requests'],
-                        'window': limit_config['window'],
-                        'percentage': (int(current_count) / limit_config['requests']) * 100
-                    }
+                for (tenant_id, endpoint_type, limit_config), reply in zip(queued, pipe.execute()):
+                    _, current_count, remaining, _ = reply
+                    
+                    if current_count > 0:
+                        # Capacity is the burst for gcra, the request limit otherwise
+                        capacity = current_count + remaining
+                        stats[tenant_id][endpoint_type] = {
+                            'current_usage': current_count,
+                            'limit': limit_config['requests'],
+                            'window': limit_config['window'],
+                            'algorithm': limit_config.get('algorithm', 'fixed_window'),
+                            'percentage': (current_count / capacity) * 100
+                        }
             
             return stats
             
@@ -135,27 +498,344 @@ class RateLimiter:
             logger.error(f"Error getting usage stats: {e}")
             return {}
     
-    def reset_limits(self, tenant_id: str, endpoint_type: str = None):
+    def reset_limits(self, tenant_id: str, endpoint_type: str = None,
+                     include_untracked: bool = False, batch_size: int = 500):
         """
         Reset rate limits for a tenant
+        
+        The tenant's keys, per-user ones included, are read from its key set
+        with ZSCAN and removed with UNLINK in batches, so Redis never walks
+        the whole keyspace or blocks on freeing memory. include_untracked
+        also SCANs for keys in the former rate_limit:tenant:... layout.
         """
         try:
-            if endpoint_type:
-                # Reset specific endpoint
-                key = f"rate_limit:{tenant_id}:{endpoint_type}"
-                self.redis.delete(key)
+            index_key = self._index_key(tenant_id)
+            prefix = self._key(tenant_id, endpoint_type) if endpoint_type else None
+            batch = []
+            
+            # A key set in the former layout stays a plain set until the
+            # tenant's next write converts it
+            plain_set = self.redis.type(index_key) in (b'set', 'set')
+            if plain_set:
+                tracked = self.redis.sscan_iter(index_key, count=batch_size)
             else:
-                # Reset all endpoints for tenant
-                pattern = f"rate_limit:{tenant_id}:*"
-                keys = self.redis.keys(pattern)
-                if keys:
-                    self.redis.delete(*keys)
+                tracked = (key for key, _ in self.redis.zscan_iter(index_key, count=batch_size))
+            
+            for key in tracked:
+                key = key.decode() if isinstance(key, bytes) else key
+                if prefix and key != prefix and not key.startswith(prefix + ':'):
+                    continue
+                
+                batch.append(key)
+                if len(batch) >= batch_size:
+                    self._unlink(index_key, batch, plain_set)
+                    batch = []
+            
+            if include_untracked:
+                legacy_prefix = f"rate_limit:{tenant_id}:{endpoint_type}" if endpoint_type else None
+                for key in self.redis.scan_iter(match=f"rate_limit:{tenant_id}:*", count=batch_size):
+                    key = key.decode() if isinstance(key, bytes) else key
+                    if legacy_prefix and key != legacy_prefix and not key.startswith(legacy_prefix + ':'):
+                        continue
+                    
+                    batch.append(key)
+                    if len(batch) >= batch_size:
+                        self._unlink(index_key, batch, plain_set)
+                        batch = []
+            
+            self._unlink(index_key, batch, plain_set)
+            if endpoint_type is None:
+                self.redis.unlink(index_key)
             
             return True
             
         except Exception as e:
             logger.error(f"Error resetting limits: {e}")
             return False
+    
+    def _unlink(self, index_key: str, keys: List[str], plain_set: bool = False):
+        """
+        Unlink keys and drop them from the key set in one round trip
+        """
+        if keys:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.unlink(*keys)
+            if plain_set:
+                pipe.srem(index_key, *keys)
+            else:
+                pipe.zrem(index_key, *keys)
+            pipe.execute()
+
+class QuotaLease:
+    """
+    Requests one worker may still admit locally for one rate limit key
+    """
+    __slots__ = ('limit_config', 'size', 'tokens', 'expires_at', 'denied_until', 'remaining', 'refilling')
+    
+    def __init__(self, limit_config: Dict, expires_at: float):
+        self.limit_config = limit_config
+        self.size = 0
+        self.tokens = 0
+        self.expires_at = expires_at
+        self.denied_until = 0.0
+        self.remaining = None
+        self.refilling = False
+
+class LeasedRateLimiter(RateLimiter):
+    """
+    Rate limiter that admits most requests from local quota leases
+    
+    A worker reserves a block of lease_fraction of an endpoint's capacity
+    (the request limit, or the burst for gcra) in one script call, then
+    admits requests from memory until the block is used. When a lease
+    drops to refill_fraction of its size the next block is reserved on a
+    background thread, so busy keys rarely wait on Redis. Lease sizes
+    shrink with the quota Redis reports as remaining, and limits of one
+    request per lease fall back to a Redis round trip per request.
+    
+    Accuracy bound: Redis counts every reserved request and leases expire
+    when the reserving window resets, so the limit is never exceeded. A
+    tenant can instead be refused early by up to the unused leases of the
+    other workers, at most n_workers * lease_fraction * capacity requests
+    per window. Lower lease_fraction (or max_lease) for a tighter bound at
+    the cost of more Redis calls. Rejections are cached locally until
+    the reset time Redis reports.
+    
+    Expired leases are swept at most once per sweep_interval seconds, and
+    beyond max_leases keys the least recently used lease is dropped (its
+    unused tokens are returned to Redis).
+    """
+    
+    def __init__(self, redis_client: redis.Redis, lease_fraction: float = 0.05,
+                 refill_fraction: float = 0.5, max_lease: Optional[int] = None,
+                 limits_resolver: Optional[TenantLimitsResolver] = None,
+                 max_leases: int = 10000, sweep_interval: float = 1.0):
+        super().__init__(redis_client, limits_resolver)
+        self.lease_fraction = lease_fraction
+        self.refill_fraction = refill_fraction
+        self.max_lease = max_lease
+        self.max_leases = max_leases
+        self.sweep_interval = sweep_interval
+        self._next_sweep = 0.0
+        self._leases = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='rate-limit-lease')
+        self.local_decisions = 0
+        self.reservations = 0
+    
+    def _full_lease_size(self, limit_config: Dict) -> int:
+        """
+        Largest lease for an endpoint
+        """
+        size = int(limit_config.get('burst', limit_config['requests']) * self.lease_fraction)
+        if self.max_lease is not None:
+            size = min(size, self.max_lease)
+        
+        return max(size, 1)
+    
+    def _lease_size(self, limit_config: Dict, previous: int = 0,
+                    remaining: Optional[int] = None) -> int:
+        """
+        Requests to reserve for the next lease on an endpoint
+        
+        The first lease is an eighth of the full size and each later one
+        doubles, so workers that see little traffic strand little quota.
+        Leases also shrink to lease_fraction of what Redis last reported
+        as remaining.
+        """
+        full = self._full_lease_size(limit_config)
+        size = min(full, max(previous * 2, full // 8))
+        if remaining is not None:
+            size = min(size, int(remaining * self.lease_fraction))
+        
+        return max(size, 1)
+    
+    def is_allowed(self, tenant_id: str, endpoint_type: str,
+                   user_id: str = None) -> Tuple[bool, Dict]:
+        """
+        Check if request is allowed, from the local lease when possible
+        """
+        try:
+            limits = self.get_tenant_limits(tenant_id)
+            
+            if endpoint_type not in limits:
+                return True, {}
+            
+            limit_config = limits[endpoint_type]
+            if self._full_lease_size(limit_config) <= 1:
+                return super().is_allowed(tenant_id, endpoint_type, user_id)
+            
+            key = self._key(tenant_id, endpoint_type, user_id)
+            decision = self._local_decision(key, limit_config)
+            if decision is not None:
+                return decision
+            
+            # Lease used up (or none yet): reserve the next block in line
+            return self._local_decision(key, limit_config, self._reserve(key, limit_config))
+        
+        except Exception as e:
+            logger.error(f"Rate limiter error: {e}")
+            # Allow request on error to avoid blocking legitimate users
+            return True, {'error': str(e)}
+    
+    def _local_decision(self, key: str, limit_config: Dict,
+                        lease: Optional[QuotaLease] = None) -> Optional[Tuple[bool, Dict]]:
+        """
+        Admit or refuse from the lease; None when Redis has to be asked
+        
+        A lease that was just reserved is used even if its window ends
+        within the second, since Redis already counted this request.
+        """
+        now = time.monotonic()
+        
+        with self._lock:
+            fresh = lease is not None
+            lease = lease or self._leases.get(key)
+            if lease is None or (not fresh and now >= lease.expires_at):
+                return None
+            if not fresh:
+                self._leases.move_to_end(key)
+            
+            if lease.tokens <= 0:
+                if fresh or now < lease.denied_until:
+                    return self._denied(limit_config, lease)
+                return None
+            
+            lease.tokens -= 1
+            self.local_decisions += 1
+            refill = (not lease.refilling
+                      and lease.tokens <= lease.size * self.refill_fraction)
+            if refill:
+                lease.refilling = True
+            
+            remaining = (lease.remaining or 0) + lease.tokens
+        
+        if refill:
+            self._executor.submit(self._refill, key, limit_config)
+        
+        return True, {
+            'current_count': limit_config['requests'] - remaining,
+            'max_requests': limit_config['requests'],
+            'window': limit_config['window'],
+            'remaining': remaining,
+            'reset_time': max(int(lease.expires_at - now), 0)
+        }
+    
+    def _denied(self, limit_config: Dict, lease: QuotaLease) -> Tuple[bool, Dict]:
+        return False, {
+            'limit_exceeded': True,
+            'current_count': limit_config['requests'] - (lease.remaining or 0),
+            'max_requests': limit_config['requests'],
+            'window': limit_config['window'],
+            'reset_time': max(int(lease.denied_until - time.monotonic()), 0)
+        }
+    
+    def _reserve(self, key: str, limit_config: Dict) -> QuotaLease:
+        """
+        Reserve the next block of requests in Redis and add it to the lease
+        
+        When less than a full block is left, whatever remains is reserved.
+        """
+        with self._lock:
+            current = self._leases.get(key)
+            previous = current.size if current is not None else 0
+            remaining = None
+            if current is not None and time.monotonic() < current.expires_at:
+                remaining = current.remaining
+        
+        size = self._lease_size(limit_config, previous, remaining)
+        allowed, _, remaining, reset_time = self._check(key, limit_config, cost=size)
+        if not allowed and remaining > 0:
+            size = min(size, remaining)
+            allowed, _, remaining, reset_time = self._check(key, limit_config, cost=size)
+        
+        now = time.monotonic()
+        with self._lock:
+            self.reservations += 1
+            lease = self._leases.get(key)
+            if lease is None or now >= lease.expires_at:
+                lease = self._leases[key] = QuotaLease(limit_config, now + reset_time)
+            self._leases.move_to_end(key)
+            
+            lease.remaining = remaining
+            if allowed:
+                lease.size = size
+                lease.tokens += size
+                lease.expires_at = min(lease.expires_at, now + reset_time)
+            else:
+                lease.denied_until = now + reset_time
+            
+            evicted = self._evict(now)
+        
+        self._return_tokens(evicted, now)
+        return lease
+    
+    def _evict(self, now: float) -> Dict[str, QuotaLease]:
+        """
+        Drop expired leases and trim to max_leases; returns the live leases
+        that were dropped. Called with the lock held.
+        """
+        if now >= self._next_sweep:
+            self._next_sweep = now + self.sweep_interval
+            for key in [key for key, lease in self._leases.items()
+                        if now >= lease.expires_at and now >= lease.denied_until]:
+                del self._leases[key]
+        
+        evicted = {}
+        while len(self._leases) > self.max_leases:
+            key, lease = self._leases.popitem(last=False)
+            evicted[key] = lease
+        
+        return evicted
+    
+    def _return_tokens(self, leases: Dict[str, QuotaLease], now: float):
+        """
+        Give unused lease tokens back to Redis
+        
+        Leases within a second of expiring are dropped instead, so tokens
+        are never returned to the next window.
+        """
+        for key, lease in leases.items():
+            if lease.tokens > 0 and lease.expires_at - now > 1:
+                try:
+                    self._check(key, lease.limit_config, cost=-lease.tokens)
+                except Exception as e:
+                    logger.error(f"Error releasing rate limit lease: {e}")
+    
+    def _refill(self, key: str, limit_config: Dict):
+        try:
+            self._reserve(key, limit_config)
+        except Exception as e:
+            logger.error(f"Rate limit lease refill error: {e}")
+        finally:
+            with self._lock:
+                lease = self._leases.get(key)
+                if lease is not None:
+                    lease.refilling = False
+    
+    def release(self):
+        """
+        Return unused lease tokens to Redis (e.g. on worker shutdown)
+        """
+        with self._lock:
+            leases, self._leases = self._leases, OrderedDict()
+        
+        self._return_tokens(leases, time.monotonic())
+    
+    def close(self):
+        """
+        Wait for background refills, then release every lease
+        """
+        self._executor.shutdown(wait=True)
+        self.release()
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'leases': len(self._leases),
+                'local_decisions': self.local_decisions,
+                'reservations': self.reservations
+            }
 
 def rate_limit(endpoint_type: str, per_user: bool = False):
     """
@@ -193,12 +873,315 @@ def rate_limit(endpoint_type: str, per_user: bool = False):
 # Global rate limiter instance
 rate_limiter = None
 
-def init_rate_limiter(redis_client: redis.Redis):
+def init_rate_limiter(redis_client: redis.Redis, lease_fraction: Optional[float] = None,
+                      limits_file: Optional[str] = None):
     """
     Initialize the rate limiter
+
+    With lease_fraction, each worker admits requests from local quota
+    leases of that fraction of the limit (see LeasedRateLimiter).
+    limits_file is a JSON plan table (see TenantLimitsResolver.from_file).
+    A leased limiter returns its unused leases at interpreter exit.
     """
     global rate_limiter
-    rate_limiter = RateLimiter(redis_client)
+    if isinstance(rate_limiter, LeasedRateLimiter):
+        atexit.unregister(rate_limiter.close)
+        rate_limiter.close()
+    
+    if lease_fraction:
+        rate_limiter = LeasedRateLimiter(redis_client, lease_fraction)
+        atexit.register(rate_limiter.close)
+    else:
+        rate_limiter = RateLimiter(redis_client)
+    
+    if limits_file:
+        rate_limiter.limits_resolver = TenantLimitsResolver.from_file(
+            limits_file, rate_limiter.default_limits
+        )
+
+def _count_commands(redis_client: redis.Redis) -> list:
+    """
+    Count the commands a client sends from now on (each is one round trip)
+    """
+    counter = [0]
+    lock = threading.Lock()
+    execute_command = redis_client.execute_command
+    
+    def counting_execute_command(*args, **kwargs):
+        with lock:
+            counter[0] += 1
+        return execute_command(*args, **kwargs)
+    
+    redis_client.execute_command = counting_execute_command
+    return counter
+
+def _read_then_write_is_allowed(redis_client: redis.Redis, key: str,
+                                max_requests: int, window: int) -> bool:
+    """
+    The former GET then SETEX/INCR check, kept for comparison in run_load_test
+    """
+    current_count = int(redis_client.get(key) or 0)
+    if current_count >= max_requests:
+        redis_client.ttl(key)
+        return False
+    
+    if current_count == 0:
+        redis_client.setex(key, window, 1)
+    else:
+        redis_client.incr(key)
+    return True
+
+def run_load_test(redis_client: redis.Redis, n_requests: int = 20000, concurrency: int = 32,
+                  tenant_id: str = 'load_test', endpoint_type: str = 'iot') -> Dict[str, Dict]:
+    """
+    Hammer one tenant/endpoint from concurrent threads with the Lua script
+    and with the former read-then-write check
+    
+    Reports throughput, Redis round trips per request and how many requests
+    were allowed; anything above the endpoint's limit is overshoot.
+    """
+    results = {}
+    
+    for mode in ('script', 'read_then_write'):
+        limiter = RateLimiter(redis_client)
+        limits = limiter.get_tenant_limits(tenant_id)[endpoint_type]
+        key = limiter._key(tenant_id, endpoint_type)
+        redis_client.delete(key)
+        
+        if mode == 'script':
+            check = lambda: limiter.is_allowed(tenant_id, endpoint_type)[0]
+        else:
+            check = lambda: _read_then_write_is_allowed(
+                redis_client, key, limits['requests'], limits['window']
+            )
+        
+        per_thread = n_requests // concurrency
+        allowed = [0] * concurrency
+        
+        def worker(i):
+            for _ in range(per_thread):
+                allowed[i] += check()
+        
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+        execute_command = redis_client.execute_command
+        commands = _count_commands(redis_client)
+        start = time.perf_counter()
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            elapsed = time.perf_counter() - start
+            redis_client.execute_command = execute_command
+        
+        total = per_thread * concurrency
+        results[mode] = {
+            'requests': total,
+            'requests_per_s': total / elapsed,
+            'round_trips_per_request': commands[0] / total,
+            'allowed': sum(allowed),
+            'limit': limits['requests'],
+            'overshoot': max(sum(allowed) - limits['requests'], 0)
+        }
+        logger.info(f"{mode}: {results[mode]}")
+        redis_client.delete(key)
+    
+    return results
+
+def benchmark_limit_resolution(n_tenants: int = 10000, n_lookups: int = 200000) -> Dict[str, Dict]:
+    """
+    Tenant limit lookups per second, cached and uncached, and the peak
+    memory allocated while looking up
+    """
+    import tracemalloc
+    
+    tenants = [f"{('', 'premium_', 'enterprise_')[i % 3]}tenant_{i}" for i in range(n_tenants)]
+    results = {}
+    
+    for mode, ttl in (('cached', 300), ('uncached', 0)):
+        resolver = TenantLimitsResolver(DEFAULT_LIMITS, ttl=ttl)
+        for tenant_id in tenants:
+            resolver.resolve(tenant_id)
+        
+        start = time.perf_counter()
+        for i in range(n_lookups):
+            resolver.resolve(tenants[i % n_tenants])
+        elapsed = time.perf_counter() - start
+        
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        for i in range(10000):
+            resolver.resolve(tenants[i % n_tenants])
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+        tracemalloc.stop()
+        
+        results[mode] = {'lookups_per_s': n_lookups / elapsed, 'peak_bytes': peak}
+        logger.info(f"{mode} limits: {results[mode]}")
+    
+    return results
+
+def benchmark_tenant_stats(redis_client: redis.Redis, n_tenants: int = 100_000,
+                           sample: int = 1000, batch_size: int = 1000) -> Dict[str, float]:
+    """
+    Usage stats and resets across many tenants
+    
+    Every tenant gets one request on 'api', 'iot' and a per-user 'api'
+    key. Stats are timed one tenant at a time (a round trip per endpoint,
+    as before) on a sample and pipelined for all tenants. Resets through
+    the tenant key sets are timed against one KEYS scan of the keyspace,
+    which the former reset_limits ran, blocking Redis, for every tenant.
+    """
+    limiter = RateLimiter(redis_client)
+    tenants = [f"benchmark_{i}" for i in range(n_tenants)]
+    
+    for start in range(0, n_tenants, batch_size):
+        pipe = redis_client.pipeline(transaction=False)
+        for tenant_id in tenants[start:start + batch_size]:
+            limits = limiter.get_tenant_limits(tenant_id)
+            for endpoint_type, user_id in (('api', None), ('iot', None), ('api', 'user_1')):
+                limiter._run_script(limiter._key(tenant_id, endpoint_type, user_id),
+                                    limits[endpoint_type], client=pipe)
+        pipe.execute()
+    
+    start = time.perf_counter()
+    for tenant_id in tenants[:sample]:
+        for endpoint_type, limit_config in limiter.get_tenant_limits(tenant_id).items():
+            limiter._check(limiter._key(tenant_id, endpoint_type), limit_config, cost=0)
+    sequential = (time.perf_counter() - start) / sample
+    
+    start = time.perf_counter()
+    stats = limiter.get_usage_stats_many(tenants, batch_size)
+    pipelined = (time.perf_counter() - start) / n_tenants
+    
+    start = time.perf_counter()
+    redis_client.keys(f"rate_limit:{tenants[0]}:*")
+    keys_scan = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    for tenant_id in tenants[:sample]:
+        limiter.reset_limits(tenant_id)
+    reset = (time.perf_counter() - start) / sample
+    
+    for start in range(0, n_tenants, batch_size):
+        pipe = redis_client.pipeline(transaction=False)
+        for tenant_id in tenants[start:start + batch_size]:
+            pipe.unlink(limiter._key(tenant_id, 'api'), limiter._key(tenant_id, 'iot'),
+                        limiter._key(tenant_id, 'api', 'user_1'), limiter._index_key(tenant_id))
+        pipe.execute()
+    
+    results = {
+        'tenants': n_tenants,
+        'tenants_with_usage': sum(1 for tenant_stats in stats.values() if tenant_stats),
+        'sequential_stats_ms_per_tenant': sequential * 1000,
+        'pipelined_stats_ms_per_tenant': pipelined * 1000,
+        'keys_scan_ms': keys_scan * 1000,
+        'tracked_reset_ms_per_tenant': reset * 1000
+    }
+    logger.info(f"Tenant stats: {results}")
+    return results
+
+def benchmark_algorithms(redis_client: redis.Redis, n_requests: int = 20000, n_keys: int = 1000,
+                         limit_config: Optional[Dict] = None) -> Dict[str, Dict]:
+    """
+    Checks per second and Redis memory per key for every algorithm
+
+    Requests are spread over n_keys keys from one client, so the rate
+    includes the round trip. Memory is the mean MEMORY USAGE of the keys
+    (None on servers without the command).
+    """
+    limiter = RateLimiter(redis_client)
+    limit_config = limit_config or {'requests': 1000, 'window': 3600, 'burst': 100}
+    results = {}
+    
+    for algorithm in RATE_LIMIT_SCRIPTS:
+        config = dict(limit_config, algorithm=algorithm)
+        keys = [f"rate_limit:benchmark_{algorithm}:{i}" for i in range(n_keys)]
+        redis_client.delete(*keys)
+        
+        start = time.perf_counter()
+        for i in range(n_requests):
+            limiter._check(keys[i % n_keys], config)
+        elapsed = time.perf_counter() - start
+        
+        try:
+            memory = sum(redis_client.memory_usage(key) or 0 for key in keys) / n_keys
+        except redis.ResponseError:
+            memory = None
+        
+        results[algorithm] = {
+            'checks_per_s': n_requests / elapsed,
+            'bytes_per_key': memory
+        }
+        logger.info(f"{algorithm}: {results[algorithm]}")
+        redis_client.delete(*keys)
+    
+    return results
+
+def benchmark_leased_limiter(redis_client: redis.Redis, worker_counts: Tuple[int, ...] = (8, 32, 128),
+                             requests_per_worker: int = 200, lease_fraction: float = 0.05,
+                             limit_config: Optional[Dict] = None) -> Dict[str, list]:
+    """
+    Redis commands per request and check latency with and without leases
+
+    Each worker is its own limiter (as in separate server processes)
+    running on a thread, all checking one tenant's IoT endpoint. Refused
+    requests under the leased limiter show the accuracy bound at work.
+    """
+    limit_config = limit_config or {'requests': 100_000, 'window': 3600, 'algorithm': 'sliding_window'}
+    results = {'redis': [], 'leased': []}
+    
+    for mode in results:
+        for n_workers in worker_counts:
+            resolver = TenantLimitsResolver({'iot': limit_config}, plans={})
+            if mode == 'leased':
+                limiters = [LeasedRateLimiter(redis_client, lease_fraction, limits_resolver=resolver)
+                            for _ in range(n_workers)]
+            else:
+                limiters = [RateLimiter(redis_client, resolver) for _ in range(n_workers)]
+            limiters[0].reset_limits('benchmark_tenant')
+            
+            latencies = [[] for _ in range(n_workers)]
+            refused = [0] * n_workers
+            
+            def worker(i):
+                limiter = limiters[i]
+                for _ in range(requests_per_worker):
+                    start = time.perf_counter()
+                    allowed, _ = limiter.is_allowed('benchmark_tenant', 'iot')
+                    latencies[i].append(time.perf_counter() - start)
+                    refused[i] += not allowed
+            
+            threads = [threading.Thread(target=worker, args=(i,)) for i in range(n_workers)]
+            execute_command = redis_client.execute_command
+            commands = _count_commands(redis_client)
+            start = time.perf_counter()
+            try:
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                elapsed = time.perf_counter() - start
+                for limiter in limiters:
+                    if mode == 'leased':
+                        limiter._executor.shutdown(wait=True)
+            finally:
+                redis_client.execute_command = execute_command
+            
+            total = n_workers * requests_per_worker
+            latencies = sorted(latency for worker_latencies in latencies for latency in worker_latencies)
+            results[mode].append({
+                'workers': n_workers,
+                'requests_per_s': total / elapsed,
+                'redis_ops_per_request': commands[0] / total,
+                'p50_ms': latencies[len(latencies) // 2] * 1000,
+                'p99_ms': latencies[int(len(latencies) * 0.99)] * 1000,
+                'refused': sum(refused)
+            })
+            logger.info(f"{mode} x{n_workers}: {results[mode][-1]}")
+            limiters[0].reset_limits('benchmark_tenant')
+    
+    return results
 
 # Flask middleware for automatic rate limiting
 class RateLimitMiddleware:
@@ -279,6 +1262,15 @@ if __name__ == "__main__":
     # Initialize Redis client
     redis_client = redis.Redis(host='localhost', port=6379, db=0)
     
+    if len(sys.argv) > 1 and sys.argv[1] == 'benchmark':
+        logging.basicConfig(level=logging.INFO)
+        print(run_load_test(redis_client))
+        print(benchmark_algorithms(redis_client))
+        print(benchmark_leased_limiter(redis_client))
+        print(benchmark_limit_resolution())
+        print(benchmark_tenant_stats(redis_client))
+        sys.exit(0)
+    
     # Initialize rate limiter
     init_rate_limiter(redis_client)
     
@@ -0,0 +1,67 @@
+"""
+Shared fixtures for the Python AI and middleware modules
+
+The modules live in kebab-case files (not importable by name), so they
+are loaded from their paths; backend/src/ai is put on sys.path for their
+sibling imports.
+"""
+
+import importlib.util
+import os
+import sys
+
+import pytest
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src')
+AI_DIR = os.path.normpath(os.path.join(SRC, 'ai'))
+MIDDLEWARE_DIR = os.path.normpath(os.path.join(SRC, 'middleware'))
+
+if AI_DIR not in sys.path:
+    sys.path.insert(0, AI_DIR)
+
+def load_script(directory: str, filename: str):
+    """
+    Import a script by path, once per test session
+    """
+    name = filename[:-3].replace('-', '_')
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.spec_from_file_location(name, os.path.join(directory, filename))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+@pytest.fixture(scope='session')
+def disease_module():
+    pytest.importorskip('sklearn')
+    return load_script(AI_DIR, 'disease-prediction.py')
+
+@pytest.fixture(scope='session')
+def disease_model(disease_module):
+    model = disease_module.DiseasePredictionModel()
+    model.train_model(disease_module.create_sample_training_data(800))
+    return model
+
+@pytest.fixture(scope='session')
+def water_module():
+    pytest.importorskip('sklearn')
+    return load_script(AI_DIR, 'water-quality-predictor.py')
+
+@pytest.fixture(scope='session')
+def feeding_module():
+    pytest.importorskip('sklearn')
+    return load_script(AI_DIR, 'feeding-recommendation.py')
+
+@pytest.fixture(scope='session')
+def rate_limiter_module():
+    pytest.importorskip('flask')
+    pytest.importorskip('redis')
+    return load_script(MIDDLEWARE_DIR, 'rate-limiter.py')
+
+@pytest.fixture
+def redis_client():
+    fakeredis = pytest.importorskip('fakeredis')
+    pytest.importorskip('lupa')
+    return fakeredis.FakeRedis(max_connections=1024)
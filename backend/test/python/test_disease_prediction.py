@@ -0,0 +1,76 @@
+"""
+Disease model fast paths against the DataFrame reference
+"""
+
+import numpy as np
+import pytest
+
+@pytest.fixture(scope='module')
+def readings(disease_module):
+    return disease_module.create_sample_training_data(300).drop(columns=['disease_category'])
+
+def test_feature_matrix_matches_prepare_features(disease_model, readings):
+    X = disease_model.build_feature_matrix(readings, dtype=np.float64)
+    reference = disease_model.prepare_features(readings)[disease_model.model_feature_columns]
+
+    np.testing.assert_array_equal(X, reference.to_numpy())
+
+def test_single_and_batch_paths_match_reference(disease_module, disease_model, readings):
+    parity = disease_module.check_fast_path_parity(disease_model, readings)
+
+    assert parity['rows'] == len(readings)
+    assert parity['mismatches'] == []
+
+def test_compiled_engine_matches_reference(disease_module, disease_model, readings):
+    disease_model.compile_inference()
+    try:
+        parity = disease_module.check_fast_path_parity(disease_model, readings.iloc[:50])
+    finally:
+        disease_model._compiled = None
+
+    assert parity['mismatches'] == []
+
+def test_tune_model_reports_failed_configurations(disease_module, tmp_path, monkeypatch):
+    monkeypatch.setattr(disease_module.tempfile, 'tempdir', str(tmp_path))
+    model = disease_module.DiseasePredictionModel()
+    data = disease_module.create_sample_training_data(300)
+
+    tuned = model.tune_model(data, param_grid={'learning_rate': [0.1, -1.0], 'max_depth': [2]},
+                             cv=2, max_iter=5, n_workers=1)
+
+    good, bad = tuned['configurations']
+    assert good['fit_seconds'] > 0 and 'error' not in good
+    assert 'error' in bad
+    assert tuned['best_params'] == good['params']
+    assert list(tmp_path.iterdir()) == []
+
+def test_tune_model_with_no_working_configuration_keeps_model(disease_module, tmp_path, monkeypatch):
+    monkeypatch.setattr(disease_module.tempfile, 'tempdir', str(tmp_path))
+    model = disease_module.DiseasePredictionModel()
+    data = disease_module.create_sample_training_data(300)
+    model.train_model(data)
+    trained = (model.scaler, model.label_encoder, model.model)
+
+    tuned = model.tune_model(data, param_grid={'learning_rate': [-1.0], 'max_depth': [2]},
+                             cv=2, max_iter=5, n_workers=1)
+
+    assert 'error' in tuned
+    assert 'error' in tuned['configurations'][0]
+    assert (model.scaler, model.label_encoder, model.model) == trained
+    assert list(tmp_path.iterdir()) == []
+
+def test_screening_pipeline_matches_batch_for_forwarded_rows(disease_module, disease_model):
+    readings = disease_module.create_sample_training_data(400).drop(columns=['disease_category'])
+    pipeline = disease_module.DiseaseScreeningPipeline(disease_model, chunk_size=150)
+
+    results = list(pipeline.screen(readings))
+    batch = disease_model.predict_disease_batch(readings)
+
+    forwarded = np.concatenate([result['forwarded'] for result in results])
+    category = np.concatenate([result['disease_category'] for result in results])
+    confidence = np.concatenate([result['confidence'] for result in results])
+    assert 0 < forwarded.sum() < len(readings)
+    np.testing.assert_array_equal(category[forwarded], batch['disease_category'][forwarded])
+    np.testing.assert_allclose(confidence[forwarded], batch['confidence'][forwarded])
+    assert (category[~forwarded] == 'healthy').all()
+    assert pipeline.stats()['model_rows'] == forwarded.sum()
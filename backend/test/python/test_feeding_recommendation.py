@@ -0,0 +1,136 @@
+"""
+Feature assembly, hybrid model scale and path metrics
+"""
+
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+@pytest.fixture(scope='module')
+def system(feeding_module):
+    return feeding_module.FeedingRecommendationSystem()
+
+@pytest.fixture(scope='module')
+def ponds(feeding_module):
+    return feeding_module.create_sample_ponds(50)
+
+@pytest.fixture(scope='module')
+def trained_system(feeding_module):
+    system = feeding_module.FeedingRecommendationSystem()
+    system.train_model(feeding_module.create_sample_training_data())
+    return system
+
+def typical_ponds(n_ponds, seed=3):
+    rng = np.random.default_rng(seed)
+    return [
+        {
+            'fish_weight_avg': float(rng.uniform(50, 500)),
+            'fish_count': int(rng.integers(500, 5000)),
+            'fish_species': 'tilapia',
+            'water_quality': {
+                'temperature': float(rng.uniform(24, 32)),
+                'ph': float(rng.uniform(6.8, 8.2)),
+                'dissolved_oxygen': float(rng.uniform(6.0, 9.0)),
+                'ammonia': float(rng.uniform(0.05, 0.45))
+            },
+            'fish_data': {
+                'age_days': int(rng.integers(60, 300)),
+                'feeding_frequency': int(rng.integers(2, 4)),
+                'last_feeding_hours': float(rng.uniform(8, 20))
+            }
+        }
+        for _ in range(n_ponds)
+    ]
+
+def per_row(feeding_module, system, records):
+    return np.vstack([feeding_module._prepare_features_per_row(system.feature_columns, record)
+                      for record in records]).astype(np.float64)
+
+def test_records_and_frame_match_per_row(feeding_module, system, ponds):
+    expected = per_row(feeding_module, system, ponds)
+
+    np.testing.assert_array_equal(system.feature_assembler.assemble(ponds), expected)
+    np.testing.assert_array_equal(system.feature_assembler.assemble(pd.DataFrame(ponds)), expected)
+
+def test_dict_of_columns_matches_per_row(feeding_module, system, ponds):
+    columns = {'species': 'tilapia'}
+    columns.update({col: [pond.get(col) for pond in ponds]
+                    for col in system.feature_columns if col in ponds[0]})
+
+    assembled = system.feature_assembler.assemble(columns)
+
+    np.testing.assert_array_equal(assembled, per_row(feeding_module, system, ponds))
+
+def test_single_pond_with_list_field_is_one_row(feeding_module, system, ponds):
+    pond = dict(ponds[0], feeding_times=[6, 12, 18])
+
+    assembled = system.feature_assembler.assemble(pond)
+
+    np.testing.assert_array_equal(assembled, per_row(feeding_module, system, [ponds[0]]))
+
+def test_columns_of_different_lengths_raise(system):
+    with pytest.raises(ValueError, match='different lengths'):
+        system.feature_assembler.assemble({'fish_weight_avg': [100, 200], 'fish_count': [1000]})
+
+    with pytest.raises(ValueError, match='scalar'):
+        system.feature_assembler.assemble({'fish_weight_avg': [100, 200], 'fish_count': 1000})
+
+def test_path_metrics_count_clamped_rows_across_threads(feeding_module):
+    metrics = feeding_module.FeedingPathMetrics()
+
+    def worker():
+        for _ in range(2000):
+            metrics.record('model', 10, 0.001, clamped_rows=3)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    snapshot = metrics.snapshot()
+    assert snapshot['model']['rows'] == 8 * 2000 * 10
+    assert snapshot['model']['clamped_rows'] == 8 * 2000 * 3
+
+def test_batch_rules_match_scalar_rules(feeding_module, system):
+    parity = feeding_module.check_batch_parity(system, feeding_module.create_sample_ponds(2000))
+
+    assert parity['mismatches'] == []
+
+def test_many_matches_single_recommendations(system, ponds):
+    ponds = ponds + [dict(ponds[0], fish_data=dict(ponds[0]['fish_data'], fish_count=0))]
+
+    many = system.recommend_feeding_many(ponds)
+
+    for pond, result in zip(ponds, many):
+        single = system.recommend_feeding(pond)
+        single.pop('timestamp', None)
+        result.pop('timestamp', None)
+        assert result == single
+
+def test_hybrid_model_amounts_are_on_the_rule_scale(feeding_module, trained_system):
+    typical = trained_system.recommend_feeding_hybrid(typical_ponds(200))
+
+    mixed = trained_system.recommend_feeding_hybrid(feeding_module.create_sample_ponds(2000))
+
+    assert (typical['source'] == 'model').mean() >= 0.9
+    assert (mixed['source'] == 'model').mean() > 0.5
+    ratio = typical['model_amount_per_feeding'] / typical['rule_amount_per_feeding']
+    assert 0.6 < np.median(ratio) < 1.4
+
+def test_hybrid_model_failure_records_no_model_batch(trained_system, monkeypatch):
+    def fail(features):
+        raise RuntimeError('model unavailable')
+
+    monkeypatch.setattr(trained_system, 'predict_feeding_rate_batch', fail)
+    before = trained_system.path_metrics.snapshot()
+
+    batch = trained_system.recommend_feeding_hybrid(typical_ponds(20))
+
+    after = trained_system.path_metrics.snapshot()
+    assert list(batch['source']) == ['rules'] * 20
+    np.testing.assert_array_equal(batch['amount_per_feeding'], batch['rule_amount_per_feeding'])
+    assert after['model']['batches'] == before['model']['batches']
+    assert after['rules']['rows'] == before['rules']['rows'] + 20
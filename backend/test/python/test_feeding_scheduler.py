@@ -0,0 +1,94 @@
+"""
+Feeding scheduler change detection
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from feeding_scheduler import FeedingScheduler
+
+class CountingRecommender:
+    def __init__(self):
+        self.calls = 0
+
+    def recommend_feeding(self, pond_data):
+        self.calls += 1
+        return {'feeding_frequency': 3, 'amount_per_feeding': 100.0}
+
+POND = {'fish_data': {'fish_weight_avg': 100.0, 'fish_count': 1000, 'last_feeding_hours': 12.0},
+        'water_quality': {'temperature': 26.0, 'ph': 7.2}}
+
+def with_fish(**fish_data):
+    return dict(POND, fish_data=dict(POND['fish_data'], **fish_data))
+
+@pytest.fixture
+def scheduler():
+    return FeedingScheduler(CountingRecommender())
+
+NOW = datetime(2024, 6, 1, 5, 0)
+
+@pytest.mark.parametrize('pond, rebuilt', [
+    (with_fish(fish_weight_avg=102.0), False),
+    (with_fish(fish_weight_avg=110.0), True),
+    (with_fish(last_feeding_hours=20.0), False),
+    (with_fish(last_feeding_hours=25.0), True),
+    (with_fish(last_feeding_hours=3.0), True),
+    (with_fish(last_feeding_hours=None), True),
+    (with_fish(fish_count=None), True),
+])
+def test_update_rebuilds_only_on_relevant_changes(scheduler, pond, rebuilt):
+    assert scheduler.update_pond('p1', POND, NOW)
+
+    assert scheduler.update_pond('p1', pond, NOW + timedelta(minutes=5)) is rebuilt
+    assert scheduler.recommender.calls == 1 + rebuilt
+
+def test_none_to_none_is_unchanged(scheduler):
+    pond = with_fish(last_feeding_hours=None)
+    scheduler.update_pond('p1', pond, NOW)
+
+    assert not scheduler.update_pond('p1', pond, NOW + timedelta(minutes=5))
+
+@pytest.fixture(scope='module')
+def system(feeding_module):
+    return feeding_module.FeedingRecommendationSystem()
+
+def fleet_pond(species='tilapia', **water_quality):
+    return {
+        'fish_weight_avg': 200.0, 'fish_count': 5000, 'fish_species': species,
+        'water_quality': dict({'temperature': 28.0, 'ph': 7.2, 'dissolved_oxygen': 7.0,
+                               'ammonia': 0.2}, **water_quality),
+        'fish_data': {'age_days': 120, 'feeding_frequency': 2, 'last_feeding_hours': 12.0}
+    }
+
+@pytest.mark.parametrize('species, field, before, after', [
+    ('tilapia', 'ammonia', 0.45, 0.52),
+    ('tilapia', 'dissolved_oxygen', 5.2, 4.8),
+    ('salmon', 'dissolved_oxygen', 6.2, 5.8),
+    ('tilapia', 'temperature', 29.6, 30.4),
+    ('tilapia', 'temperature', 20.4, 19.8),
+    ('tilapia', 'temperature', 34.6, 35.4),
+    ('tilapia', 'temperature', 32.6, 33.3),
+    ('salmon', 'temperature', 19.6, 20.4),
+    ('tilapia', 'ph', 6.55, 6.45),
+])
+def test_crossing_a_rule_cutoff_rebuilds_the_plan(system, species, field, before, after):
+    scheduler = FeedingScheduler(system)
+    scheduler.update_pond('p1', fleet_pond(species, **{field: before}), NOW)
+
+    pond = fleet_pond(species, **{field: after})
+    assert scheduler.update_pond('p1', pond, NOW + timedelta(minutes=5))
+
+    planned = scheduler.plan('p1').recommendation['amount_per_feeding']
+    assert planned == system.recommend_feeding(pond)['amount_per_feeding']
+
+@pytest.mark.parametrize('field, before, after', [
+    ('ammonia', 0.40, 0.45),
+    ('dissolved_oxygen', 6.2, 6.0),
+    ('temperature', 27.5, 28.3),
+])
+def test_small_change_within_a_band_is_skipped(system, field, before, after):
+    scheduler = FeedingScheduler(system)
+    scheduler.update_pond('p1', fleet_pond(**{field: before}), NOW)
+
+    assert not scheduler.update_pond('p1', fleet_pond(**{field: after}), NOW + timedelta(minutes=5))
@@ -0,0 +1,74 @@
+"""
+Micro-batching and per-request error isolation
+"""
+
+import asyncio
+
+import pytest
+
+from conftest import AI_DIR, load_script
+
+@pytest.fixture(scope='module')
+def server_module():
+    pytest.importorskip('numpy')
+    return load_script(AI_DIR, 'inference_server.py')
+
+def test_requests_are_batched(server_module):
+    batches = []
+
+    def double(requests):
+        batches.append(len(requests))
+        return [request * 2 for request in requests]
+
+    async def run():
+        batcher = server_module.MicroBatcher('double', double, max_batch_size=8, max_wait_ms=20)
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(20)))
+        await batcher.stop()
+        return results
+
+    assert asyncio.run(run()) == [i * 2 for i in range(20)]
+    assert max(batches) > 1
+    assert sum(batches) == 20
+
+def test_failing_request_only_fails_itself(server_module):
+    def reciprocal(requests):
+        return [1 / request for request in requests]
+
+    async def run():
+        batcher = server_module.MicroBatcher('reciprocal', reciprocal, max_batch_size=8, max_wait_ms=20)
+        results = await asyncio.gather(*(batcher.submit(i) for i in (1, 0, 4)), return_exceptions=True)
+        after = await batcher.submit(2)
+        await batcher.stop()
+        return results, after, batcher.metrics()
+
+    results, after, metrics = asyncio.run(run())
+
+    assert results[0] == 1.0
+    assert isinstance(results[1], ZeroDivisionError)
+    assert results[2] == 0.25
+    assert after == 0.5
+    assert metrics['errors'] == 1
+
+def test_full_queue_rejects(server_module):
+    async def run():
+        batcher = server_module.MicroBatcher('echo', lambda requests: requests, max_wait_ms=50,
+                                             max_queue_size=2)
+        outcomes = await asyncio.gather(*(batcher.submit(i) for i in range(5)), return_exceptions=True)
+        await batcher.stop()
+        return outcomes, batcher.rejected
+
+    outcomes, rejected = asyncio.run(run())
+
+    assert rejected == sum(isinstance(o, server_module.BackpressureError) for o in outcomes) > 0
+
+def test_disease_many_isolates_invalid_readings(disease_module, disease_model):
+    records = disease_module.create_sample_training_data(3).drop(columns=['disease_category']).to_dict('records')
+    del records[1]['temperature']
+
+    results = disease_model.predict_disease_many(records)
+
+    assert 'temperature' in results[1]['error']
+    for i in (0, 2):
+        expected = disease_model.predict_disease(records[i])
+        assert results[i]['disease_category'] == expected['disease_category']
+        assert results[i]['confidence'] == pytest.approx(expected['confidence'])
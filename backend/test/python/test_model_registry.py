@@ -0,0 +1,100 @@
+"""
+Model registry activation and restart
+"""
+
+import json
+import os
+import threading
+
+import pytest
+
+from model_registry import ActivationSuperseded, ModelRegistry
+
+def save(model, path):
+    os.makedirs(path)
+    with open(os.path.join(path, 'model.json'), 'w') as f:
+        json.dump(model, f)
+
+def load(path):
+    with open(os.path.join(path, 'model.json')) as f:
+        return json.load(f)
+
+def open_registry(root):
+    registry = ModelRegistry(str(root))
+    registry.register_model_type('disease', saver=save, loader=load)
+    return registry
+
+def test_active_version_survives_restart(tmp_path):
+    registry = open_registry(tmp_path)
+    first = registry.publish('disease', {'weights': 1}, version='v1')
+    registry.publish('disease', {'weights': 2}, version='v2')
+    registry.activate('disease', first)
+    registry.close()
+
+    restarted = open_registry(tmp_path)
+    with pytest.raises(ValueError):
+        restarted.get('disease')
+
+    restored = restarted.load_active()
+
+    assert restored['disease'].version == 'v1'
+    assert restarted.get('disease').model == {'weights': 1}
+    assert restarted.load_active() == {}
+    restarted.close()
+
+def test_load_active_skips_models_never_activated(tmp_path):
+    registry = open_registry(tmp_path)
+    registry.publish('disease', {'weights': 1}, version='v1')
+
+    assert registry.load_active() == {}
+    registry.close()
+
+def test_duplicate_publish_leaves_existing_version_untouched(tmp_path):
+    registry = open_registry(tmp_path)
+    registry.publish('disease', {'weights': 1}, version='v1')
+    registry.activate('disease', 'v1')
+
+    with pytest.raises(ValueError, match='already exists'):
+        registry.publish('disease', {'weights': 999}, version='v1')
+
+    assert load(str(tmp_path / 'disease' / 'v1')) == {'weights': 1}
+    assert not [entry for entry in (tmp_path / 'disease').iterdir() if entry.name.startswith('.staging')]
+    registry.close()
+
+def test_failed_save_leaves_no_version(tmp_path):
+    registry = ModelRegistry(str(tmp_path))
+
+    def failing_save(model, path):
+        save(model, path)
+        raise OSError('disk full')
+
+    registry.register_model_type('disease', saver=failing_save, loader=load)
+    with pytest.raises(OSError):
+        registry.publish('disease', {'weights': 1}, version='v1')
+
+    assert registry.versions('disease') == []
+    assert sorted(entry.name for entry in (tmp_path / 'disease').iterdir()) == []
+    registry.close()
+
+def test_slow_activation_does_not_override_later_one(tmp_path):
+    release = threading.Event()
+
+    def slow_load(path):
+        if path.endswith('v3'):
+            release.wait(5)
+        return load(path)
+
+    registry = ModelRegistry(str(tmp_path))
+    registry.register_model_type('disease', saver=save, loader=slow_load)
+    for version in ('v1', 'v2', 'v3'):
+        registry.publish('disease', {'version': version}, version=version)
+
+    slow = registry.activate_async('disease', 'v3')
+    registry.activate('disease', 'v2')
+    release.set()
+
+    with pytest.raises(ActivationSuperseded):
+        slow.result(5)
+    assert registry.get('disease').version == 'v2'
+    assert json.load(open(tmp_path / 'disease' / 'manifest.json'))['active'] == 'v2'
+    registry.close()
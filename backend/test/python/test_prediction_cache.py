@@ -0,0 +1,56 @@
+"""
+Prediction cache counters and backends
+"""
+
+import threading
+
+import numpy as np
+import pytest
+
+from prediction_cache import MemoryCacheBackend, PredictionCache, RedisCacheBackend
+
+def test_counters_are_exact_under_concurrency():
+    cache = PredictionCache('test', backend=MemoryCacheBackend())
+    n_threads, n_calls = 8, 2000
+
+    def worker(offset):
+        for i in range(n_calls):
+            cache.get_or_compute({'x': (offset + i) % 50}, lambda: {'value': 1})
+
+    threads = [threading.Thread(target=worker, args=(t,)) for t in range(n_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = cache.stats()
+    assert stats['hits'] + stats['misses'] == n_threads * n_calls
+
+def test_memory_backend_respects_byte_budget():
+    backend = MemoryCacheBackend(max_bytes=2000)
+    for i in range(100):
+        backend.set(('k', i), {'value': float(i)})
+
+    assert 0 < backend.stats()['bytes'] <= 2000
+    assert backend.stats()['evictions'] > 0
+
+def test_redis_backend_round_trips_numpy_values(redis_client):
+    backend = RedisCacheBackend(redis_client, 'water_quality')
+    backend.set(('k',), {'ph': np.float64(7.25), 'count': np.int64(3),
+                         'series': np.array([1.5, 2.5])})
+
+    assert backend.get(('k',)) == {'ph': 7.25, 'count': 3, 'series': [1.5, 2.5]}
+
+def test_redis_backend_rejects_unserializable_values(redis_client):
+    backend = RedisCacheBackend(redis_client, 'water_quality')
+
+    with pytest.raises(TypeError):
+        backend.set(('k',), {'model': object()})
+
+    assert backend.get(('k',)) is None
+
+def test_water_cache_is_opt_in(water_module):
+    predictor = water_module.WaterQualityPredictor()
+    assert predictor.prediction_cache is None
+
+    assert predictor.enable_prediction_cache() is predictor.prediction_cache
@@ -0,0 +1,188 @@
+"""
+Rate limit scripts, tenant limits and quota leases against fakeredis
+"""
+
+import threading
+
+import pytest
+
+@pytest.fixture
+def limiter(rate_limiter_module, redis_client):
+    return rate_limiter_module.RateLimiter(redis_client)
+
+def test_default_limits_are_read_only(rate_limiter_module, limiter):
+    with pytest.raises(TypeError):
+        limiter.default_limits['api'] = {'requests': 1, 'window': 1}
+    with pytest.raises(TypeError):
+        limiter.default_limits['api']['requests'] = 1
+
+    assert rate_limiter_module.DEFAULT_LIMITS['api']['requests'] == limiter.default_limits['api']['requests']
+
+ALGORITHMS = ('fixed_window', 'sliding_window', 'gcra')
+
+def config(algorithm, requests=5, window=60):
+    return {'requests': requests, 'window': window, 'algorithm': algorithm}
+
+@pytest.mark.parametrize('algorithm', ALGORITHMS)
+def test_script_admits_up_to_the_limit(limiter, algorithm):
+    results = [limiter._check('rate_limit:{t1}:api', config(algorithm)) for _ in range(7)]
+
+    assert [allowed for allowed, _, _, _ in results] == [True] * 5 + [False] * 2
+    assert results[4][2] == 0
+    assert all(0 < reset <= 60 for _, _, _, reset in results)
+
+@pytest.mark.parametrize('algorithm', ALGORITHMS)
+def test_zero_cost_read_writes_nothing(limiter, redis_client, algorithm):
+    assert limiter._check('rate_limit:{t1}:api', config(algorithm), cost=0)[:3] == (True, 0, 5)
+    assert redis_client.keys('*') == []
+
+    for _ in range(3):
+        limiter._check('rate_limit:{t1}:api', config(algorithm))
+    snapshot = {key: redis_client.dump(key) for key in redis_client.keys('*')}
+
+    allowed, count, remaining, _ = limiter._check('rate_limit:{t1}:api', config(algorithm), cost=0)
+
+    assert (allowed, count, remaining) == (True, 3, 2)
+    assert {key: redis_client.dump(key) for key in redis_client.keys('*')} == snapshot
+
+def test_fixed_window_read_does_not_set_expiry(limiter, redis_client):
+    redis_client.set('rate_limit:{t1}:api', 3)
+
+    limiter._check('rate_limit:{t1}:api', config('fixed_window'), cost=0)
+    assert redis_client.ttl('rate_limit:{t1}:api') == -1
+
+    limiter._check('rate_limit:{t1}:api', config('fixed_window'))
+    assert 0 < redis_client.ttl('rate_limit:{t1}:api') <= 60
+
+def test_script_replaces_state_from_another_algorithm(limiter):
+    for _ in range(5):
+        limiter._check('rate_limit:{t1}:api', config('fixed_window'))
+
+    allowed, count, _, _ = limiter._check('rate_limit:{t1}:api', config('gcra'))
+
+    assert allowed and count == 1
+
+def test_reset_removes_tracked_keys(limiter, redis_client):
+    limiter.is_allowed('tenant-a', 'api')
+    limiter.is_allowed('tenant-a', 'ai', user_id='u1')
+    limiter.is_allowed('tenant-b', 'api')
+
+    assert limiter.get_usage_stats('tenant-a')['api']['current_usage'] == 1
+    assert limiter.reset_limits('tenant-a')
+
+    remaining = {key.decode() for key in redis_client.keys('*')}
+    assert remaining == {'rate_limit:{tenant-b}:api', 'rate_limit:{tenant-b}:keys'}
+    assert limiter.get_usage_stats('tenant-a') == {}
+
+@pytest.mark.parametrize('algorithm', ALGORITHMS)
+def test_key_set_drops_expired_keys(limiter, redis_client, algorithm):
+    redis_client.zadd('rate_limit:{t1}:keys', {'rate_limit:{t1}:api:gone': 1})
+
+    limiter._check('rate_limit:{t1}:api:u1', config(algorithm))
+
+    tracked = dict(redis_client.zrange('rate_limit:{t1}:keys', 0, -1, withscores=True))
+    assert list(tracked) == [b'rate_limit:{t1}:api:u1']
+    assert tracked[b'rate_limit:{t1}:api:u1'] >= redis_client.time()[0]
+
+def test_plain_key_set_is_converted_and_reset(limiter, redis_client):
+    redis_client.set('rate_limit:{t1}:api:u1', 1, ex=60)
+    redis_client.sadd('rate_limit:{t1}:keys', 'rate_limit:{t1}:api:u1')
+    redis_client.expire('rate_limit:{t1}:keys', 60)
+
+    limiter._check('rate_limit:{t1}:api:u2', config('fixed_window'))
+
+    assert redis_client.type('rate_limit:{t1}:keys') == b'zset'
+    assert set(redis_client.zrange('rate_limit:{t1}:keys', 0, -1)) == {
+        b'rate_limit:{t1}:api:u1', b'rate_limit:{t1}:api:u2'
+    }
+
+    redis_client.delete('rate_limit:{t1}:keys')
+    redis_client.sadd('rate_limit:{t1}:keys', 'rate_limit:{t1}:api:u1', 'rate_limit:{t1}:api:u2')
+    assert limiter.reset_limits('t1', 'api')
+    assert redis_client.keys('*') == []
+
+@pytest.fixture
+def leased(rate_limiter_module, redis_client):
+    def build(requests=100, **kwargs):
+        resolver = rate_limiter_module.TenantLimitsResolver(
+            {'api': {'requests': requests, 'window': 3600, 'algorithm': 'fixed_window'}}
+        )
+        limiter = rate_limiter_module.LeasedRateLimiter(redis_client, lease_fraction=0.1,
+                                                        limits_resolver=resolver, **kwargs)
+        built.append(limiter)
+        return limiter
+
+    built = []
+    yield build
+    for limiter in built:
+        limiter.close()
+
+def redis_count(redis_client, tenant_id):
+    return int(redis_client.get(f'rate_limit:{{{tenant_id}}}:api') or 0)
+
+def test_lease_admits_exactly_the_limit(leased, redis_client):
+    limiter = leased(requests=100)
+
+    admitted = sum(limiter.is_allowed('t1', 'api')[0] for _ in range(150))
+    limiter._executor.shutdown(wait=True)
+
+    assert admitted == 100
+    assert redis_count(redis_client, 't1') == 100
+    assert limiter.stats()['local_decisions'] == 100
+
+def test_concurrent_lease_accounting(leased, redis_client):
+    limiter = leased(requests=1000)
+    results = []
+
+    def worker():
+        results.extend(limiter.is_allowed('t1', 'api')[0] for _ in range(200))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    limiter.close()
+
+    admitted = sum(results)
+    assert admitted <= 1000
+    assert redis_count(redis_client, 't1') == admitted
+    assert limiter.stats()['local_decisions'] == admitted
+
+def test_release_returns_unused_tokens(leased, redis_client):
+    limiter = leased(requests=1000)
+    for _ in range(3):
+        assert limiter.is_allowed('t1', 'api')[0]
+    assert redis_count(redis_client, 't1') > 3
+
+    limiter.close()
+
+    assert redis_count(redis_client, 't1') == 3
+    assert limiter.stats()['leases'] == 0
+
+def test_leases_are_capped_and_swept(leased, redis_client):
+    limiter = leased(requests=1000, max_leases=2, sweep_interval=0)
+    for tenant_id in ('t1', 't2', 't3'):
+        assert limiter.is_allowed(tenant_id, 'api')[0]
+
+    assert list(limiter._leases) == ['rate_limit:{t2}:api', 'rate_limit:{t3}:api']
+    assert redis_count(redis_client, 't1') == 1
+
+    limiter._leases['rate_limit:{t2}:api'].expires_at = 0
+    assert limiter.is_allowed('t4', 'api')[0]
+
+    assert list(limiter._leases) == ['rate_limit:{t3}:api', 'rate_limit:{t4}:api']
+
+def test_init_registers_lease_release(rate_limiter_module, redis_client, monkeypatch):
+    registered = []
+    monkeypatch.setattr(rate_limiter_module.atexit, 'register', registered.append)
+    monkeypatch.setattr(rate_limiter_module.atexit, 'unregister', registered.remove)
+    monkeypatch.setattr(rate_limiter_module, 'rate_limiter', None)
+
+    rate_limiter_module.init_rate_limiter(redis_client, lease_fraction=0.05)
+    first = rate_limiter_module.rate_limiter
+    rate_limiter_module.init_rate_limiter(redis_client, lease_fraction=0.05)
+
+    assert registered == [rate_limiter_module.rate_limiter.close]
+    assert first._executor._shutdown
+    rate_limiter_module.rate_limiter.close()
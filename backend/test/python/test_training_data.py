@@ -0,0 +1,38 @@
+"""
+Reservoir and stratified samples over chunked training data
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from training_data import ReservoirSample, StratifiedSample
+
+def chunks(n_rows, chunk_size):
+    frame = pd.DataFrame({'value': np.arange(n_rows), 'label': np.arange(n_rows) % 3})
+    return [frame.iloc[start:start + chunk_size] for start in range(0, n_rows, chunk_size)]
+
+def test_reservoir_keeps_capacity_rows_from_the_stream():
+    sample = ReservoirSample(50, seed=1)
+    for chunk in chunks(1000, 128):
+        sample.add(chunk)
+
+    frame = sample.frame()
+    assert sample.rows_seen == 1000
+    assert len(frame) == 50
+    assert frame['value'].is_unique
+    assert frame['value'].max() >= 50
+
+def test_stratified_sample_caps_each_class():
+    sample = StratifiedSample('label', 10)
+    for chunk in chunks(300, 64):
+        sample.add(chunk)
+
+    assert sample.frame()['label'].value_counts().to_dict() == {0: 10, 1: 10, 2: 10}
+
+@pytest.mark.parametrize('capacity', [0, -1])
+def test_non_positive_capacity_is_rejected(capacity):
+    with pytest.raises(ValueError, match='must be positive'):
+        ReservoirSample(capacity)
+    with pytest.raises(ValueError, match='must be positive'):
+        StratifiedSample('label', capacity)
@@ -0,0 +1,154 @@
+"""
+Weather feature joins, forecasting and incremental training
+"""
+
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+@pytest.fixture
+def weather_file(tmp_path):
+    rng = np.random.default_rng(3)
+    frames = []
+    for site in ('pond-a', 'pond-b'):
+        hours = pd.date_range('2024-01-01', periods=96, freq='h')
+        keep = rng.random(len(hours)) > 0.3
+        frames.append(pd.DataFrame({
+            'site_id': site,
+            'timestamp': hours[keep],
+            'weather_temp': rng.uniform(15, 35, keep.sum()),
+            'humidity': rng.uniform(40, 80, keep.sum())
+        }))
+    path = tmp_path / 'weather.csv'
+    pd.concat(frames).sample(frac=1, random_state=0).to_csv(path, index=False)
+    return str(path)
+
+def test_file_weather_join_matches_per_row_lookup(water_module, weather_file):
+    provider = water_module.FileWeatherProvider(weather_file, max_gap_hours=2)
+    rng = np.random.default_rng(4)
+    n = 500
+    sites = rng.choice(['pond-a', 'pond-b', 'pond-unknown'], n)
+    timestamps = pd.DatetimeIndex(pd.Timestamp('2023-12-31 20:00')
+                                  + pd.to_timedelta(rng.integers(0, 110 * 60, n), unit='min'))
+    temperature = rng.uniform(20, 30, n)
+
+    weather_temp, humidity = provider.get_features(sites, timestamps, temperature)
+
+    hours = timestamps.to_numpy().astype('datetime64[h]').astype(np.int64)
+    for i in range(n):
+        expected = provider.lookup(sites[i], int(hours[i]))
+        if expected is None:
+            expected = (temperature[i], provider.default_humidity)
+        assert (weather_temp[i], humidity[i]) == pytest.approx(expected)
+
+def test_base_provider_defaults(water_module):
+    provider = water_module.WeatherFeatureProvider()
+    temperature = np.array([21.0, 24.5])
+    timestamps = pd.DatetimeIndex(['2024-01-01 00:10', '2024-01-01 05:00'])
+
+    weather_temp, humidity = provider.get_features(np.array(['a', 'b']), timestamps, temperature)
+
+    np.testing.assert_array_equal(weather_temp, temperature)
+    np.testing.assert_array_equal(humidity, provider.default_humidity)
+
+def test_weather_cache_is_consistent_across_threads(water_module):
+    class HourProvider(water_module.WeatherFeatureProvider):
+        def lookup(self, site_id, hour):
+            return float(hour), 50.0
+
+    provider = HourProvider(cache_size=16)
+    errors = []
+
+    def worker(seed):
+        rng = np.random.default_rng(seed)
+        for hour in rng.integers(0, 64, 2000):
+            if provider._cached_lookup('site', int(hour)) != (float(hour), 50.0):
+                errors.append(hour)
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert provider.cache_hits + provider.cache_misses == 8 * 2000
+    assert len(provider._cache) <= 16
+
+def test_predict_future_passes_errors_through(water_module):
+    predictor = water_module.WaterQualityPredictor()
+
+    forecast = predictor.predict_future({'temperature': 25.0, 'ph': 7.2}, hours_ahead=3)
+
+    assert [point['hours_ahead'] for point in forecast] == [0, 1, 2]
+    assert all('error' in point and 'ph' not in point for point in forecast)
+
+@pytest.fixture(scope='module')
+def predictor(water_module):
+    predictor = water_module.WaterQualityPredictor()
+    predictor.train_models(water_module.create_sample_data(400), strategy='multi_output')
+    return predictor
+
+def reference_predict(predictor, records):
+    """
+    DataFrame path straight through the scaler and the sklearn models
+    """
+    features = predictor.prepare_features(pd.DataFrame(records))[predictor.feature_columns]
+    X_scaled = predictor.scalers['main'].transform(features)
+    return {target: predictor.models[target].predict(X_scaled) for target in predictor.target_columns}
+
+def test_single_and_batch_match_reference(water_module, predictor):
+    records = (water_module.create_sample_data(40)
+               .assign(timestamp=lambda df: df['timestamp'].astype(str)).to_dict('records'))
+    expected = reference_predict(predictor, records)
+
+    many = predictor.predict_many(records)
+    for i, record in enumerate(records):
+        single = predictor.predict(record)
+        for target in predictor.target_columns:
+            assert single[target] == pytest.approx(expected[target][i])
+            assert many[i][target] == pytest.approx(expected[target][i])
+
+    predictor.compile_inference()
+    try:
+        compiled = predictor.predict_many(records)
+    finally:
+        predictor._compiled = None
+    for i in range(len(records)):
+        for target in predictor.target_columns:
+            assert compiled[i][target] == pytest.approx(expected[target][i], rel=1e-6)
+
+def test_failed_incremental_update_leaves_models_untouched(water_module, monkeypatch):
+    predictor = water_module.WaterQualityPredictor()
+    predictor.train_models(water_module.create_sample_data(300))
+    scaler, models = predictor.scalers['main'], dict(predictor.models)
+    mean = scaler.mean_.copy()
+    thresholds = {target: model.estimators_[0].tree_.threshold.copy() for target, model in models.items()}
+
+    fits = []
+    original_fit = water_module.RandomForestRegressor.fit
+
+    def fail_second_fit(self, *args, **kwargs):
+        fits.append(self)
+        if len(fits) == 2:
+            raise RuntimeError('fit failed')
+        return original_fit(self, *args, **kwargs)
+
+    monkeypatch.setattr(water_module.RandomForestRegressor, 'fit', fail_second_fit)
+    with pytest.raises(RuntimeError):
+        predictor.train_models_incremental(water_module.create_sample_data(200))
+
+    assert predictor.scalers['main'] is scaler
+    np.testing.assert_array_equal(scaler.mean_, mean)
+    for target, model in models.items():
+        assert predictor.models[target] is model
+        np.testing.assert_array_equal(model.estimators_[0].tree_.threshold, thresholds[target])
+
+    monkeypatch.setattr(water_module.RandomForestRegressor, 'fit', original_fit)
+    result = predictor.train_models_incremental(water_module.create_sample_data(200), trees_per_update=5)
+
+    assert result['mode'] == 'incremental'
+    assert predictor.scalers['main'] is not scaler
+    assert all(len(predictor.models[t].estimators_) == len(models[t].estimators_) + 5 for t in models)